@@ -0,0 +1,52 @@
+"""Transfer Receipt Splitter - ZIP解凍&PDF分割エンジン"""
+from .engine import (
+    EXTRACT_DIRECT,
+    EXTRACT_INDIVIDUAL,
+    PARALLEL_MODES,
+    PARALLEL_PROCESS,
+    PARALLEL_SERIAL,
+    PARALLEL_THREAD,
+    PDF_AVAILABLE,
+    JobConfig,
+    JobResult,
+    SplitterEngine,
+    ZipResult,
+    collect_zip_files,
+    find_zip_files,
+    iter_collect_zip_files,
+    iter_zip_files,
+)
+from .dedup import PageIndex
+from .ledger import JobLedger
+from .logs import LogConfig, configure_logging
+from .pipeline import JobCancelled
+from .progress import ProgressChannel, ProgressSnapshot
+from .settings import SettingsStore
+from .strategies import SplitStrategy
+
+__all__ = [
+    'EXTRACT_DIRECT',
+    'EXTRACT_INDIVIDUAL',
+    'PARALLEL_MODES',
+    'PARALLEL_PROCESS',
+    'PARALLEL_SERIAL',
+    'PARALLEL_THREAD',
+    'PDF_AVAILABLE',
+    'JobCancelled',
+    'JobConfig',
+    'JobLedger',
+    'JobResult',
+    'LogConfig',
+    'PageIndex',
+    'ProgressChannel',
+    'ProgressSnapshot',
+    'SettingsStore',
+    'SplitStrategy',
+    'SplitterEngine',
+    'ZipResult',
+    'collect_zip_files',
+    'configure_logging',
+    'find_zip_files',
+    'iter_collect_zip_files',
+    'iter_zip_files',
+]
@@ -0,0 +1,329 @@
+"""ベンチマーク（合成ZIP/PDFコーパスの生成と各実行モードでの計測）
+
+外部サービスや実データを使わずにオフラインで実行できる。
+計測ケースごとに別プロセスで実行し、ピークメモリ（RSS）を独立して測る。
+"""
+import io
+import json
+import logging
+import multiprocessing
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from dataclasses import replace
+from pathlib import Path
+
+from .engine import EXTRACT_DIRECT, EXTRACT_INDIVIDUAL, PARALLEL_MODES, JobConfig, SplitterEngine, collect_zip_files
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# コーパスの種類ごとの生成パラメータ（scale で件数を増減）
+PROFILES = {
+    # 小さなZIPが大量にある（月末の銀行別ダウンロード）
+    'small_zips': dict(zips=200, pdfs_per_zip=2, pages=2),
+    # 数百ページの巨大PDFが少数
+    'huge_pdfs': dict(zips=2, pdfs_per_zip=1, pages=300, logo=True),
+    # スキャン画像を含むページ
+    'image_heavy': dict(zips=5, pdfs_per_zip=2, pages=5, image_px=1000),
+    # サブフォルダ・ZIP内ZIPを含む
+    'nested': dict(zips=10, pdfs_per_zip=2, pages=3, nested=True),
+    # 全ZIPが同じファイル名のメンバーを持つ（直接解凍時の名前衝突）
+    'collisions': dict(zips=20, pdfs_per_zip=2, pages=2, same_names=True),
+    # 全ページ共通のリソース辞書と非圧縮の埋め込みフォントを持つ（帳票ソフトの出力）
+    'shared_resources': dict(zips=3, pdfs_per_zip=1, pages=50, image_px=200, logo=True,
+                             shared_resources=True, font_kb=64),
+    # 数百MBのスキャン明細（省メモリ分割の確認用）
+    'huge_scans': dict(zips=2, pdfs_per_zip=1, pages=400, image_px=600),
+}
+
+
+def pdf_stream(data, extra=b""):
+    """FlateDecode圧縮したストリームオブジェクトを生成"""
+    compressed = zlib.compress(data)
+    return (b"<< /Length %d /Filter /FlateDecode " % len(compressed) + extra + b">>\nstream\n"
+            + compressed + b"\nendstream")
+
+
+def raw_stream(data, extra=b""):
+    """フィルターなし（非圧縮）のストリームオブジェクトを生成"""
+    return b"<< /Length %d " % len(data) + extra + b">>\nstream\n" + data + b"\nendstream"
+
+
+def build_pdf(pages, label="receipt", image_px=0, logo=False, seed=0, shared_resources=False, font_kb=0):
+    """合成PDF（振込受付票風のテキスト、任意で共有ロゴ・ページ固有のスキャン画像）を生成
+
+    shared_resources=True の場合は全ページの画像をまとめた1個のリソース辞書を全ページで共有し、
+    font_kb を指定すると非圧縮のフォントファイルを埋め込む。
+    """
+    rng = random.Random(seed)
+    objects = [None, None]
+    if font_kb:
+        # フォントプログラムを模した、圧縮の効きやすい非圧縮データ
+        glyphs = bytes(rng.randrange(32, 96) for _ in range(256))
+        objects.append(raw_stream(glyphs * (font_kb * 4), b"/Length1 %d " % (font_kb * 1024)))
+        objects.append(b"<< /Type /FontDescriptor /FontName /ReceiptSans /Flags 32 /FontBBox [0 -200 1000 900] "
+                       b"/ItalicAngle 0 /Ascent 900 /Descent -200 /CapHeight 700 /StemV 80 "
+                       b"/FontFile2 %d 0 R >>" % len(objects))
+        objects.append(b"<< /Type /Font /Subtype /TrueType /BaseFont /ReceiptSans /FirstChar 32 /LastChar 126 "
+                       b"/Widths [%s] /FontDescriptor %d 0 R >>" % (b" ".join([b"600"] * 95), len(objects)))
+    else:
+        objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    font_ref = len(objects)
+    logo_ref = None
+    if logo:
+        # 全ページで共有する画像（ロゴ）
+        objects.append(pdf_stream(bytes(rng.randrange(256) for _ in range(64 * 64)),
+                                  b"/Type /XObject /Subtype /Image /Width 64 /Height 64 "
+                                  b"/ColorSpace /DeviceGray /BitsPerComponent 8 "))
+        logo_ref = len(objects)
+
+    shared_xobjects = {}
+    shared_ref = None
+    if shared_resources:
+        # 中身はページ生成後に埋める
+        objects.append(None)
+        shared_ref = len(objects)
+
+    page_refs = []
+    for page_num in range(1, pages + 1):
+        xobjects = shared_xobjects if shared_resources else {}
+        content = (f"BT /F1 14 Tf 72 760 Td (TRANSFER RECEIPT) Tj ET\n"
+                   f"BT /F1 10 Tf 72 740 Td (Transaction No. {seed:06d}-{page_num:04d}) Tj ET\n"
+                   f"BT /F1 10 Tf 72 725 Td ({label} page {page_num}/{pages}) Tj ET\n")
+        if logo_ref:
+            xobjects['Logo'] = logo_ref
+            content += "q 64 0 0 64 480 720 cm /Logo Do Q\n"
+        if image_px:
+            # スキャン画像を模した圧縮の効きにくいグレースケール画像
+            objects.append(pdf_stream(rng.randbytes(image_px * image_px),
+                                      b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+                                      b"/ColorSpace /DeviceGray /BitsPerComponent 8 " % (image_px, image_px)))
+            scan_name = f"Scan{page_num}" if shared_resources else "Scan"
+            xobjects[scan_name] = len(objects)
+            content += f"q 468 0 0 468 72 200 cm /{scan_name} Do Q\n"
+
+        objects.append(pdf_stream(content.encode('ascii')))
+        content_ref = len(objects)
+        if shared_resources:
+            resources = f"{shared_ref} 0 R"
+        else:
+            xobject_dict = "".join(f"/{name} {ref} 0 R " for name, ref in xobjects.items())
+            resources = f"<< /Font << /F1 {font_ref} 0 R >> /XObject << {xobject_dict}>> >>"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources {resources} /Contents {content_ref} 0 R >>".encode('ascii'))
+        page_refs.append(len(objects))
+
+    if shared_resources:
+        xobject_dict = "".join(f"/{name} {ref} 0 R " for name, ref in shared_xobjects.items())
+        objects[shared_ref - 1] = f"<< /Font << /F1 {font_ref} 0 R >> /XObject << {xobject_dict}>> >>".encode('ascii')
+
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>".encode('ascii')
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+def generate_corpus(folder, profile, scale=1.0, seed=0):
+    """コーパスを生成し、生成したZIPファイルの一覧を返す"""
+    params = PROFILES[profile]
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    zip_count = max(1, int(params['zips'] * scale))
+    zip_files = []
+
+    for z in range(zip_count):
+        zip_path = folder / f"{profile}_{z:04d}.zip"
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for p in range(params['pdfs_per_zip']):
+                name = f"receipt_{p}.pdf" if params.get('same_names') else f"{profile}_{z:04d}_{p}.pdf"
+                data = build_pdf(params['pages'], label=name, image_px=params.get('image_px', 0),
+                                 logo=params.get('logo', False), seed=seed + z * 100 + p,
+                                 shared_resources=params.get('shared_resources', False),
+                                 font_kb=params.get('font_kb', 0))
+                zf.writestr(name, data)
+            zf.writestr("meisai.csv", f"zip,{z}\n")
+
+            if params.get('nested'):
+                nested_pdf = build_pdf(params['pages'], label="nested", seed=seed + z)
+                zf.writestr(f"2025/{z:02d}/detail/statement_{z}.pdf", nested_pdf)
+                inner = io.BytesIO()
+                with zipfile.ZipFile(inner, 'w', zipfile.ZIP_DEFLATED) as inner_zf:
+                    inner_zf.writestr(f"inner_{z}.pdf", nested_pdf)
+                zf.writestr(f"inner_{z}.zip", inner.getvalue())
+        zip_files.append(zip_path)
+
+    logger.info(f"コーパス生成: {profile} ({len(zip_files)}個のZIP) -> {folder}")
+    return zip_files
+
+
+def peak_rss_kb():
+    """(自プロセス, 終了済み子プロセス) のピークRSS（KB）。取得できない環境では None"""
+    if resource is None:
+        return None, None
+    # macOS はバイト単位、Linux はKB単位
+    divisor = 1024 if sys.platform == 'darwin' else 1
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // divisor,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // divisor)
+
+
+def run_case(config, zip_files, result_queue):
+    """計測ケース1件を実行（別プロセスで呼ばれる）"""
+    result = SplitterEngine(config).run(zip_files)
+    output_bytes = 0
+    for zip_result in result.zip_results:
+        for page in zip_result.split_files:
+            try:
+                output_bytes += page.stat().st_size
+            except OSError:
+                pass
+    rss_self, rss_children = peak_rss_kb()
+    result_queue.put({
+        'elapsed': result.elapsed,
+        'pages': result.split_count,
+        'errors': result.errors,
+        'members_skipped': sum(zip_result.members_skipped for zip_result in result.zip_results),
+        'output_bytes': output_bytes,
+        'bytes_saved': result.bytes_saved,
+        'image_bytes_saved': result.image_bytes_saved,
+        'stage_times': result.stage_times,
+        'peak_rss_kb': rss_self,
+        'peak_rss_workers_kb': rss_children,
+    })
+
+
+def run_isolated(config, zip_files):
+    """計測ケース1件を別プロセスで実行し、計測値を返す"""
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=run_case, args=(config, zip_files, result_queue))
+    process.start()
+    while True:
+        try:
+            stats = result_queue.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"計測プロセスが異常終了しました（終了コード: {process.exitcode}）")
+    process.join()
+    return stats
+
+
+def measure(config, corpus_dir, work_root, warm=False):
+    """コーパスを作業フォルダへコピーし、別プロセスで処理して計測値を返す
+
+    warm=True の場合は、同じ設定（上書きあり）で1回処理して解凍先に出力がある状態にしてから計測する。
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="case_", dir=work_root))
+    try:
+        for zip_file in collect_zip_files([corpus_dir]):
+            shutil.copy2(zip_file, work_dir / zip_file.name)
+        zip_files = collect_zip_files([work_dir])
+        input_bytes = sum(zip_file.stat().st_size for zip_file in zip_files)
+        if warm:
+            run_isolated(replace(config, overwrite=True, rename=replace(
+                config.rename, cache_dir=work_dir / ".rename-cache-warmup")), zip_files)
+        # リネーム結果のキャッシュはケースごとに空から始める
+        config = replace(config, rename=replace(config.rename, cache_dir=work_dir / ".rename-cache"))
+        stats = run_isolated(config, zip_files)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = max(stats['elapsed'], 1e-9)
+    stats.update({
+        'zips': len(zip_files),
+        'input_bytes': input_bytes,
+        'pages_per_sec': round(stats['pages'] / elapsed, 2),
+        'mb_per_sec': round(input_bytes / MB / elapsed, 2),
+        'elapsed': round(stats['elapsed'], 3),
+        'stage_times': {stage: round(seconds, 3) for stage, seconds in stats['stage_times'].items()},
+    })
+    return stats
+
+
+def run_benchmarks(profiles=None, modes=PARALLEL_MODES, overwrite_modes=(True, False),
+                   base_config=None, scale=1.0, corpus_root=None, seed=0):
+    """各コーパス×並列実行モード×上書きモードで計測し、JSONレポート用の辞書を返す
+
+    上書きしないケースは、解凍先に前回の出力がある状態（2回目の実行）で計測する。
+    個別フォルダは解凍前に作り直して既存のファイルが残らないため、上書きしないケースは直接解凍で計測する。
+    """
+    profiles = list(profiles or PROFILES)
+    base_config = base_config or JobConfig()
+    temp_root = Path(tempfile.mkdtemp(prefix="receipt-splitter-bench-"))
+    corpus_root = Path(corpus_root) if corpus_root else temp_root / "corpus"
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scale': scale,
+        'max_workers': base_config.max_workers,
+        'cases': [],
+    }
+
+    try:
+        for profile in profiles:
+            corpus_dir = corpus_root / profile
+            if not (corpus_dir.exists() and collect_zip_files([corpus_dir])):
+                # 生成時のメモリ使用量が計測プロセスのピークRSSに引き継がれないよう別プロセスで生成
+                process = multiprocessing.get_context('spawn').Process(
+                    target=generate_corpus, args=(corpus_dir, profile, scale, seed))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f"コーパス生成に失敗しました: {profile}（終了コード: {process.exitcode}）")
+
+            for mode in modes:
+                for overwrite in overwrite_modes:
+                    config = replace(base_config, parallelism=mode, overwrite=overwrite, output_dir=None)
+                    if not overwrite and config.extract_option == EXTRACT_INDIVIDUAL:
+                        config = replace(config, extract_option=EXTRACT_DIRECT)
+                    logger.info(f"計測: {profile} / {mode} / overwrite={overwrite}")
+                    stats = measure(config, corpus_dir, temp_root, warm=not overwrite)
+                    report['cases'].append({
+                        'profile': profile,
+                        'parallelism': mode,
+                        'overwrite': overwrite,
+                        'warm': not overwrite,
+                        'extract_option': config.extract_option,
+                        'stream_pdfs': config.stream_pdfs,
+                        'optimize_resources': config.optimize_resources,
+                        'compact_images': config.compact_images,
+                        'image_dpi': config.image_dpi,
+                        'low_memory': config.low_memory,
+                        'ocr_rename': config.ocr_rename,
+                        **stats,
+                    })
+    finally:
+        shutil.rmtree(temp_root, ignore_errors=True)
+
+    return report
+
+
+def write_report(report, path=None):
+    """JSONレポートを出力（path 省略時は標準出力）"""
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if path:
+        Path(path).write_text(text + "\n", encoding='utf-8')
+    else:
+        print(text)
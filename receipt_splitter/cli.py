@@ -0,0 +1,559 @@
+"""transfer-receipt-splitter コマンドラインインターフェース（GUI不要）"""
+import argparse
+import json
+import logging
+import signal
+import time
+import zipfile
+from contextlib import contextmanager
+from dataclasses import replace
+from pathlib import Path
+
+from .engine import (
+    DEFAULT_EXTRACT_WORKERS,
+    DEFAULT_JPEG_QUALITY,
+    EXTRACT_DIRECT,
+    EXTRACT_INDIVIDUAL,
+    MB,
+    PARALLEL_MODES,
+    JobConfig,
+    SplitterEngine,
+    collect_zip_files,
+    iter_collect_zip_files,
+)
+from .bench import PROFILES, run_benchmarks, write_report
+from .dedup import DEDUP_MODES, DEDUP_OFF, PageIndex, default_index_path
+from .jobqueue import JobQueue
+from .ledger import JobLedger, default_ledger_path
+from .logs import LOG_FORMATS, LogConfig, configure_logging
+from .metrics import PipelineMetrics
+from .rename import NAMING_BACKENDS, OCR_BACKENDS
+from .service import LocalQueueClient, QueueWorker, RemoteQueueClient, ServiceConfig, SplitterService
+from .sinks import SINK_MODES
+from .strategies import STRATEGY_MODES
+from .watch import DEFAULT_INTERVAL, DEFAULT_QUEUE_SIZE, DEFAULT_SETTLE, FolderWatcher
+
+PROG = "transfer-receipt-splitter"
+
+
+def setup_cli_logging(verbosity, log_file=None, log_format=None):
+    """CLI用ログ設定（標準出力はサマリー専用のため標準エラーへ出力）"""
+    level = logging.WARNING if verbosity < 0 else logging.DEBUG if verbosity > 0 else logging.INFO
+    configure_logging(LogConfig.from_env(level=level, log_file=log_file, log_format=log_format))
+
+
+def load_env():
+    """.envファイルがあれば読み込む（python-dotenv は任意）"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog=PROG, description="ZIP解凍&PDF分割ツール")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # 全サブコマンド共通のオプション
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-v', '--verbose', action='count', default=0, help="詳細ログを出力")
+    common.add_argument('-q', '--quiet', action='store_true', help="警告以上のログのみ出力")
+    common.add_argument('--log-file', type=Path, help="ログファイル（サイズでローテーション、既定: LOG_FILE）")
+    common.add_argument('--log-format', choices=LOG_FORMATS, help="ログ形式（json: JSON Lines、既定: text）")
+
+    run_parser = subparsers.add_parser('run', parents=[common], help="ZIPファイルを解凍してPDFを分割")
+    run_parser.add_argument('paths', nargs='+', help="フォルダ・ZIPファイル・globパターン")
+    add_job_arguments(run_parser)
+    run_parser.add_argument('--summary', type=Path, help="JSONサマリーの出力先ファイル（省略時は標準出力）")
+    add_metrics_arguments(run_parser)
+    run_parser.set_defaults(func=command_run)
+
+    plan_parser = subparsers.add_parser('plan', parents=[common],
+                                        help="解凍せずに、書き込む・スキップするメンバー数とバイト数を見積もる")
+    plan_parser.add_argument('paths', nargs='+', help="フォルダ・ZIPファイル・globパターン")
+    add_job_arguments(plan_parser)
+    plan_parser.add_argument('--summary', type=Path, help="JSONの出力先ファイル（省略時は標準出力）")
+    plan_parser.set_defaults(func=command_plan)
+
+    preflight_parser = subparsers.add_parser('preflight', parents=[common],
+                                             help="解凍せずにZIP・PDFを検査する（CRC・メンバーのパス・PDFの暗号化・ページ数）")
+    preflight_parser.add_argument('paths', nargs='+', help="フォルダ・ZIPファイル・globパターン")
+    add_job_arguments(preflight_parser)
+    preflight_parser.add_argument('--summary', type=Path, help="JSONの出力先ファイル（省略時は標準出力）")
+    preflight_parser.set_defaults(func=command_preflight)
+
+    resume_parser = subparsers.add_parser('resume', parents=[common],
+                                          help="中断したジョブを未完了のZIP・PDFから再開")
+    resume_parser.add_argument('job_id', nargs='?', type=int,
+                               help="再開するジョブID（省略時は最後に開始した未完了のジョブ）")
+    resume_parser.add_argument('--ledger', type=Path, help="ジョブ台帳のファイル（既定: JOB_LEDGER_PATH）")
+    resume_parser.add_argument('--list', action='store_true', help="再開せずにジョブの一覧を出力")
+    resume_parser.add_argument('-j', '--workers', type=int, help="並列処理数（既定: 中断したジョブと同じ）")
+    resume_parser.add_argument('--parallelism', choices=PARALLEL_MODES, help="並列実行モード（既定: 中断したジョブと同じ）")
+    resume_parser.add_argument('--summary', type=Path, help="JSONサマリーの出力先ファイル（省略時は標準出力）")
+    add_metrics_arguments(resume_parser)
+    resume_parser.set_defaults(func=command_resume)
+
+    duplicates_parser = subparsers.add_parser('duplicates', parents=[common],
+                                              help="重複検出で見つかった重複ページを実行ごとに出力")
+    duplicates_parser.add_argument('run_id', nargs='?',
+                                   help="実行ID（ジョブID、省略時は最後に重複を検出した実行）")
+    duplicates_parser.add_argument('--index', type=Path, help="ページ索引のファイル（既定: DEDUP_INDEX）")
+    duplicates_parser.add_argument('--runs', action='store_true', help="重複を検出した実行の一覧を出力")
+    duplicates_parser.add_argument('--summary', type=Path, help="JSONの出力先ファイル（省略時は標準出力）")
+    duplicates_parser.set_defaults(func=command_duplicates)
+
+    watch_parser = subparsers.add_parser('watch', parents=[common],
+                                         help="フォルダを監視し、ダウンロード完了したZIPを自動処理")
+    watch_parser.add_argument('folder', type=Path, help="監視するフォルダ")
+    add_job_arguments(watch_parser)
+    watch_parser.add_argument('--jobs', type=int, default=1, help="同時に処理するZIPの数（既定: 1）")
+    watch_parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                              help=f"処理待ちキューの上限（既定: {DEFAULT_QUEUE_SIZE}）")
+    watch_parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                              help=f"フォルダ確認間隔・秒（既定: {DEFAULT_INTERVAL}）")
+    watch_parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                              help=f"書き込み完了とみなすまでの待ち時間・秒（既定: {DEFAULT_SETTLE}）")
+    add_metrics_arguments(watch_parser)
+    watch_parser.set_defaults(func=command_watch)
+
+    serve_parser = subparsers.add_parser('serve', parents=[common],
+                                         help="HTTP API でZIPを受け付け、共有ジョブキューから処理するサービスを起動")
+    add_job_arguments(serve_parser)
+    serve_parser.add_argument('--host', help="待ち受けるアドレス（既定: 127.0.0.1）")
+    serve_parser.add_argument('--port', type=int, help="待ち受けるポート（既定: 8765）")
+    serve_parser.add_argument('--root', type=Path, help="キュー・アップロード・出力の作業フォルダ")
+    serve_parser.add_argument('--queue-workers', type=int,
+                              help="サービス内でジョブを処理するワーカーの数（0 は受け付けのみ、既定: 1）")
+    serve_parser.add_argument('--token', help="API に要求するトークン（Authorization: Bearer）")
+    serve_parser.set_defaults(func=command_serve)
+
+    worker_parser = subparsers.add_parser('worker', parents=[common],
+                                          help="サービスのジョブキューからジョブを取り出して処理するワーカーを起動")
+    add_job_arguments(worker_parser)
+    worker_target = worker_parser.add_mutually_exclusive_group()
+    worker_target.add_argument('--server', help="別のホストのサービスの URL（例: http://192.168.0.10:8765）")
+    worker_target.add_argument('--root', type=Path, help="同じマシンのサービスの作業フォルダ（キューを直接開く）")
+    worker_parser.add_argument('--name', help="ワーカー名（既定: ホスト名・プロセスID）")
+    worker_parser.add_argument('--token', help="サービスの API トークン")
+    worker_parser.set_defaults(func=command_worker)
+
+    bench_parser = subparsers.add_parser('bench', parents=[common],
+                                         help="合成コーパスで各実行モードの処理性能を計測")
+    bench_parser.add_argument('--profile', dest='profiles', action='append', choices=sorted(PROFILES),
+                              help="計測するコーパス（複数指定可、省略時はすべて）")
+    bench_parser.add_argument('--scale', type=float, default=1.0, help="コーパスの件数倍率（既定: 1.0）")
+    bench_parser.add_argument('--modes', nargs='+', choices=PARALLEL_MODES, default=list(PARALLEL_MODES),
+                              help="計測する並列実行モード")
+    bench_parser.add_argument('--overwrite-modes', choices=['both', 'on', 'off'], default='both',
+                              help="計測する上書きモード（既定: both）")
+    bench_parser.add_argument('--corpus', type=Path, help="コーパスの保存先（既存のコーパスがあれば再利用）")
+    bench_parser.add_argument('-j', '--workers', type=int, help="並列処理数（既定: CPUコア数）")
+    bench_parser.add_argument('--extract-option', type=int, choices=[EXTRACT_INDIVIDUAL, EXTRACT_DIRECT],
+                              help="1: 個別フォルダ作成, 2: 直接解凍")
+    bench_parser.add_argument('--stream', dest='stream_pdfs', action=argparse.BooleanOptionalAction,
+                              default=None, help="ストリーム分割で計測する")
+    bench_parser.add_argument('--optimize-resources', action=argparse.BooleanOptionalAction, default=None,
+                              help="共有リソース最適化を有効にして計測する")
+    bench_parser.add_argument('--low-memory', action=argparse.BooleanOptionalAction, default=None,
+                              help="省メモリ分割で計測する")
+    bench_parser.add_argument('--compact-images', action=argparse.BooleanOptionalAction, default=None,
+                              help="画像圧縮を有効にして計測する")
+    bench_parser.add_argument('--image-dpi', type=int, help="画像圧縮で縮小する解像度（0: 縮小しない）")
+    bench_parser.add_argument('--ocr-rename', action='store_true',
+                              help="OCR&AI自動リネームを含めて計測する（スタブバックエンドを使用）")
+    bench_parser.add_argument('--stub-latency', type=float, default=0.0,
+                              help="スタブバックエンドの1リクエストあたりの擬似的な待ち時間（秒）")
+    bench_parser.add_argument('--output', type=Path, help="JSONレポートの出力先（省略時は標準出力）")
+    bench_parser.add_argument('--seed', type=int, default=0, help="コーパス生成の乱数シード")
+    bench_parser.set_defaults(func=command_bench)
+
+    return parser
+
+
+def add_job_arguments(parser):
+    """ジョブ設定のオプションを追加（未指定は .env の値を使用）"""
+    parser.add_argument('-j', '--workers', type=int, help="並列処理数（既定: CPUコア数）")
+    parser.add_argument('--parallelism', choices=PARALLEL_MODES, help="並列実行モード（既定: process）")
+    parser.add_argument('--extract-option', type=int, choices=[EXTRACT_INDIVIDUAL, EXTRACT_DIRECT],
+                        help="1: 個別フォルダ作成, 2: 直接解凍")
+    parser.add_argument('--overwrite', action=argparse.BooleanOptionalAction, default=None,
+                        help="既存ファイルを上書きする")
+    parser.add_argument('--split', dest='split_pdf', action=argparse.BooleanOptionalAction, default=None,
+                        help="PDFファイルを1ページずつ分割する")
+    parser.add_argument('-o', '--output-dir', type=Path, help="解凍先フォルダ（省略時はZIPと同じフォルダ）")
+    parser.add_argument('--stream', dest='stream_pdfs', action=argparse.BooleanOptionalAction, default=None,
+                        help="PDFをディスクに解凍せずZIPから直接分割する")
+    parser.add_argument('--incremental', action=argparse.BooleanOptionalAction, default=None,
+                        help="前回から変更のないZIPをスキップする（出力フォルダのマニフェストを使用）")
+    parser.add_argument('--optimize-resources', action=argparse.BooleanOptionalAction, default=None,
+                        help="分割ページから未使用のフォント・画像を除去し、非圧縮のストリームを圧縮する")
+    parser.add_argument('--compact-images', action=argparse.BooleanOptionalAction, default=None,
+                        help="分割ページの画像を可逆圧縮し直し、--image-dpi を超える画像は縮小する")
+    parser.add_argument('--image-dpi', type=int,
+                        help="画像圧縮で縮小する解像度（0: 縮小しない、既定: 0。Pillow が必要）")
+    parser.add_argument('--jpeg-quality', type=int,
+                        help=f"縮小した画像の JPEG 品質（1〜95、既定: {DEFAULT_JPEG_QUALITY}）")
+    parser.add_argument('--low-memory', action=argparse.BooleanOptionalAction, default=None,
+                        help="ページウィンドウ単位でPDFを読み直し、巨大PDFのメモリ使用量を抑える")
+    parser.add_argument('--page-window', type=int, help="省メモリ分割で1個のリーダーが扱うページ数（既定: 50）")
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help="同時に分割するPDFの合計サイズの上限（MB、既定: 無制限）")
+    parser.add_argument('--extract-workers', type=int,
+                        help=f"並列処理で同時に解凍するZIPの数（既定: {DEFAULT_EXTRACT_WORKERS}）")
+    parser.add_argument('--write-workers', type=int,
+                        help="PDF1個あたりの分割ページ書き込みスレッド数（0: 分割と同じスレッド、既定: 1）")
+    parser.add_argument('--split-queue', dest='split_queue_size', type=int,
+                        help="分割待ちのPDFの上限。超える間は次のZIPを解凍しない（既定: 並列処理数の2倍）")
+    parser.add_argument('--dedup', choices=DEDUP_MODES,
+                        help="以前の実行を含めて重複したページの扱い（report: 記録のみ, skip: 出力しない, "
+                             "link: 既存ページへのハードリンク、既定: off）")
+    parser.add_argument('--dedup-index', type=Path, help="重複検出のページ索引のファイル")
+    parser.add_argument('--preflight', action=argparse.BooleanOptionalAction, default=None,
+                        help="解凍前にZIP・PDFを並列で検査し、エラーのあるZIPは解凍せずに除外する")
+    parser.add_argument('--recursive', '-r', action=argparse.BooleanOptionalAction, default=None,
+                        help="サブフォルダのZIP、ZIP内のサブフォルダ・入れ子のZIPのPDFも処理する")
+    parser.add_argument('--max-depth', type=int, help="サブフォルダ・入れ子のZIPをたどる深さの上限（既定: 3）")
+    parser.add_argument('--nested-max-mb', type=float, metavar='MB',
+                        help="展開する入れ子のZIP1個のサイズの上限（既定: 512）")
+    parser.add_argument('--sink', dest='output_sink', choices=SINK_MODES,
+                        help="分割ページの出力先（files: ページごとのファイル, zip・tar: 元のZIPごとに1個のアーカイブ、"
+                             "既定: files）")
+    parser.add_argument('--split-strategy', choices=STRATEGY_MODES,
+                        help="分割方法（page: 1ページずつ, fixed: Nページごと, ranges: ページ範囲ごと, "
+                             "pattern: ページのテキストから明細の区切りを検出、既定: page）")
+    parser.add_argument('--split-pages', type=int, help="fixed: 1ファイルあたりのページ数")
+    parser.add_argument('--split-ranges', help="ranges: ページ範囲（例: 1-2,3,5- 。範囲外のページは1ページずつ）")
+    parser.add_argument('--split-pattern', help="pattern: 区切りとみなすテキストの正規表現（既定: 取引番号・受付番号）")
+    parser.add_argument('--text-cache', type=Path, help="ページのテキストのキャッシュのファイル")
+    parser.add_argument('--ocr-rename', action=argparse.BooleanOptionalAction, default=None,
+                        help="分割したページをOCRし、内容に応じたファイル名に付け替える")
+    parser.add_argument('--ocr-backend', choices=sorted(OCR_BACKENDS), help="OCRバックエンド（既定: vision）")
+    parser.add_argument('--llm-backend', dest='naming_backend', choices=sorted(NAMING_BACKENDS),
+                        help="命名バックエンド（既定: openai）")
+    parser.add_argument('--rename-cache', type=Path, help="OCR・命名結果のキャッシュフォルダ")
+
+
+def add_metrics_arguments(parser):
+    """メトリクス出力のオプションを追加"""
+    parser.add_argument('--metrics-json', type=Path, help="メトリクスのJSONレポート出力先")
+    parser.add_argument('--metrics-prom', type=Path,
+                        help="Prometheus textfile collector 用ファイルの出力先（*.prom）")
+
+
+def export_metrics(metrics, args):
+    """指定されたメトリクス出力先へ書き込む"""
+    try:
+        if args.metrics_json:
+            metrics.registry.write_json(args.metrics_json)
+        if args.metrics_prom:
+            metrics.registry.write_prometheus(args.metrics_prom)
+    except OSError as e:
+        logging.getLogger(__name__).error(f"メトリクス出力エラー: {e}")
+
+
+def job_config_from_args(args):
+    """コマンドライン引数からジョブ設定を生成"""
+    config = JobConfig.from_env(
+        extract_option=args.extract_option,
+        overwrite=args.overwrite,
+        split_pdf=args.split_pdf,
+        max_workers=args.workers,
+        parallelism=args.parallelism,
+        output_dir=args.output_dir,
+        stream_pdfs=args.stream_pdfs,
+        incremental=args.incremental,
+        optimize_resources=args.optimize_resources,
+        compact_images=args.compact_images,
+        image_dpi=args.image_dpi,
+        jpeg_quality=args.jpeg_quality,
+        low_memory=args.low_memory,
+        page_window=args.page_window,
+        memory_budget=int(args.memory_budget * MB) if args.memory_budget is not None else None,
+        extract_workers=args.extract_workers,
+        write_workers=args.write_workers,
+        split_queue_size=args.split_queue_size,
+        ocr_rename=args.ocr_rename,
+        dedup=args.dedup,
+        dedup_index=args.dedup_index,
+        output_sink=args.output_sink,
+        preflight=args.preflight,
+        recursive=args.recursive,
+        max_depth=args.max_depth,
+        nested_limit=int(args.nested_max_mb * MB) if args.nested_max_mb is not None else None,
+    )
+    rename_overrides = {
+        'ocr_backend': args.ocr_backend,
+        'naming_backend': args.naming_backend,
+        'cache_dir': args.rename_cache,
+    }
+    config.rename = replace(config.rename, **{key: value for key, value in rename_overrides.items()
+                                              if value is not None})
+    strategy_overrides = {
+        'mode': args.split_strategy,
+        'pages_per_file': args.split_pages,
+        'ranges': args.split_ranges,
+        'pattern': args.split_pattern,
+        'text_cache': args.text_cache,
+    }
+    try:
+        config.strategy = replace(config.strategy, **{key: value for key, value in strategy_overrides.items()
+                                                      if value is not None})
+    except ValueError as e:
+        raise SystemExit(f"{PROG}: 分割方法の設定エラー: {e}")
+    return config
+
+
+def write_summary(summary, summary_path=None):
+    """機械可読なJSONサマリーを出力"""
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if summary_path:
+        summary_path.write_text(text + "\n", encoding='utf-8')
+    else:
+        print(text)
+
+
+@contextmanager
+def cancel_on_signal(engine):
+    """Ctrl+C・SIGTERM で処理を中止する（再開できる状態で終了し、2回目の Ctrl+C で強制終了）"""
+    def handle(signum, frame):
+        if engine.cancelled:
+            raise KeyboardInterrupt
+        logging.getLogger(__name__).warning("中止します（実行中のページの書き込みを待っています。強制終了はもう一度 Ctrl+C）")
+        engine.cancel()
+
+    previous = {signum: signal.signal(signum, handle) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        yield engine
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+def exit_code(result):
+    """終了コード（中止: 130, エラーあり: 1）"""
+    if result.cancelled:
+        return 130
+    return 0 if not result.errors else 1
+
+
+def find_args_zip_files(args, config):
+    """コマンドラインで指定されたZIPファイル（サブフォルダの探索は設定に従う）"""
+    return collect_zip_files(args.paths, config.recursive, config.max_depth)
+
+
+def command_run(args):
+    config = job_config_from_args(args)
+    metrics = PipelineMetrics()
+    with cancel_on_signal(SplitterEngine(config, metrics=metrics)) as engine:
+        if config.recursive:
+            # サブフォルダを探索しながら、見つかったZIPから処理する
+            result = engine.run_discovered(iter_collect_zip_files(args.paths, True, config.max_depth))
+            if not result.zip_results and not result.cancelled:
+                logging.getLogger(__name__).warning("ZIPファイルが見つかりませんでした。")
+        else:
+            zip_files = collect_zip_files(args.paths)
+            if not zip_files:
+                logging.getLogger(__name__).warning("ZIPファイルが見つかりませんでした。")
+            result = engine.run(zip_files)
+    write_summary(result.to_dict(), args.summary)
+    export_metrics(metrics, args)
+    return exit_code(result)
+
+
+def command_plan(args):
+    config = job_config_from_args(args)
+    engine = SplitterEngine(config)
+    start = time.perf_counter()
+    plans = []
+    for zip_file in find_args_zip_files(args, config):
+        try:
+            plans.append(engine.plan_zip(zip_file))
+        except (OSError, zipfile.BadZipFile) as e:
+            plans.append({'zip_file': str(zip_file), 'error': str(e)})
+    summary = {
+        'zip_count': len(plans),
+        'write_count': sum(plan.get('write_count', 0) for plan in plans),
+        'skip_count': sum(plan.get('skip_count', 0) for plan in plans),
+        'bytes_to_write': sum(plan.get('bytes_to_write', 0) for plan in plans),
+        'bytes_skipped': sum(plan.get('bytes_skipped', 0) for plan in plans),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        'zips': plans,
+    }
+    write_summary(summary, args.summary)
+    return 0 if not any('error' in plan for plan in plans) else 1
+
+
+def command_preflight(args):
+    config = job_config_from_args(args)
+    engine = SplitterEngine(config)
+    start = time.perf_counter()
+    zip_files = find_args_zip_files(args, config)
+    with cancel_on_signal(engine):
+        checks = engine.preflight(zip_files)
+    results = [checks[zip_file].to_dict() for zip_file in zip_files if zip_file in checks]
+    summary = {
+        'zip_count': len(results),
+        'error_count': sum(1 for result in results if not result['ok']),
+        'pdf_count': sum(result['pdf_count'] for result in results),
+        'page_count': sum(result['page_count'] or 0 for result in results),
+        'bytes_uncompressed': sum(result['bytes_uncompressed'] for result in results),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        'zips': results,
+    }
+    write_summary(summary, args.summary)
+    if engine.cancelled:
+        return 130
+    return 0 if not summary['error_count'] else 1
+
+
+def command_resume(args):
+    log = logging.getLogger(__name__)
+    ledger_path = args.ledger or JobConfig.from_env().ledger_path or default_ledger_path()
+    if not ledger_path.exists():
+        log.error(f"ジョブ台帳がありません: {ledger_path}")
+        return 2
+
+    with JobLedger(ledger_path) as ledger:
+        if args.list:
+            write_summary([job.to_dict() for job in ledger.list_jobs()], args.summary)
+            return 0
+        job = ledger.get_job(args.job_id) if args.job_id is not None else ledger.latest_unfinished()
+    if job is None:
+        log.error(f"再開できるジョブがありません: {args.job_id if args.job_id is not None else ledger_path}")
+        return 2
+
+    # 中断したジョブの設定で再開（並列処理数・並列実行モードのみ変更可能）
+    config = replace(JobConfig.from_dict(job.config), ledger_path=ledger_path)
+    if args.workers is not None:
+        config = replace(config, max_workers=args.workers)
+    if args.parallelism is not None:
+        config = replace(config, parallelism=args.parallelism)
+
+    metrics = PipelineMetrics()
+    with cancel_on_signal(SplitterEngine(config, metrics=metrics)) as engine:
+        result = engine.resume(job.id)
+    write_summary(result.to_dict(), args.summary)
+    export_metrics(metrics, args)
+    return exit_code(result)
+
+
+def command_duplicates(args):
+    log = logging.getLogger(__name__)
+    index_path = args.index or JobConfig.from_env().dedup_index or default_index_path()
+    if not index_path.exists():
+        log.error(f"ページ索引がありません: {index_path}")
+        return 2
+
+    with PageIndex(index_path) as index:
+        if args.runs:
+            write_summary(index.runs(), args.summary)
+            return 0
+        run_id = args.run_id
+        if run_id is None:
+            runs = index.runs(limit=1)
+            if not runs:
+                log.warning("重複ページは記録されていません")
+                write_summary({'run_id': None, 'duplicate_count': 0, 'duplicates': []}, args.summary)
+                return 0
+            run_id = runs[0]['run_id']
+        duplicates = index.duplicates(run_id)
+    write_summary({'run_id': run_id, 'duplicate_count': len(duplicates), 'duplicates': duplicates}, args.summary)
+    return 0
+
+
+def command_watch(args):
+    if not args.folder.is_dir():
+        logging.getLogger(__name__).error(f"フォルダが存在しません: {args.folder}")
+        return 2
+
+    metrics = PipelineMetrics()
+
+    def print_result(result):
+        # 処理したZIPごとに1行のJSONを出力
+        for zip_result in result.zip_results:
+            print(json.dumps(zip_result.to_dict(), ensure_ascii=False), flush=True)
+        export_metrics(metrics, args)
+
+    watcher = FolderWatcher(args.folder, job_config_from_args(args), jobs=args.jobs,
+                            queue_size=args.queue_size, interval=args.interval,
+                            settle=args.settle, on_result=print_result, metrics=metrics)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop_event.set())
+    try:
+        watcher.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def command_serve(args):
+    config = ServiceConfig.from_env(host=args.host, port=args.port, root=args.root,
+                                    workers=args.queue_workers, token=args.token)
+    try:
+        service = SplitterService(config, job_config_from_args(args))
+    except OSError as e:
+        logging.getLogger(__name__).error(f"サービスを起動できません: {e}")
+        return 2
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.shutdown())
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def command_worker(args):
+    config = ServiceConfig.from_env(root=args.root, token=args.token)
+    if args.server:
+        client = RemoteQueueClient(args.server, config.token)
+    else:
+        client = LocalQueueClient(JobQueue(config.queue_path))
+    worker = QueueWorker(client, job_config_from_args(args), name=args.name, lease=config.lease,
+                         remote=bool(args.server))
+
+    def handle(signum, frame):
+        if worker.stop_event.is_set():
+            raise KeyboardInterrupt
+        logging.getLogger(__name__).warning("停止します（処理中のジョブは中止してキューに戻します。強制終了はもう一度 Ctrl+C）")
+        worker.stop(wait=False)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, handle)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def command_bench(args):
+    overwrite_modes = {'both': (True, False), 'on': (True,), 'off': (False,)}[args.overwrite_modes]
+    base_config = JobConfig.from_env(
+        max_workers=args.workers,
+        extract_option=args.extract_option,
+        stream_pdfs=args.stream_pdfs,
+        optimize_resources=args.optimize_resources,
+        compact_images=args.compact_images,
+        image_dpi=args.image_dpi,
+        low_memory=args.low_memory,
+        ocr_rename=args.ocr_rename,
+        incremental=False,
+    )
+    base_config.rename = replace(base_config.rename, ocr_backend='stub', naming_backend='stub',
+                                 stub_latency=args.stub_latency)
+    base_config.ledger_path = None  # 計測ケースはジョブ台帳に記録しない
+    base_config.dedup = DEDUP_OFF  # 同じコーパスを繰り返し処理するため重複検出はしない
+    report = run_benchmarks(profiles=args.profiles, modes=args.modes, overwrite_modes=overwrite_modes,
+                            base_config=base_config, scale=args.scale, corpus_root=args.corpus,
+                            seed=args.seed)
+    write_report(report, args.output)
+    return 0 if not any(case['errors'] for case in report['cases']) else 1
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    load_env()
+    setup_cli_logging(-1 if args.quiet else args.verbose, args.log_file, args.log_format)
+    return args.func(args)
@@ -0,0 +1,186 @@
+"""分割ページの重複検出（バッチをまたいで永続化するページのフィンガープリント索引）"""
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from .ledger import now_text, path_key
+from .logs import PER_PAGE
+from .paths import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "pages.sqlite3"
+INDEX_VERSION = 1
+
+# 重複ページの扱い
+DEDUP_OFF = 'off'        # 検出しない
+DEDUP_REPORT = 'report'  # 検出して記録するだけ（ページはそのまま出力）
+DEDUP_SKIP = 'skip'      # 重複ページを出力しない
+DEDUP_LINK = 'link'      # 重複ページを既存ページへのハードリンクにする
+DEDUP_MODES = (DEDUP_OFF, DEDUP_REPORT, DEDUP_SKIP, DEDUP_LINK)
+
+# 重複の種類
+MATCH_EXACT = 'exact'      # 出力したPDFのバイト列が一致
+MATCH_CONTENT = 'content'  # 描画内容（コンテンツ・画像）が一致
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    fingerprint BLOB PRIMARY KEY,
+    sha256 BLOB NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    first_seen TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS duplicates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    found_at TEXT NOT NULL,
+    zip_file TEXT,
+    path TEXT NOT NULL,
+    original TEXT NOT NULL,
+    match TEXT NOT NULL,
+    action TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS duplicates_run ON duplicates (run_id);
+"""
+
+
+def default_index_path():
+    """既定のページ索引ファイル"""
+    return default_cache_dir() / INDEX_NAME
+
+
+def new_run_id():
+    """ジョブ台帳を使わない場合の実行ID"""
+    return datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+
+
+def hardlink_replace(original, path):
+    """path を original へのハードリンクに置き換える"""
+    tmp_path = path.with_name(f".{path.name}.link.tmp")
+    os.link(original, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class PageIndex:
+    """分割ページのフィンガープリント索引
+
+    描画内容のフィンガープリントを主キーとする SQLite の表（B-tree）で、
+    ページ数が数十万になっても1ページあたり1回の索引検索で重複を判定する。
+    登録・判定は処理結果を集計するスレッド（親プロセス）からのみ行うため、同じ実行の中の重複も検出できる。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, INDEX_VERSION):
+            raise sqlite3.DatabaseError(f"未対応のページ索引のバージョンです: {version}")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f"PRAGMA user_version={INDEX_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def resolve(self, run_id, zip_file, pages, fingerprints, mode):
+        """分割したページを索引と照合し、(残すページ, 重複の一覧) を返す
+
+        既存のページと重複したページは mode に従って削除（skip）またはハードリンクに置き換え（link）る。
+        索引のページが削除・リネームされている場合は重複とみなさず、新しいページで索引を更新する。
+        fingerprints は pages と同じ順の (描画内容のフィンガープリント, SHA-256) の一覧。
+        """
+        kept = []
+        duplicates = []
+        timestamp = now_text()
+        with self.conn:
+            for page, (fingerprint, sha256) in zip(pages, fingerprints):
+                page_key = path_key(page)
+                row = self.conn.execute("SELECT sha256, path FROM pages WHERE fingerprint = ?",
+                                        (fingerprint,)).fetchone()
+                if row is None or row[1] == page_key or not os.path.exists(row[1]):
+                    self.conn.execute(
+                        "INSERT INTO pages (fingerprint, sha256, path, size, first_seen) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (fingerprint) DO UPDATE SET sha256 = excluded.sha256, path = excluded.path, "
+                        "size = excluded.size",
+                        (fingerprint, sha256, page_key, page.stat().st_size, timestamp))
+                    kept.append(page)
+                    continue
+
+                original = row[1]
+                match = MATCH_EXACT if row[0] == sha256 else MATCH_CONTENT
+                action = self.apply(mode, page, original)
+                if action != DEDUP_SKIP:
+                    kept.append(page)
+                self.conn.execute(
+                    "INSERT INTO duplicates (run_id, found_at, zip_file, path, original, match, action) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, timestamp, path_key(zip_file), page_key, original, match, action))
+                duplicates.append({'path': page_key, 'original': original, 'match': match, 'action': action})
+        return kept, duplicates
+
+    def rename(self, moves):
+        """リネームしたページ（(元のパス, 新しいパス) の一覧）の索引・重複の記録のパスを付け替える
+
+        出力し直したページが元のページと同じ名前になった場合（再実行時）は、その重複の記録を削除する。
+        """
+        moves = [(path_key(old), path_key(new)) for old, new in moves]
+        if not moves:
+            return
+        with self.conn:
+            self.conn.executemany("UPDATE pages SET path = ? WHERE path = ?", ((new, old) for old, new in moves))
+            self.conn.executemany("UPDATE duplicates SET path = ? WHERE path = ?", ((new, old) for old, new in moves))
+            self.conn.executemany("UPDATE duplicates SET original = ? WHERE original = ?",
+                                  ((new, old) for old, new in moves))
+            self.conn.executemany("DELETE FROM duplicates WHERE path = ? AND original = ?",
+                                  ((new, new) for _, new in moves))
+
+    @staticmethod
+    def apply(mode, page, original):
+        """重複ページを処理し、実際に行った処理（report / skip / link）を返す"""
+        try:
+            if mode == DEDUP_SKIP:
+                page.unlink()
+                return DEDUP_SKIP
+            if mode == DEDUP_LINK:
+                hardlink_replace(original, page)
+                return DEDUP_LINK
+        except OSError as e:
+            # 別ドライブなどでハードリンクできない場合はページをそのまま残す
+            logger.warning(f"重複ページを{mode}できません（そのまま出力します）: {page.name}: {e}", extra=PER_PAGE)
+        return DEDUP_REPORT
+
+    def runs(self, limit=20):
+        """重複を検出した実行の一覧（新しい順）"""
+        rows = self.conn.execute(
+            "SELECT run_id, COUNT(*), MIN(found_at), MAX(found_at) FROM duplicates "
+            "GROUP BY run_id ORDER BY MAX(id) DESC LIMIT ?", (limit,)).fetchall()
+        return [{'run_id': run_id, 'duplicate_count': count, 'first_found_at': first, 'last_found_at': last}
+                for run_id, count, first, last in rows]
+
+    def duplicates(self, run_id):
+        """実行1回分の重複ページの一覧"""
+        rows = self.conn.execute(
+            "SELECT found_at, zip_file, path, original, match, action FROM duplicates WHERE run_id = ? ORDER BY id",
+            (run_id,)).fetchall()
+        return [{'found_at': found_at, 'zip_file': zip_file, 'path': path, 'original': original,
+                 'match': match, 'action': action}
+                for found_at, zip_file, path, original, match, action in rows]
+
+    def page_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
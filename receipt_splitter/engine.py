@@ -0,0 +1,1669 @@
+"""ZIP解凍&PDF分割の処理エンジン（GUI非依存）"""
+import gc
+import glob
+import hashlib
+import importlib.util
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import (FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait)
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .dedup import DEDUP_MODES, DEDUP_OFF, PageIndex, default_index_path, new_run_id
+from .extraction import (COPY_BUFSIZE, DEFAULT_MAX_DEPTH, DEFAULT_NESTED_LIMIT, NestedArchives, extract_batch,
+                         is_nested_member, iter_pdf_targets, open_member, output_stem, plan_extraction)
+from .ledger import ZIP_ERROR, ZIP_SKIPPED, ZIP_SPLIT, JobLedger, default_ledger_path
+from .logs import LOG_FORMAT, PER_PAGE, bind_context, log_context, log_job_id, setup_worker_logging, worker_log_queue
+from .manifest import IncrementalTracker
+from .metrics import PipelineMetrics
+from .pipeline import JobCancelled, PageWriter
+from .preflight import PreflightResult, check_zip
+from .pagetext import PageTextCache, default_text_cache_path, page_texts
+from .progress import ProgressChannel
+from .rename import RenameConfig
+from .sinks import (SINK_FILES, SINK_MODES, FileSink, SpoolSink, archive_names, archive_path, is_page_archive,
+                    open_archive_sink, read_spool)
+from .strategies import STRATEGY_PAGE, SplitStrategy, output_name
+
+# PyPDF2 は読み込みに時間がかかるため、起動時は有無の確認だけ行い分割時に読み込む
+PDF_AVAILABLE = importlib.util.find_spec('PyPDF2') is not None
+# 画像の縮小（画像圧縮）は Pillow がある場合のみ行う
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+logger = logging.getLogger(__name__)
+
+# 解凍先オプション
+EXTRACT_INDIVIDUAL = 1  # 各ZIPファイルごとに個別フォルダを作成
+EXTRACT_DIRECT = 2      # 選択フォルダ内に直接解凍
+
+# 並列実行モード
+PARALLEL_SERIAL = 'serial'    # 逐次処理
+PARALLEL_THREAD = 'thread'    # スレッドプール（I/O中心の環境向け）
+PARALLEL_PROCESS = 'process'  # プロセスプール（PyPDF2のCPU処理を全コアで実行）
+PARALLEL_MODES = (PARALLEL_SERIAL, PARALLEL_THREAD, PARALLEL_PROCESS)
+
+MB = 1024 * 1024
+DEFAULT_SPILL_THRESHOLD = 64 * MB
+DEFAULT_PAGE_WINDOW = 50
+DEFAULT_EXTRACT_WORKERS = 2
+DEFAULT_JPEG_QUALITY = 75
+CANCEL_POLL_INTERVAL = 0.2  # 並列処理中に中止要求を確認する間隔（秒）
+DISCOVERY_BATCH = 16  # フォルダを探索しながら処理する場合に1回にまとめて処理するZIPの数
+
+# プロセスプールのワーカーで中止要求を受け取るイベント（init_worker で設定）
+_worker_cancel_event = None
+
+# スレッドごとに直前に使ったZIPの展開済みの入れ子のZIP（スレッドID -> _NestedEntry）
+_nested_entries = {}
+_nested_lock = threading.Lock()
+
+
+def env_bool(name, default):
+    """環境変数を真偽値として取得"""
+    return os.getenv(name, str(default)).lower() == 'true'
+
+
+@contextmanager
+def timed(stage_times, stage):
+    """処理段階の経過時間（秒）を stage_times に加算"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[stage] = stage_times.get(stage, 0.0) + time.perf_counter() - start
+
+
+def merge_stage_times(target, source):
+    """段階別の経過時間を合算"""
+    for stage, seconds in source.items():
+        target[stage] = target.get(stage, 0.0) + seconds
+    return target
+
+
+@dataclass
+class JobConfig:
+    """処理ジョブの設定"""
+    extract_option: int = EXTRACT_INDIVIDUAL
+    overwrite: bool = True
+    split_pdf: bool = True
+    strategy: SplitStrategy = field(default_factory=SplitStrategy)  # PDFを出力ファイルに分ける方法
+    max_workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    parallelism: str = PARALLEL_PROCESS
+    output_dir: Optional[Path] = None  # None の場合はZIPファイルと同じフォルダ
+    stream_pdfs: bool = False  # PDFをディスクに解凍せずZIPから直接分割
+    spill_threshold: int = DEFAULT_SPILL_THRESHOLD  # これを超えるPDFは一時ファイル経由で分割
+    incremental: bool = False  # マニフェストを参照し、変更のないZIPはスキップ
+    optimize_resources: bool = False  # 分割ページから未使用リソースを除去し、共有ストリームを圧縮
+    compact_images: bool = False  # 分割ページの画像を可逆圧縮し直し、image_dpi を超える画像は縮小する
+    image_dpi: int = 0  # 画像圧縮で縮小する解像度（0 は縮小しない）
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY  # 縮小した画像の JPEG 品質（1〜95）
+    low_memory: bool = False  # ページウィンドウ単位でPDFを読み直してメモリ使用量を抑える
+    page_window: int = DEFAULT_PAGE_WINDOW  # 省メモリ分割で1個のリーダーが扱うページ数
+    memory_budget: int = 0  # 同時に分割するPDFの合計サイズの上限（0 は無制限）
+    extract_workers: int = DEFAULT_EXTRACT_WORKERS  # 並列処理で同時に解凍するZIPの数（分割とは別のスレッド）
+    write_workers: int = 1  # PDF1個あたりの分割ページ書き込みスレッド数（0 は分割と同じスレッドで書き込む）
+    split_queue_size: int = 0  # 分割待ちのPDFがこれ以上ある間は次のZIPを解凍しない（0 は並列処理数の2倍）
+    ocr_rename: bool = False  # 分割後のページをOCRし、内容に応じたファイル名に付け替える
+    rename: RenameConfig = field(default_factory=RenameConfig)
+    ledger_path: Optional[Path] = None  # ジョブ台帳（None の場合は記録しない）
+    dedup: str = DEDUP_OFF  # 既存のページと重複したページの扱い（off / report / skip / link）
+    dedup_index: Optional[Path] = None  # ページ索引（None の場合は既定の場所）
+    output_sink: str = SINK_FILES  # 分割ページの出力先（files: ページごとのファイル / zip・tar: ZIPごとのアーカイブ）
+    preflight: bool = False  # 解凍前にZIP・PDFを検査し、エラーのあるZIPは解凍先に手を付けずに除外する
+    recursive: bool = False  # サブフォルダのZIP、ZIP内のサブフォルダ・入れ子のZIPのPDFも処理する
+    max_depth: int = DEFAULT_MAX_DEPTH  # サブフォルダ・入れ子のZIPをたどる深さの上限
+    nested_limit: int = DEFAULT_NESTED_LIMIT  # 展開する入れ子のZIP1個のサイズの上限
+
+    def __post_init__(self):
+        if self.parallelism not in PARALLEL_MODES:
+            raise ValueError(f"不明な並列実行モード: {self.parallelism}")
+        if self.dedup not in DEDUP_MODES:
+            raise ValueError(f"不明な重複ページの扱い: {self.dedup}")
+        if self.output_sink not in SINK_MODES:
+            raise ValueError(f"不明な分割ページの出力先: {self.output_sink}")
+        self.max_workers = max(1, self.max_workers)
+        self.page_window = max(1, self.page_window)
+        self.memory_budget = max(0, self.memory_budget)
+        self.extract_workers = max(1, self.extract_workers)
+        self.write_workers = max(0, self.write_workers)
+        self.split_queue_size = max(0, self.split_queue_size)
+        self.max_depth = max(0, self.max_depth)
+        self.nested_limit = max(0, self.nested_limit)
+        self.image_dpi = max(0, self.image_dpi)
+        self.jpeg_quality = min(95, max(1, self.jpeg_quality))
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """環境変数（.env）から設定を生成"""
+        config = cls(
+            extract_option=int(os.getenv('EXTRACT_OPTION', str(EXTRACT_INDIVIDUAL))),
+            overwrite=env_bool('OVERWRITE_FILES', True),
+            split_pdf=env_bool('SPLIT_PDF', True),
+            strategy=SplitStrategy.from_env(),
+            max_workers=int(os.getenv('MAX_WORKERS') or os.cpu_count() or 1),
+            parallelism=os.getenv('PARALLELISM', PARALLEL_PROCESS).lower(),
+            stream_pdfs=env_bool('STREAM_PDFS', False),
+            spill_threshold=int(float(os.getenv('STREAM_SPILL_MB', DEFAULT_SPILL_THRESHOLD / MB)) * MB),
+            incremental=env_bool('INCREMENTAL', False),
+            optimize_resources=env_bool('OPTIMIZE_RESOURCES', False),
+            compact_images=env_bool('COMPACT_IMAGES', False),
+            image_dpi=int(os.getenv('IMAGE_DPI') or 0),
+            jpeg_quality=int(os.getenv('JPEG_QUALITY') or DEFAULT_JPEG_QUALITY),
+            low_memory=env_bool('LOW_MEMORY', False),
+            page_window=int(os.getenv('PAGE_WINDOW') or DEFAULT_PAGE_WINDOW),
+            memory_budget=int(float(os.getenv('MEMORY_BUDGET_MB') or 0) * MB),
+            extract_workers=int(os.getenv('EXTRACT_WORKERS') or DEFAULT_EXTRACT_WORKERS),
+            write_workers=int(os.getenv('WRITE_WORKERS') or 1),
+            split_queue_size=int(os.getenv('SPLIT_QUEUE_SIZE') or 0),
+            ocr_rename=env_bool('OCR_RENAME', False),
+            rename=RenameConfig.from_env(),
+            ledger_path=(Path(os.getenv('JOB_LEDGER_PATH') or default_ledger_path()).expanduser()
+                         if env_bool('JOB_LEDGER', True) else None),
+            dedup=os.getenv('DEDUP', DEDUP_OFF).lower(),
+            dedup_index=Path(os.getenv('DEDUP_INDEX')).expanduser() if os.getenv('DEDUP_INDEX') else None,
+            output_sink=os.getenv('OUTPUT_SINK', SINK_FILES).lower(),
+            preflight=env_bool('PREFLIGHT', False),
+            recursive=env_bool('RECURSIVE', False),
+            max_depth=int(os.getenv('MAX_DEPTH') or DEFAULT_MAX_DEPTH),
+            nested_limit=int(float(os.getenv('NESTED_MAX_MB') or DEFAULT_NESTED_LIMIT / MB) * MB),
+        )
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(config, key, value)
+        config.__post_init__()
+        return config
+
+    def to_dict(self):
+        """ジョブ台帳に保存する設定"""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict() で保存した設定を復元（未知の項目は無視）"""
+        values = {key: value for key, value in data.items() if key in {f.name for f in fields(cls)}}
+        for key in ('output_dir', 'ledger_path', 'dedup_index'):
+            if values.get(key) is not None:
+                values[key] = Path(values[key])
+        rename = {key: value for key, value in (values.get('rename') or {}).items()
+                  if key in {f.name for f in fields(RenameConfig)}}
+        if rename.get('cache_dir') is not None:
+            rename['cache_dir'] = Path(rename['cache_dir'])
+        values['rename'] = RenameConfig(**rename)
+        strategy = {key: value for key, value in (values.get('strategy') or {}).items()
+                    if key in {f.name for f in fields(SplitStrategy)}}
+        if strategy.get('text_cache') is not None:
+            strategy['text_cache'] = Path(strategy['text_cache'])
+        values['strategy'] = SplitStrategy(**strategy)
+        return cls(**values)
+
+
+@dataclass
+class ZipResult:
+    """ZIPファイル1個分の処理結果"""
+    zip_file: Path
+    extract_path: Optional[Path] = None
+    split_files: List[Path] = field(default_factory=list)
+    pdf_errors: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    skipped: bool = False  # 増分処理で変更なしと判定されスキップした
+    stage_times: Dict[str, float] = field(default_factory=dict)  # 段階別の経過時間（並列分は合計）
+    bytes_extracted: int = 0  # ZIPから解凍・読み込んだバイト数
+    bytes_written: int = 0    # 分割ページとして書き込んだバイト数
+    bytes_saved: int = 0      # 共有リソース最適化による推定削減バイト数
+    members_skipped: int = 0  # 上書きしない設定で、解凍先に既に存在したためスキップしたメンバー数
+    bytes_skipped: int = 0    # スキップしたメンバーの展開後サイズ
+    cancelled: bool = False   # 処理の途中で中止した（再開時に続きから処理する）
+    duplicates: List[dict] = field(default_factory=list)  # 既存のページと重複したページ
+    output_archive: Optional[Path] = None  # 分割ページを書き込んだアーカイブ（アーカイブ出力の場合）
+    compaction: List[dict] = field(default_factory=list)  # 画像圧縮したページの圧縮前後のバイト数
+
+    @property
+    def success(self):
+        return self.error is None
+
+    @property
+    def image_bytes_saved(self):
+        """画像圧縮による推定削減バイト数"""
+        return sum(page['bytes_before'] - page['bytes_after'] for page in self.compaction)
+
+    def to_dict(self):
+        return {
+            'zip_file': str(self.zip_file),
+            'extract_path': str(self.extract_path) if self.extract_path else None,
+            'success': self.success,
+            'skipped': self.skipped,
+            'cancelled': self.cancelled,
+            'error': self.error,
+            'pdf_errors': list(self.pdf_errors),
+            'split_files': [str(path) for path in self.split_files],
+            'elapsed': round(self.elapsed, 3),
+            'stage_times': {stage: round(seconds, 3) for stage, seconds in self.stage_times.items()},
+            'bytes_extracted': self.bytes_extracted,
+            'bytes_written': self.bytes_written,
+            'bytes_saved': self.bytes_saved,
+            'members_skipped': self.members_skipped,
+            'bytes_skipped': self.bytes_skipped,
+            'duplicates': list(self.duplicates),
+            'output_archive': str(self.output_archive) if self.output_archive else None,
+            'image_bytes_saved': self.image_bytes_saved,
+            'compaction': list(self.compaction),
+        }
+
+
+@dataclass
+class PreparedZip:
+    """解凍段階の結果（ワーカーから返す）"""
+    extract_path: Path
+    members: List[str]  # 分割対象PDFのメンバー名
+    stage_times: Dict[str, float]
+    bytes_extracted: int = 0
+    member_sizes: Dict[str, int] = field(default_factory=dict)  # 分割対象PDFの展開後サイズ
+    resumed: bool = False  # ジョブ台帳の記録から再開した（解凍は済んでいる）
+    members_skipped: int = 0  # 解凍先に既に存在したためスキップしたメンバー数
+    bytes_skipped: int = 0
+    append_output: bool = False  # 再開時に既存の分割ページのアーカイブへ追記する
+
+
+@dataclass
+class SplitOutcome:
+    """PDF1個分の分割結果（ワーカーから返す）"""
+    member: str
+    split_files: List[Path]
+    elapsed: float
+    bytes_read: int = 0  # ストリーム分割でZIPから読み込んだバイト数
+    bytes_written: int = 0
+    bytes_saved: int = 0
+    pages_reported: bool = False  # ページごとの進捗を分割中に通知済み
+    fingerprints: List[tuple] = field(default_factory=list)  # ページごとの (描画内容, PDF) のハッシュ（重複検出時のみ）
+    compaction: List[dict] = field(default_factory=list)  # 出力ファイルごとの画像圧縮前後のバイト数（画像圧縮時のみ）
+    spool: Optional[str] = None  # アーカイブに追記するページを書き込んだ一時ファイル（プロセスプールのみ）
+    pages: List[tuple] = field(default_factory=list)  # spool 内のページの (メンバー名, バイト数)
+
+
+@dataclass
+class JobResult:
+    """ジョブ全体の処理結果"""
+    zip_results: List[ZipResult] = field(default_factory=list)
+    elapsed: float = 0.0
+    job_id: Optional[int] = None  # ジョブ台帳のジョブID（resume で再開する際に指定）
+    cancelled: bool = False  # 中止した（未着手のZIPは zip_results に含まれない）
+
+    @property
+    def total(self):
+        return len(self.zip_results)
+
+    @property
+    def success_count(self):
+        return sum(1 for result in self.zip_results if result.success)
+
+    @property
+    def errors(self):
+        """エラーになったZIPの「ファイル名: エラー内容」一覧"""
+        return [f"{result.zip_file.name}: {result.error}"
+                for result in self.zip_results if not result.success]
+
+    @property
+    def split_count(self):
+        return sum(len(result.split_files) for result in self.zip_results)
+
+    @property
+    def skipped_count(self):
+        return sum(1 for result in self.zip_results if result.skipped)
+
+    @property
+    def duplicate_count(self):
+        return sum(len(result.duplicates) for result in self.zip_results)
+
+    @property
+    def bytes_extracted(self):
+        return sum(result.bytes_extracted for result in self.zip_results)
+
+    @property
+    def bytes_written(self):
+        return sum(result.bytes_written for result in self.zip_results)
+
+    @property
+    def bytes_saved(self):
+        return sum(result.bytes_saved for result in self.zip_results)
+
+    @property
+    def image_bytes_saved(self):
+        return sum(result.image_bytes_saved for result in self.zip_results)
+
+    @property
+    def stage_times(self):
+        """全ZIPの段階別経過時間の合計"""
+        totals = {}
+        for result in self.zip_results:
+            merge_stage_times(totals, result.stage_times)
+        return totals
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'cancelled': self.cancelled,
+            'total': self.total,
+            'success_count': self.success_count,
+            'error_count': self.total - self.success_count,
+            'skipped_count': self.skipped_count,
+            'split_count': self.split_count,
+            'duplicate_count': self.duplicate_count,
+            'elapsed': round(self.elapsed, 3),
+            'stage_times': {stage: round(seconds, 3) for stage, seconds in self.stage_times.items()},
+            'bytes_extracted': self.bytes_extracted,
+            'bytes_written': self.bytes_written,
+            'bytes_saved': self.bytes_saved,
+            'image_bytes_saved': self.image_bytes_saved,
+            'errors': self.errors,
+            'zip_results': [result.to_dict() for result in self.zip_results],
+        }
+
+
+def iter_zip_files(folder, recursive=False, max_depth=DEFAULT_MAX_DEPTH, sort=False):
+    """フォルダ内のZIPファイルを見つけた順に返す（ファイル数の多いフォルダやネットワークドライブ向け）
+
+    recursive=True ならサブフォルダも max_depth 階層まで探索し、フォルダを1個読むごとに見つかったZIPを返す
+    （ツリー全体の探索を待たずに処理を始められる）。隠しフォルダ・シンボリックリンク、
+    同じフォルダにある同名のZIPの解凍先（a.zip に対する a/）は探索しない。
+    sort=True ならフォルダごとに名前順で返す。
+    """
+    pending = [(Path(folder), 0)]
+    while pending:
+        current, depth = pending.pop()
+        found = []
+        subfolders = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    name = entry.name
+                    try:
+                        # 分割ページのアーカイブは入力として扱わない
+                        if name.lower().endswith('.zip') and not is_page_archive(name) and entry.is_file():
+                            found.append(Path(entry.path))
+                        elif (recursive and depth < max_depth and not name.startswith('.')
+                              and entry.is_dir(follow_symlinks=False)):
+                            subfolders.append(name)
+                    except OSError:
+                        continue
+        except OSError as e:
+            if depth == 0:
+                raise
+            logger.warning(f"フォルダを探索できません: {current}: {e}")
+            continue
+
+        yield from (sorted(found) if sort else found)
+        stems = {zip_file.stem for zip_file in found}
+        # 名前順に探索するため逆順に積む
+        pending.extend((current / name, depth + 1)
+                       for name in sorted(subfolders, reverse=True) if name not in stems)
+
+
+def find_zip_files(folder, recursive=False, max_depth=DEFAULT_MAX_DEPTH):
+    """フォルダ内のZIPファイルを検索（既定ではフォルダ直下のみ）"""
+    return list(iter_zip_files(folder, recursive, max_depth))
+
+
+def iter_collect_zip_files(paths, recursive=False, max_depth=DEFAULT_MAX_DEPTH):
+    """フォルダ・ZIPファイル・globパターンの一覧からZIPファイルを見つけた順に返す（重複除外）"""
+    seen = set()
+    for raw_path in paths:
+        path = Path(raw_path).expanduser()
+        if path.is_dir():
+            candidates = iter_zip_files(path, recursive, max_depth, sort=True)
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = sorted(Path(match) for match in glob.glob(str(path), recursive=True))
+            candidates = [match for match in candidates
+                          if match.is_file() and match.suffix.lower() == '.zip']
+        for candidate in candidates:
+            key = candidate.resolve()
+            if key not in seen:
+                seen.add(key)
+                yield candidate
+
+
+def collect_zip_files(paths, recursive=False, max_depth=DEFAULT_MAX_DEPTH):
+    """フォルダ・ZIPファイル・globパターンの一覧からZIPファイルを収集（重複除外）"""
+    return list(iter_collect_zip_files(paths, recursive, max_depth))
+
+
+def init_worker(log_level, cancel_event=None, log_queue=None, job_id=None):
+    """プロセスプールのワーカー初期化（spawn 環境ではログ設定が引き継がれないため）
+
+    log_queue を渡した場合（非同期ログ）は、ログを親プロセスの書き込みスレッドへ送る。
+    """
+    global _worker_cancel_event
+    _worker_cancel_event = cancel_event
+    # Ctrl+C は親プロセスが受けて中止を要求するため、ワーカーでは無視する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if log_queue is not None:
+        setup_worker_logging(log_queue, log_level, job_id)
+    elif not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level, format=LOG_FORMAT)
+
+
+def split_pdf_task(config, zip_file, extract_path, member, progress=None, cancel_event=None, sink=None):
+    """ワーカー用: ZIP内のPDF1個を分割し、SplitOutcome を返す
+
+    progress・cancel_event・sink（ZIPごとのアーカイブ）はスレッドプールの場合のみ渡す
+    （プロセスプールでは init_worker で設定したイベントを使い、アーカイブ出力のページは一時ファイルに書き込んで親プロセスで追記する）。
+    """
+    engine = SplitterEngine(config, progress=progress, cancel_event=cancel_event or _worker_cancel_event)
+    return engine.split_member_measured(zip_file, extract_path, member, sink)
+
+
+class _NestedEntry:
+    """スレッドが直前に使ったZIPと、その展開済みの入れ子のZIP"""
+
+    def __init__(self, key, spool_limit):
+        self.key = key
+        self.zip_ref = zipfile.ZipFile(key[0], 'r')
+        self.archives = NestedArchives(self.zip_ref, spool_limit)
+
+    def close(self):
+        self.archives.close()
+        self.zip_ref.close()
+
+
+def thread_nested_archives(zip_file, spool_limit):
+    """このスレッドで zip_file の入れ子のZIPを開く NestedArchives
+
+    入れ子のZIPにある複数のPDFは別々のタスク（SplitterEngine）で分割されるため、展開した入れ子のZIPを
+    スレッド（プロセスプールではワーカープロセス）ごとに次のZIPを扱うまで開いたままにして再利用する。
+    """
+    stat = os.stat(zip_file)
+    key = (str(zip_file), stat.st_mtime_ns, stat.st_size, spool_limit)
+    thread = threading.get_ident()
+    with _nested_lock:
+        entry = _nested_entries.get(thread)
+        if entry is not None and entry.key == key:
+            return entry.archives
+        _nested_entries.pop(thread, None)
+    if entry is not None:
+        entry.close()
+    entry = _NestedEntry(key, spool_limit)
+    with _nested_lock:
+        _nested_entries[thread] = entry
+    return entry.archives
+
+
+def release_nested_archives(zip_file):
+    """このプロセスで開いたままの zip_file の入れ子のZIPを閉じる（ZIPの処理が終わったとき）"""
+    with _nested_lock:
+        threads = [thread for thread, entry in _nested_entries.items() if entry.key[0] == str(zip_file)]
+        entries = [_nested_entries.pop(thread) for thread in threads]
+    for entry in entries:
+        entry.close()
+
+
+class _ZipState:
+    """並列実行中のZIPファイル1個分の集計状態"""
+
+    def __init__(self, index, zip_file):
+        self.index = index
+        self.result = ZipResult(zip_file=zip_file)
+        self.start_time = time.time()
+        self.remaining = 0
+
+
+class SplitterEngine:
+    """ZIP解凍とPDF分割を行う処理エンジン
+
+    progress_callback は (message, done, total) を受け取る。
+    message が None の場合は進捗数のみの更新。
+    progress（ProgressChannel）を渡すと、ZIP単位の進捗に加えて分割したページ数も通知する。
+    config.ledger_path を設定すると、ZIP・PDFごとの処理状況をジョブ台帳に記録し、
+    中断したジョブを resume() で未完了のZIP・PDFから再開できる。
+    config.dedup を設定すると、分割したページをページ索引と照合し、以前の実行を含めて重複したページを検出する。
+    config.output_sink が zip・tar の場合は、分割ページを元のZIPごとに1個のアーカイブへ追記する。
+    cancel() は別スレッド（GUIなど）から呼び出せ、処理中のPDFはページの区切りで中止する。
+    """
+
+    def __init__(self, config, progress_callback: Optional[Callable] = None, metrics=None,
+                 progress: Optional[ProgressChannel] = None, cancel_event=None):
+        self.config = config
+        self.progress_callback = progress_callback
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.progress = progress
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.ledger = None
+        self.job_id = None
+        self.resume_points = {}  # 再開するZIP → ResumePoint（解凍済みのもののみ）
+        self.page_index = None
+        self.run_id = None  # 重複を記録する実行ID（ジョブ台帳のジョブID、無効な場合は開始日時）
+        self.sinks = {}  # 分割中のZIP → 分割ページのアーカイブ（アーカイブ出力の場合）
+        self.preflight_results = {}  # 事前検査済みのZIP → PreflightResult（実行時の検査で再利用する）
+
+    @property
+    def split_enabled(self):
+        return self.config.split_pdf and PDF_AVAILABLE
+
+    @property
+    def archive_output(self):
+        """分割ページをファイルではなくアーカイブに書き込むか"""
+        return self.config.output_sink != SINK_FILES and self.split_enabled
+
+    @property
+    def rename_enabled(self):
+        """分割したページをOCR&AI自動リネームするか（アーカイブ内のページはリネームしない）"""
+        return self.config.ocr_rename and self.split_enabled and not self.archive_output
+
+    @property
+    def dedup_enabled(self):
+        """分割したページの重複を検出するか（アーカイブ内のページは除外・リンクできないため検出しない）"""
+        return self.config.dedup != DEDUP_OFF and self.split_enabled and not self.archive_output
+
+    def cancel(self):
+        """処理の中止を要求（新しいZIP・PDFには着手せず、処理中のものはページの区切りで止める）"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def report_progress(self, message, done, total):
+        """進捗をチャネル・コールバックに通知"""
+        if self.progress is not None:
+            self.progress.status(message, done, total)
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(message, done, total)
+        except Exception as e:
+            logger.error(f"進捗通知エラー: {e}")
+
+    def run(self, zip_files):
+        """ZIPファイル群を処理（設定に応じて逐次またはプール並列）"""
+        zip_files = list(zip_files)
+        with self.open_ledger() as ledger, self.open_page_index():
+            if ledger is not None:
+                try:
+                    self.job_id = ledger.create_job(self.config.to_dict(), zip_files)
+                except sqlite3.Error as e:
+                    logger.error(f"ジョブ台帳の記録エラー: {e}")
+            return self.execute(zip_files)
+
+    def run_discovered(self, zip_files, batch_size=DISCOVERY_BATCH):
+        """探索中のZIPファイル（iter_collect_zip_files などのジェネレーター）を、探索の完了を待たずに処理
+
+        見つかったZIPを batch_size 個ずつまとめて処理し、大きなフォルダツリーでも最初のZIPから処理を始める。
+        ジョブ台帳には1個のジョブとして記録し、見つかったZIPを順に追加する。
+        """
+        start_time = time.time()
+        job_result = JobResult()
+        iterator = iter(zip_files)
+        seq = 0
+        with self.open_ledger() as ledger, self.open_page_index():
+            while not self.cancelled:
+                batch = list(itertools.islice(iterator, batch_size))
+                if not batch:
+                    break
+                if ledger is not None:
+                    try:
+                        if self.job_id is None:
+                            self.job_id = ledger.create_job(self.config.to_dict(), batch)
+                        else:
+                            ledger.add_zips(self.job_id, batch, seq)
+                    except sqlite3.Error as e:
+                        logger.error(f"ジョブ台帳の記録エラー: {e}")
+                seq += len(batch)
+                batch_result = self.execute(batch)
+                job_result.zip_results.extend(batch_result.zip_results)
+                job_result.cancelled = batch_result.cancelled
+        job_result.job_id = self.job_id
+        job_result.elapsed = time.time() - start_time
+        if seq > batch_size:
+            logger.info(f"探索したZIPの処理完了: {seq}個, {job_result.elapsed:.1f}秒")
+        return job_result
+
+    def resume(self, job_id):
+        """ジョブ台帳に記録された中断ジョブを、未完了のZIP・PDFから再開
+
+        解凍済みのZIPは解凍を省略し、分割が終わっていないPDFだけを分割する。
+        完了済みのZIPは処理せず、結果にも含めない。
+        """
+        with self.open_ledger() as ledger, self.open_page_index():
+            if ledger is None:
+                raise RuntimeError("ジョブ台帳が無効なため再開できません")
+            points = ledger.resume_plan(job_id)
+            ledger.job_resumed(job_id)
+            self.job_id = job_id
+            self.resume_points = {point.zip_file: point for point in points if point.extract_path is not None}
+            logger.info(f"ジョブ {job_id} を再開: 未完了のZIP {len(points)}個"
+                        f"（うち解凍済み {len(self.resume_points)}個）")
+            return self.execute([point.zip_file for point in points])
+
+    @contextmanager
+    def open_ledger(self):
+        """ジョブ台帳を開く（無効な場合・開けない場合は None を返し、記録せずに処理する）"""
+        ledger = None
+        if self.config.ledger_path is not None:
+            try:
+                ledger = JobLedger(self.config.ledger_path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"ジョブ台帳を開けません（記録せずに処理します）: {self.config.ledger_path}: {e}")
+        self.ledger = ledger
+        try:
+            yield ledger
+        finally:
+            self.ledger = None
+            if ledger is not None:
+                ledger.close()
+
+    @contextmanager
+    def open_page_index(self):
+        """重複検出用のページ索引を開く（無効な場合・開けない場合は重複を検出せずに処理する）"""
+        index = None
+        if self.dedup_enabled:
+            path = self.config.dedup_index or default_index_path()
+            try:
+                index = PageIndex(path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"ページ索引を開けません（重複を検出せずに処理します）: {path}: {e}")
+        self.page_index = index
+        try:
+            yield index
+        finally:
+            self.page_index = None
+            if index is not None:
+                index.close()
+
+    def record_ledger(self, action, *args):
+        """ジョブ台帳に記録（記録に失敗しても処理は続行する）"""
+        if self.ledger is None or self.job_id is None:
+            return None
+        try:
+            return getattr(self.ledger, action)(self.job_id, *args)
+        except sqlite3.Error as e:
+            logger.error(f"ジョブ台帳の記録エラー ({action}): {e}")
+            return None
+
+    def execute(self, zip_files):
+        """ZIPファイル群を処理し、結果をマニフェスト・ジョブ台帳に反映"""
+        start_time = time.time()
+        if self.job_id is not None:
+            self.run_id = str(self.job_id)
+        elif self.run_id is None:
+            self.run_id = new_run_id()
+        with log_context(self.run_id):
+            if self.archive_output and (self.config.ocr_rename or self.config.dedup != DEDUP_OFF):
+                logger.warning(f"分割ページをアーカイブ（{self.config.output_sink}）に出力するため、"
+                               f"OCR自動リネーム・重複ページの検出は行いません")
+            if self.config.compact_images and self.config.image_dpi and not PIL_AVAILABLE:
+                logger.warning("画像の縮小には 'pip install Pillow' が必要です（画像は可逆圧縮のみ行います）")
+            tracker = None
+            skipped = {}
+            to_process = zip_files
+            if self.config.incremental:
+                tracker = IncrementalTracker(self.manifest_options())
+                to_process, skipped = tracker.partition(zip_files, self.resolve_base_dir)
+                for zip_file in skipped:
+                    self.record_ledger('zip_status', zip_file, ZIP_SKIPPED)
+            rejected = {}
+            if self.config.preflight:
+                to_process, rejected = self.apply_preflight(to_process)
+
+            serial = self.config.parallelism == PARALLEL_SERIAL or self.config.max_workers <= 1
+            workers = 1 if serial else self.config.max_workers
+            self.metrics.workers.set(workers)
+            if serial:
+                job_result = self.run_serial(to_process)
+            else:
+                job_result = self.run_parallel(to_process)
+
+            job_result.cancelled = self.cancelled
+            if self.rename_enabled and not job_result.cancelled:
+                # リネーム段階（asyncio を使う）は有効な場合だけ読み込む
+                from .rename import RenameStage
+
+                self.report_progress("OCR&AI自動リネーム中...", len(to_process), len(to_process))
+                RenameStage(self.config.rename, metrics=self.metrics,
+                            page_index=self.page_index).run(job_result.zip_results)
+
+            job_result.zip_results.extend(rejected.values())
+            if tracker is not None:
+                tracker.record(job_result.zip_results, self.resolve_base_dir)
+            if skipped or self.config.preflight:
+                # 元の順番でスキップ分の結果を合成（事前検査で並べ替えた分も戻し、中止して着手しなかったZIPは含めない）
+                processed = {result.zip_file: result for result in job_result.zip_results}
+                job_result.zip_results = [
+                    processed[zip_file] if zip_file in processed
+                    else self.skipped_result(zip_file, *skipped[zip_file])
+                    for zip_file in zip_files if zip_file in processed or zip_file in skipped
+                ]
+
+            self.record_ledger('finish_job', job_result.zip_results)
+            job_result.job_id = self.job_id
+            job_result.elapsed = time.time() - start_time
+            self.metrics.zips.inc(len(skipped), status='skipped')
+            self.record_run_metrics(job_result, workers)
+            if job_result.cancelled:
+                logger.warning(f"処理を中止しました: {job_result.elapsed:.1f}秒"
+                               f"（{len(job_result.zip_results)}/{len(zip_files)}個のZIPに着手）")
+            else:
+                logger.info(f"全ZIP処理完了: {job_result.elapsed:.1f}秒")
+            if job_result.duplicate_count:
+                logger.info(f"重複ページ: {job_result.duplicate_count}件（実行ID: {self.run_id}）")
+            return job_result
+
+    def preflight(self, zip_files, callback=None):
+        """ZIPファイル群を解凍せずに検査し、{ZIP: PreflightResult} を返す
+
+        検査は並列実行モードに従ってワーカープールで並列に行い、終わったZIPから順に callback を呼ぶ。
+        検査済みのZIP（preflight_results にあるもの）は検査し直さない。中止が要求されると未着手の検査を取り消す。
+        """
+        results = {}
+
+        def finish(check):
+            results[check.zip_file] = self.preflight_results[check.zip_file] = check
+            if callback is None:
+                return
+            try:
+                callback(check)
+            except Exception as e:
+                logger.error(f"事前検査の通知エラー: {e}")
+
+        todo = []
+        for zip_file in zip_files:
+            if zip_file in self.preflight_results:
+                finish(self.preflight_results[zip_file])
+            else:
+                todo.append(zip_file)
+        count_pages = self.split_enabled
+
+        if self.config.parallelism == PARALLEL_SERIAL or self.config.max_workers <= 1 or len(todo) <= 1:
+            for zip_file in todo:
+                if self.cancelled:
+                    break
+                finish(check_zip(zip_file, count_pages=count_pages))
+            return results
+
+        with self.create_executor() as executor:
+            pending = {executor.submit(check_zip, zip_file, True, count_pages): zip_file for zip_file in todo}
+            while pending:
+                done, _ = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    zip_file = pending.pop(future)
+                    try:
+                        finish(future.result())
+                    except CancelledError:
+                        continue
+                    except Exception as e:
+                        finish(PreflightResult(zip_file, errors=[f"検査できません: {e}"]))
+                if self.cancelled:
+                    for future in pending:
+                        future.cancel()
+        return results
+
+    def apply_preflight(self, zip_files):
+        """事前検査でエラーのあったZIPを除外し、(処理するZIP一覧, 除外したZIPの {zip: ZipResult}) を返す
+
+        並列処理では展開後サイズの大きいZIPから着手し、最後に大きなZIPだけが残って待たされないようにする。
+        """
+        self.report_progress("事前検査中...", 0, len(zip_files))
+        checks = self.preflight(zip_files)
+        rejected = {}
+        for zip_file in zip_files:
+            check = checks.get(zip_file)
+            if check is None or check.ok:
+                continue
+            result = ZipResult(zip_file=zip_file, error=f"事前検査エラー: {'; '.join(check.errors)}",
+                               elapsed=check.elapsed)
+            logger.error(f"事前検査エラー: {zip_file.name}: {'; '.join(check.errors)}")
+            self.record_zip_finished(result)
+            rejected[zip_file] = result
+
+        accepted = [zip_file for zip_file in zip_files if zip_file not in rejected]
+        if self.config.parallelism != PARALLEL_SERIAL and self.config.max_workers > 1:
+            accepted.sort(key=lambda zip_file: -checks[zip_file].bytes_uncompressed if zip_file in checks else 0)
+        total_pages = sum(checks[zip_file].page_count or 0 for zip_file in accepted if zip_file in checks)
+        logger.info(f"事前検査: {len(accepted)}個のZIPを処理（約{total_pages}ページ）, エラーで除外: {len(rejected)}個")
+        return accepted, rejected
+
+    def record_run_metrics(self, job_result, workers):
+        """実行全体のメトリクス（所要時間・ワーカー稼働率）を記録"""
+        busy = sum(seconds for result in job_result.zip_results if not result.skipped
+                   for stage, seconds in result.stage_times.items())
+        self.metrics.worker_busy_seconds.inc(busy)
+        self.metrics.run_seconds.set(job_result.elapsed)
+        self.metrics.worker_utilization.set(
+            min(1.0, busy / (workers * job_result.elapsed)) if job_result.elapsed > 0 else 0.0)
+        self.metrics.last_run.set(time.time())
+
+    def record_prepared(self, result, prepared):
+        """解凍段階の結果をZIPの結果とメトリクス・ジョブ台帳に反映"""
+        if not prepared.resumed:
+            self.record_ledger('zip_extracted', result.zip_file, prepared.extract_path, prepared.members)
+        result.extract_path = prepared.extract_path
+        merge_stage_times(result.stage_times, prepared.stage_times)
+        result.bytes_extracted += prepared.bytes_extracted
+        result.members_skipped += prepared.members_skipped
+        result.bytes_skipped += prepared.bytes_skipped
+        self.metrics.bytes_extracted.inc(prepared.bytes_extracted)
+
+    def record_split(self, result, outcome):
+        """PDF1個分の分割結果をZIPの結果とメトリクス・ジョブ台帳に反映し、元のPDFを削除"""
+        self.resolve_duplicates(result, outcome)
+        self.write_archive_pages(result, outcome)
+        # 全ページの書き込みを台帳に記録してから元のPDFを削除する（途中で終了しても元のPDFから再開できる）
+        self.record_ledger('pdf_done', result.zip_file, outcome.member, outcome.split_files)
+        self.remove_source(result.extract_path, outcome.member)
+        result.split_files.extend(outcome.split_files)
+        merge_stage_times(result.stage_times, {'split': outcome.elapsed})
+        result.bytes_extracted += outcome.bytes_read
+        result.bytes_written += outcome.bytes_written
+        result.bytes_saved += outcome.bytes_saved
+        self.record_compaction(result, outcome)
+        self.metrics.pdfs.inc(status='success')
+        self.metrics.pages.inc(len(outcome.split_files))
+        if self.progress is not None and not outcome.pages_reported:
+            self.progress.pages(len(outcome.split_files))
+        self.metrics.bytes_extracted.inc(outcome.bytes_read)
+        self.metrics.bytes_written.inc(outcome.bytes_written)
+        self.metrics.bytes_saved.inc(outcome.bytes_saved)
+        self.metrics.pdf_split_seconds.observe(outcome.elapsed)
+
+    def record_compaction(self, result, outcome):
+        """出力ファイルごとの画像圧縮前後のバイト数を記録"""
+        for page in outcome.compaction:
+            saved = page['bytes_before'] - page['bytes_after']
+            if not saved:
+                continue
+            self.metrics.image_bytes_saved.inc(saved)
+            logger.info(f"画像圧縮: {Path(page['path']).name} {page['bytes_before'] / 1024:.1f}KB → "
+                        f"{page['bytes_after'] / 1024:.1f}KB", extra=PER_PAGE)
+        result.compaction.extend(outcome.compaction)
+
+    def resolve_duplicates(self, result, outcome):
+        """分割したページをページ索引と照合し、重複したページを設定に応じて除外・リンク"""
+        if self.page_index is None or not outcome.fingerprints:
+            return
+        try:
+            outcome.split_files, duplicates = self.page_index.resolve(
+                self.run_id, result.zip_file, outcome.split_files, outcome.fingerprints, self.config.dedup)
+        except sqlite3.Error as e:
+            logger.error(f"ページ索引の記録エラー: {e}")
+            return
+        for duplicate in duplicates:
+            self.metrics.duplicates.inc(match=duplicate['match'], action=duplicate['action'])
+            logger.info(f"重複ページ ({duplicate['action']}): {Path(duplicate['path']).name} = {duplicate['original']}",
+                        extra=PER_PAGE)
+        result.duplicates.extend(duplicates)
+
+    def open_output(self, result, append=False):
+        """ZIP1個分の分割ページのアーカイブを開く（ファイル出力の場合は何もしない）"""
+        if not self.archive_output:
+            return
+        path = self.archive_path(result.zip_file, result.extract_path)
+        self.sinks[result.zip_file] = open_archive_sink(path, self.config.output_sink, append)
+        result.output_archive = path
+
+    def close_output(self, result):
+        """分割ページのアーカイブを閉じる（書き込みに失敗した場合はZIPのエラーにする）"""
+        sink = self.sinks.pop(result.zip_file, None)
+        if sink is None:
+            return
+        try:
+            sink.close()
+        except OSError as e:
+            result.error = result.error or f"アーカイブ書き込みエラー: {e}"
+            logger.error(f"アーカイブ書き込みエラー: {sink.archive}: {e}")
+            return
+        logger.debug(f"分割ページのアーカイブ: {sink.archive.name} ({sink.count}ページ)")
+
+    def write_archive_pages(self, result, outcome):
+        """プロセスプールのワーカーが一時ファイルに書き込んだページをアーカイブに追記（一時ファイルは削除）"""
+        if outcome.spool is None:
+            return
+        spool, outcome.spool = outcome.spool, None
+        pages = read_spool(spool, outcome.pages)
+        try:
+            sink = self.sinks[result.zip_file]
+            for name, data in pages:
+                sink.write(name, data)
+        finally:
+            pages.close()
+        outcome.pages = []
+
+    def archive_path(self, zip_file, extract_path):
+        return archive_path(extract_path, zip_file.stem, self.config.output_sink)
+
+    def record_split_error(self, result, member, error):
+        if isinstance(error, (JobCancelled, CancelledError)):
+            # 中止したPDFは台帳上も未分割のまま残し、再開時に分割し直す
+            result.cancelled = True
+            return
+        error_msg = f"PDF分割エラー ({member}): {error}"
+        result.pdf_errors.append(error_msg)
+        self.record_ledger('pdf_failed', result.zip_file, member, error)
+        self.metrics.pdfs.inc(status='error')
+        logger.error(error_msg)
+
+    def record_zip_finished(self, result):
+        """ZIP1個の処理完了をメトリクス・ジョブ台帳に反映"""
+        self.close_output(result)
+        release_nested_archives(result.zip_file)
+        if result.cancelled:
+            # 台帳は解凍済み・未処理の状態のまま残す（再開時に続きから処理する）
+            if result.error is None:
+                result.error = str(JobCancelled())
+            self.metrics.zips.inc(status='cancelled')
+            return
+        self.record_ledger('zip_status', result.zip_file, ZIP_SPLIT if result.success else ZIP_ERROR, result.error)
+        self.metrics.zips.inc(status='success' if result.success else 'error')
+        self.metrics.zip_seconds.observe(result.elapsed)
+        for stage, seconds in result.stage_times.items():
+            self.metrics.zip_stage_seconds.observe(seconds, stage=stage)
+
+    def run_serial(self, zip_files):
+        """ZIPファイル群を順番に処理"""
+        total_files = len(zip_files)
+        job_result = JobResult()
+
+        for i, zip_file in enumerate(zip_files):
+            if self.cancelled:
+                break
+            self.report_progress(f"解凍中: {zip_file.name} ({i+1}/{total_files})", i, total_files)
+            logger.info(f"ZIP解凍開始: {zip_file.name} ({i+1}/{total_files})")
+
+            job_result.zip_results.append(self.process_zip(zip_file, i, total_files))
+
+            self.report_progress(None, i + 1, total_files)
+
+        return job_result
+
+    def create_executor(self, cancel_event=None):
+        """設定に応じた分割用のワーカープールを生成（cancel_event はプロセスプールのワーカーの中止イベント）"""
+        if self.config.parallelism == PARALLEL_PROCESS:
+            return ProcessPoolExecutor(max_workers=self.config.max_workers,
+                                       initializer=init_worker,
+                                       initargs=(logging.getLogger().getEffectiveLevel(), cancel_event,
+                                                 worker_log_queue(), log_job_id.get()))
+        return ThreadPoolExecutor(max_workers=self.config.max_workers)
+
+    def run_parallel(self, zip_files):
+        """解凍・分割・書き込みの各段階を別々のワーカーで並行して処理
+
+        解凍は extract_workers 個のスレッド、PDF分割はワーカープール（max_workers）、
+        ページの書き込みは分割タスクごとの書き込みスレッド（write_workers）で行い、ディスクとCPUを同時に使う。
+        分割待ちのPDFが split_queue_size 個以上ある間は次のZIPを解凍せず、解凍済みファイル・メモリの量を抑える。
+        解凍先が同じZIP（直接解凍モードなど）は互いのファイルを壊さないよう順番に処理する。
+        中止が要求されると新しいタスクを投入せず、未着手のタスクを取り消して、実行中のタスクの終了を待つ。
+        """
+        total_files = len(zip_files)
+        zip_results = [None] * total_files
+        completed = 0
+
+        # 解凍先ごとの待ち行列と、次のZIPを解凍できる待ち行列
+        queues = {}
+        for i, zip_file in enumerate(zip_files):
+            queues.setdefault(self.resolve_extract_path(zip_file), deque()).append((i, zip_file))
+        ready = deque(queues.values())
+        extracting = 0
+        queue_size = self.config.split_queue_size or 2 * self.config.max_workers
+
+        # 分割待ちのPDF（メモリ予算: 実行中のPDFサイズの合計が予算を超える間は投入を待たせる）
+        budget = self.config.memory_budget
+        memory_in_use = 0
+        split_waiting = deque()
+        # 進捗チャネル・中止イベントはプロセス間で共有できないため、プロセスプールでは
+        # 進捗は完了時にまとめて通知し、中止はワーカー初期化時に渡すイベントで伝える
+        # ログの相関IDはスレッドプールでは呼び出しごとに引き継ぎ、プロセスプールではワーカー初期化時に渡す
+        # アーカイブ出力では、スレッドプールのワーカーはページを直接アーカイブに追記し、
+        # プロセスプールのワーカーはページを一時ファイルに書き込み、親プロセスがそこから追記する
+        if self.config.parallelism == PARALLEL_PROCESS:
+            worker_progress = task_cancel = None
+            worker_cancel = multiprocessing.Event()
+            split_task = split_pdf_task
+            share_sinks = False
+        else:
+            worker_progress = self.progress
+            worker_cancel = task_cancel = self.cancel_event
+            split_task = bind_context(split_pdf_task)
+            share_sinks = True
+        cancelling = False
+
+        with ThreadPoolExecutor(max_workers=self.config.extract_workers, thread_name_prefix='extract') as extractor, \
+                self.create_executor(worker_cancel) as executor:
+            pending = {}
+
+            def observe_queues():
+                self.metrics.observe_queue('tasks', len(pending))
+                self.metrics.observe_queue('zips', sum(len(queue) for queue in queues.values()))
+                self.metrics.observe_queue('splits', len(split_waiting))
+
+            def submit_splits():
+                nonlocal memory_in_use
+                while split_waiting:
+                    state, queue, target, cost = split_waiting[0]
+                    # 何も実行していない場合は予算を超えるPDFでも1個は実行する
+                    if budget and memory_in_use and memory_in_use + cost > budget:
+                        break
+                    split_waiting.popleft()
+                    memory_in_use += cost
+                    sink = self.sinks.get(state.result.zip_file) if share_sinks else None
+                    split_future = executor.submit(split_task, self.config, state.result.zip_file,
+                                                   state.result.extract_path, target, worker_progress,
+                                                   task_cancel, sink)
+                    pending[split_future] = (state, queue, target, cost)
+
+            def start_extractions():
+                """解凍の同時実行数と分割待ちの上限の範囲で次のZIPに着手"""
+                nonlocal extracting
+                while ready and extracting < self.config.extract_workers and len(split_waiting) < queue_size:
+                    if self.cancelled:
+                        return
+                    queue = ready.popleft()
+                    i, zip_file = queue.popleft()
+                    state = _ZipState(i, zip_file)
+                    point = self.resume_points.get(zip_file)
+                    if point is None:
+                        self.report_progress(f"解凍中: {zip_file.name} ({i+1}/{total_files})", completed, total_files)
+                        logger.info(f"ZIP解凍開始: {zip_file.name} ({i+1}/{total_files})")
+                        future = extractor.submit(bind_context(self.prepare_zip), zip_file)
+                        pending[future] = (state, queue, None, 0)
+                        extracting += 1
+                        continue
+
+                    # 解凍済み: 台帳の記録から未分割のPDFの分割を再開（分割がなければ次のZIPへ）
+                    self.report_progress(f"再開中: {zip_file.name} ({i+1}/{total_files})", completed, total_files)
+                    try:
+                        if start_splits(state, queue, self.resume_prepared(state.result, point)):
+                            continue
+                    except Exception as e:
+                        state.result.error = str(e)
+                        logger.error(f"ZIP処理エラー: {zip_file.name}: {e}")
+                    complete(state, queue)
+
+            def start_splits(state, queue, prepared):
+                """分割タスクを投入（分割するPDFがなければ False）"""
+                result = state.result
+                self.record_prepared(result, prepared)
+                members = prepared.members
+                if not self.split_enabled or not members:
+                    return False
+
+                try:
+                    self.open_output(result, prepared.append_output)
+                except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                    result.error = f"アーカイブを開けません: {e}"
+                    logger.error(f"ZIP処理エラー: {result.zip_file.name}: {result.error}")
+                    return False
+
+                logger.info(f"PDF分割開始: {result.zip_file.name} ({len(members)}個のPDFファイル)")
+                state.remaining = len(members)
+                split_waiting.extend((state, queue, target, prepared.member_sizes.get(target, 0))
+                                     for target in members)
+                submit_splits()
+                return True
+
+            def complete(state, queue):
+                nonlocal completed
+                state.result.elapsed = time.time() - state.start_time
+                self.record_zip_finished(state.result)
+                zip_results[state.index] = state.result
+                completed += 1
+                self.report_progress(None, completed, total_files)
+                if queue:
+                    ready.append(queue)
+
+            def cancel_pending():
+                """未着手の分割・解凍を取り消す（実行中のタスクは中止イベントで止まるのを待つ）"""
+                worker_cancel.set()
+                while split_waiting:
+                    state, queue, target, cost = split_waiting.popleft()
+                    state.result.cancelled = True
+                    state.remaining -= 1
+                    if state.remaining == 0:
+                        complete(state, queue)
+                for future in pending:
+                    future.cancel()
+
+            start_extractions()
+
+            while pending:
+                observe_queues()
+                done, _ = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                if self.cancelled and not cancelling:
+                    cancelling = True
+                    logger.warning("中止が要求されました: 実行中のタスクの終了を待っています")
+                    cancel_pending()
+                    done, _ = wait(pending, timeout=0)
+
+                for future in done:
+                    state, queue, member, cost = pending.pop(future)
+                    result = state.result
+
+                    if member is None:
+                        # 解凍タスク完了 → PDFごとの分割タスクを投入
+                        extracting -= 1
+                        try:
+                            prepared = future.result()
+                        except (JobCancelled, CancelledError):
+                            result.cancelled = True
+                            complete(state, queue)
+                            continue
+                        except Exception as e:
+                            result.error = str(e)
+                            logger.error(f"ZIP処理エラー: {result.zip_file.name}: {e}")
+                            complete(state, queue)
+                            start_extractions()
+                            continue
+
+                        if self.cancelled:
+                            # 解凍後に中止された: 台帳には解凍済みとして記録し、分割は再開時に行う
+                            self.record_prepared(result, prepared)
+                            result.cancelled = True
+                            complete(state, queue)
+                        elif not start_splits(state, queue, prepared):
+                            complete(state, queue)
+                        start_extractions()
+                        continue
+
+                    # 分割タスク完了
+                    try:
+                        self.record_split(result, future.result())
+                    except Exception as e:
+                        self.record_split_error(result, member, e)
+                    memory_in_use -= cost
+                    submit_splits()
+
+                    state.remaining -= 1
+                    if state.remaining == 0:
+                        result.split_files.sort()
+                        logger.info(f"PDF分割完了: {result.zip_file.name} ({len(result.split_files)}個のファイルに分割)")
+                        complete(state, queue)
+                    start_extractions()
+
+            observe_queues()
+
+        return JobResult(zip_results=[result for result in zip_results if result is not None])
+
+    def process_zip(self, zip_file, index=0, total=1):
+        """ZIPファイル1個を解凍し、必要に応じてPDF分割"""
+        result = ZipResult(zip_file=zip_file)
+        start_time = time.time()
+        try:
+            point = self.resume_points.get(zip_file)
+            if point is not None:
+                prepared = self.resume_prepared(result, point)
+            else:
+                prepared = self.prepare_zip(zip_file)
+            self.record_prepared(result, prepared)
+
+            # PDF分割処理
+            if self.split_enabled:
+                if prepared.members:
+                    self.open_output(result, prepared.append_output)
+                self.report_progress(f"PDF分割中: {zip_file.name} ({index+1}/{total})", index, total)
+                self.split_pdfs(result, prepared.members)
+
+        except JobCancelled:
+            result.cancelled = True
+        except Exception as e:
+            result.error = str(e)
+            logger.error(f"ZIP処理エラー: {zip_file.name}: {e}")
+
+        result.elapsed = time.time() - start_time
+        self.record_zip_finished(result)
+        return result
+
+    @property
+    def streaming(self):
+        """PDFをディスクに解凍せずZIPから直接分割するか"""
+        return self.config.stream_pdfs and self.split_enabled
+
+    def prepare_zip(self, zip_file):
+        """解凍先を準備してZIPを解凍し、PreparedZip（解凍先・分割対象PDF・段階別経過時間）を返す"""
+        stage_times = {}
+        with timed(stage_times, 'prepare'):
+            extract_path = self.prepare_extract_path(zip_file)
+
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            member_sizes = self.pdf_target_sizes(zip_ref, zip_file)
+            members = list(member_sizes)
+
+            # 前回の作業ファイルを削除（PDF分割機能が有効な場合。アーカイブは開くときに作り直す）
+            if self.split_enabled and not self.archive_output:
+                with timed(stage_times, 'cleanup'):
+                    self.cleanup_previous_files(extract_path, [output_stem(member) for member in members])
+
+            with timed(stage_times, 'extract'):
+                # ストリーム分割では分割対象のPDFは解凍せず、それ以外のメンバーのみ解凍
+                plan = self.extract_members(zip_ref, extract_path, exclude=set(members) if self.streaming else ())
+
+        return PreparedZip(extract_path, members, stage_times, plan.bytes_to_write, member_sizes,
+                           members_skipped=len(plan.skipped), bytes_skipped=plan.bytes_skipped)
+
+    def resume_prepared(self, result, point):
+        """ジョブ台帳の再開位置から PreparedZip を復元（分割済みのページは result に反映）
+
+        分割済みなのに残っている元のPDF（記録直後に終了した場合）は削除し、
+        未分割なのにディスク上にないPDFはZIPから解凍し直す。
+        アーカイブ出力では、アーカイブが読めない（書き込み途中で終了した）場合や
+        未分割のPDFのページが途中まで含まれている場合は、アーカイブを作り直して全PDFを分割し直す。
+        """
+        extract_path = point.extract_path
+        if not extract_path.is_dir():
+            raise FileNotFoundError(f"解凍先フォルダがありません: {extract_path}")
+
+        done = point.done
+        append = False
+        if self.archive_output:
+            output = self.archive_path(result.zip_file, extract_path)
+            names = archive_names(output, self.config.output_sink)
+            pending_stems = {output_stem(member) for member in point.pending}
+            append = names is not None and not any(name.rpartition('_page_')[0] in pending_stems for name in names)
+            if append:
+                result.output_archive = output
+                done = {member: [page for page in pages if page.name in names] for member, pages in done.items()}
+            else:
+                if done:
+                    logger.info(f"分割ページのアーカイブを作り直します: {output.name}")
+                done = {}
+
+        for member, pages in done.items():
+            self.remove_source(extract_path, member)
+            result.split_files.extend(page for page in pages if self.archive_output or page.exists())
+
+        members = [member for member in point.done if member not in done] + list(point.pending)
+        with zipfile.ZipFile(result.zip_file, 'r') as zip_ref:
+            sizes = self.pdf_target_sizes(zip_ref, result.zip_file) if members else {}
+            member_sizes = {member: sizes.get(member, 0) for member in members}
+            if members and not self.archive_output:
+                # 書き込み途中だった分割ページ・一時ファイルは作り直す
+                self.cleanup_previous_files(extract_path, [output_stem(member) for member in members])
+            if not self.streaming:
+                for member in members:
+                    if not is_nested_member(member) and not (extract_path / member).exists():
+                        zip_ref.extract(member, extract_path)
+
+        logger.info(f"分割を再開: {result.zip_file.name}（分割済み {len(done)}個, 未分割 {len(members)}個のPDF）")
+        return PreparedZip(extract_path, members, {}, member_sizes=member_sizes, resumed=True, append_output=append)
+
+    def pdf_target_sizes(self, zip_ref, zip_file=None):
+        """分割対象のPDFの {メンバー名: 展開後サイズ}（設定に応じてサブフォルダ・入れ子のZIPのPDFを含む）
+
+        zip_file を渡すと、探索で展開した入れ子のZIPを同じスレッドでの分割に再利用できるよう開いたまま残す。
+        """
+        nested = None
+        if zip_file is not None and self.config.recursive and self.split_enabled:
+            nested = thread_nested_archives(zip_file, self.spool_limit)
+        return dict(iter_pdf_targets(zip_ref, self.config.recursive, self.config.max_depth,
+                                     self.config.nested_limit, self.spool_limit, nested))
+
+    def pdf_targets(self, zip_ref):
+        """分割対象のPDFのメンバー名の一覧"""
+        return list(self.pdf_target_sizes(zip_ref))
+
+    def manifest_options(self):
+        """出力内容に影響する設定（変わった場合は増分処理でも再処理する）"""
+        options = {'extract_option': self.config.extract_option, 'split_pdf': self.split_enabled}
+        if self.rename_enabled:
+            # 無効時は項目自体を含めない（既存のマニフェストを無効にしない）
+            options['ocr_rename'] = f"{self.config.rename.ocr_backend}/{self.config.rename.naming_backend}"
+        if self.dedup_enabled:
+            options['dedup'] = self.config.dedup
+        if self.archive_output:
+            options['output_sink'] = self.config.output_sink
+        if self.split_enabled and self.config.strategy.mode != STRATEGY_PAGE:
+            options['split_strategy'] = self.config.strategy.describe()
+        if self.split_enabled and self.config.recursive:
+            options['recursive'] = f"{self.config.max_depth}/{self.config.nested_limit}"
+        if self.split_enabled and self.config.compact_images:
+            options['compact_images'] = self.compaction_describe()
+        return options
+
+    def compaction_describe(self):
+        """画像圧縮の設定の要約（縮小しない場合は lossless）"""
+        if self.config.image_dpi and PIL_AVAILABLE:
+            return f"{self.config.image_dpi}dpi/q{self.config.jpeg_quality}"
+        return 'lossless'
+
+    @staticmethod
+    def skipped_result(zip_file, manifest, entry):
+        """マニフェストの記録からスキップしたZIPの結果を生成"""
+        return ZipResult(
+            zip_file=zip_file,
+            extract_path=manifest.absolute(entry['extract_path']),
+            split_files=[manifest.absolute(page) for page in entry['pages']],
+            skipped=True,
+        )
+
+    def resolve_base_dir(self, zip_file):
+        """出力先の基準フォルダ（マニフェストの保存先）を決定"""
+        return Path(self.config.output_dir) if self.config.output_dir else zip_file.parent
+
+    def resolve_extract_path(self, zip_file):
+        """解凍先フォルダを決定"""
+        base_dir = self.resolve_base_dir(zip_file)
+        if self.config.extract_option == EXTRACT_INDIVIDUAL:
+            return base_dir / zip_file.stem
+        return base_dir
+
+    def prepare_extract_path(self, zip_file):
+        """解凍先フォルダを準備（個別フォルダの場合は作り直す）"""
+        extract_path = self.resolve_extract_path(zip_file)
+        if self.config.extract_option == EXTRACT_INDIVIDUAL:
+            # 同名フォルダが存在する場合は削除
+            if extract_path.exists():
+                shutil.rmtree(extract_path)
+        extract_path.mkdir(parents=True, exist_ok=True)
+        return extract_path
+
+    def extract_members(self, zip_ref, extract_path, exclude=frozenset()):
+        """開いたZIPファイルを解凍（exclude のメンバーは除く）し、解凍計画（ExtractionPlan）を返す
+
+        上書きしない場合は解凍先の既存ファイルの索引と照合し、存在しないメンバーだけをまとめて解凍する。
+        """
+        plan = plan_extraction(zip_ref, extract_path, overwrite=self.config.overwrite, exclude=exclude)
+        if plan.skipped:
+            logger.info(f"既存ファイルをスキップ: {len(plan.skipped)}個 ({plan.bytes_skipped / MB:.1f}MB), "
+                        f"解凍: {len(plan.to_write)}個 ({plan.bytes_to_write / MB:.1f}MB)")
+        # メンバーごとに中止要求を確認
+        extract_batch(zip_ref, extract_path, plan.to_write, self.check_cancelled)
+        return plan
+
+    def plan_zip(self, zip_file):
+        """解凍前の見積もり（書き込む・スキップするメンバー数とバイト数）を返す（ファイルは変更しない）"""
+        extract_path = self.resolve_extract_path(zip_file)
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            exclude = set(self.pdf_targets(zip_ref)) if self.streaming else ()
+            # 個別フォルダは解凍前に作り直すため、上書きしない設定でもすべて書き込む
+            overwrite = self.config.overwrite or self.config.extract_option == EXTRACT_INDIVIDUAL
+            plan = plan_extraction(zip_ref, extract_path, overwrite=overwrite, exclude=exclude)
+        return {'zip_file': str(zip_file), 'extract_path': str(extract_path), **plan.to_dict()}
+
+    def split_pdfs(self, result, members):
+        """ZIP内のPDF群を順番に分割し、結果を result に反映"""
+        if not members:
+            logger.info("PDF分割: PDFファイルが見つかりませんでした")
+            return
+
+        logger.info(f"PDF分割開始: {len(members)}個のPDFファイル")
+
+        for member in members:
+            if self.cancelled:
+                result.cancelled = True
+                break
+            try:
+                outcome = self.split_member_measured(result.zip_file, result.extract_path, member,
+                                                     self.sinks.get(result.zip_file))
+                self.record_split(result, outcome)
+            except Exception as e:
+                self.record_split_error(result, member, e)
+
+        logger.info(f"PDF分割完了: {len(result.split_files)}個のファイルに分割")
+
+    def split_member_measured(self, zip_file, extract_path, member, sink=None):
+        """PDFメンバー1個を分割し、処理時間とバイト数を含む SplitOutcome を返す
+
+        sink を省略した場合、アーカイブ出力ではページを一時ファイルに書き込み、
+        SplitOutcome.spool・SplitOutcome.pages で返す（失敗した場合は一時ファイルを削除する）。
+        """
+        stats = {'bytes_read': 0, 'bytes_written': 0, 'bytes_saved': 0}
+        if self.dedup_enabled:
+            stats['fingerprints'] = []
+        if self.config.compact_images:
+            stats['compaction'] = []
+        if sink is None:
+            sink = self.page_sink(zip_file, extract_path)
+        start = time.perf_counter()
+        try:
+            split_files = self.split_member(zip_file, extract_path, member, stats, sink)
+        except BaseException:
+            if isinstance(sink, SpoolSink):
+                sink.discard()
+            raise
+        outcome = SplitOutcome(member, split_files, time.perf_counter() - start, **stats,
+                               pages_reported=self.progress is not None)
+        if isinstance(sink, SpoolSink):
+            sink.close()
+            outcome.spool, outcome.pages = sink.spool, sink.pages
+        return outcome
+
+    def page_sink(self, zip_file, extract_path):
+        """分割ページの出力先（アーカイブ出力ではアーカイブに追記するページを一時ファイルに書き込む）"""
+        if self.archive_output:
+            return SpoolSink(self.archive_path(zip_file, extract_path))
+        return FileSink(extract_path)
+
+    def split_member(self, zip_file, extract_path, member, stats=None, sink=None):
+        """ZIP内のPDFメンバー1個を分割（ストリーム分割またはディスク上のファイルを分割）"""
+        if sink is None:
+            sink = self.page_sink(zip_file, extract_path)
+        # 入れ子のZIPのPDFはディスクに解凍していないため、常にZIPから読み込む
+        if self.streaming or is_nested_member(member):
+            return self.split_zip_member(zip_file, member, sink, stats)
+        return self.split_single_pdf(extract_path / member, sink, stats, output_stem(member))
+
+    def split_zip_member(self, zip_file, member, sink, stats=None):
+        """ZIP内のPDFをディスクに解凍せずに分割
+
+        PDFはメモリ上に読み込み、spill_threshold を超える場合のみ一時ファイルに退避する。
+        省メモリモードでは大きさによらず常に一時ファイルに退避する。
+        """
+        try:
+            with self.open_zip_member(zip_file, member) as source, self.open_spool() as buffer:
+                shutil.copyfileobj(source, buffer, COPY_BUFSIZE)
+                if stats is not None:
+                    stats['bytes_read'] += buffer.tell()
+                buffer.seek(0)
+                return self.split_pdf_stream(buffer, output_stem(member), sink, stats)
+
+        except JobCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"PDF分割処理失敗: {str(e)}")
+
+    @contextmanager
+    def open_zip_member(self, zip_file, member):
+        """ZIP内のPDFを開く（入れ子のZIPのPDFは、スレッドごとに展開したまま残した入れ子のZIPから開く）"""
+        if is_nested_member(member):
+            nested = thread_nested_archives(zip_file, self.spool_limit)
+            with open_member(nested.zip_ref, member, nested=nested) as source:
+                yield source
+            return
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref, zip_ref.open(member) as source:
+            yield source
+
+    def split_single_pdf(self, pdf_file, sink, stats=None, stem=None):
+        """単一PDFを分割（元のPDFは record_split で台帳に記録してから削除する）
+
+        stem は出力先からの分割ページの相対パス（省略時はPDFのファイル名）。
+        """
+        try:
+            with open(pdf_file, 'rb') as file:
+                return self.split_pdf_stream(file, stem or pdf_file.stem, sink, stats)
+
+        except JobCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"PDF分割処理失敗: {str(e)}")
+
+    def remove_source(self, extract_path, member):
+        """分割が完了した元のPDFを削除（ストリーム分割ではディスクに解凍していないため何もしない）"""
+        if self.streaming or extract_path is None or is_nested_member(member):
+            return
+        try:
+            (extract_path / member).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"元のPDFを削除できません: {member}: {e}")
+
+    @property
+    def spool_limit(self):
+        """入れ子のZIPをメモリ上に読み込む上限（省メモリモードでは常に一時ファイル）"""
+        return 0 if self.config.low_memory else self.config.spill_threshold
+
+    def open_spool(self):
+        """ストリーム分割用のバッファ（省メモリモードでは常にディスク上の一時ファイル）"""
+        if self.config.low_memory:
+            return tempfile.TemporaryFile()
+        return tempfile.SpooledTemporaryFile(max_size=self.config.spill_threshold)
+
+    def split_pdf_stream(self, stream, stem, sink, stats=None):
+        """PDFストリームを分割方法（config.strategy）に従って {stem}_page_NNN.pdf として出力先（sink）に分割
+
+        複数ページをまとめたファイルは {stem}_page_NNN-MMM.pdf とする。
+        省メモリモードでは page_window ページごとにリーダーを作り直し、
+        読み込み済みオブジェクトのキャッシュを破棄してメモリ使用量を文書サイズによらず一定に保つ。
+        """
+        from PyPDF2 import PdfReader, PdfWriter
+        from .images import PageImageCompactor
+        from .resources import SharedResourceOptimizer, page_fingerprint
+
+        split_files = []
+        window = self.config.page_window if self.config.low_memory else 0
+        strategy = self.config.strategy
+        reader = PdfReader(stream)
+        total_pages = len(reader.pages)
+        groups = strategy.groups(total_pages, lambda: self.extract_page_texts(stream, reader, window))
+        if strategy.needs_text and window:
+            # テキストの抽出で読み込んだページを破棄してから分割する
+            reader = None
+            gc.collect()
+            reader = PdfReader(stream)
+        optimizer = SharedResourceOptimizer(reader) if self.config.optimize_resources else None
+        compactor = (PageImageCompactor(reader, self.config.image_dpi, self.config.jpeg_quality)
+                     if self.config.compact_images else None)
+        fingerprints = stats.get('fingerprints') if stats is not None else None
+        compaction = stats.get('compaction') if stats is not None else None
+        loaded_at = 0
+
+        # ページの書き込みは書き込み段階に渡し、次のページの分割と並行して行う
+        with PageWriter(sink, self.config.write_workers) as page_writer:
+            for start, end in groups:
+                self.check_cancelled()
+                if window and start - loaded_at >= window:
+                    # PyPDF2 のオブジェクトは循環参照を持つため明示的に回収する
+                    reader = None
+                    gc.collect()
+                    reader = PdfReader(stream)
+                    loaded_at = start
+                    if optimizer is not None:
+                        optimizer.reset(reader)
+                    if compactor is not None:
+                        compactor.reset(reader)
+
+                writer = PdfWriter()
+                pages = [reader.pages[page_num] for page_num in range(start, end)]
+                page_fingerprints = []
+                for page in pages:
+                    # 描画内容のハッシュは最適化（未使用リソース除去・再圧縮・画像圧縮）の前に計算する
+                    if fingerprints is not None:
+                        page_fingerprints.append(page_fingerprint(page))
+                    if optimizer is not None:
+                        optimizer.optimize_page(page)
+                # 画像はページを追加する前に差し替える（使われていない画像は共有リソース最適化で除去済み）
+                image_saved = compactor.compact_pages(pages) if compactor is not None else 0
+                for page in pages:
+                    writer.add_page(page)
+                buffer = io.BytesIO()
+                writer.write(buffer)
+
+                # 出力ファイル名を生成
+                page_filename = output_name(stem, start, end)
+                output_path = sink.path(page_filename)
+
+                # ファイル出力では一時ファイルに書き込んでから置き換え、途中で終了しても壊れたページを残さない
+                page_writer.write(page_filename, buffer.getvalue())
+                if stats is not None:
+                    stats['bytes_written'] += buffer.tell()
+                if compaction is not None:
+                    compaction.append({'path': str(output_path), 'bytes_before': buffer.tell() + image_saved,
+                                       'bytes_after': buffer.tell()})
+                if fingerprints is not None:
+                    # 複数ページのファイルはページごとのハッシュをまとめて1個にする
+                    fingerprint = (page_fingerprints[0] if len(page_fingerprints) == 1
+                                   else hashlib.sha256(b"".join(page_fingerprints)).digest())
+                    fingerprints.append((fingerprint, hashlib.sha256(buffer.getbuffer()).digest()))
+
+                split_files.append(output_path)
+                if self.progress is not None:
+                    self.progress.pages()
+
+        if optimizer is not None:
+            if stats is not None:
+                stats['bytes_saved'] += optimizer.bytes_saved
+            logger.debug(f"共有リソース最適化 ({stem}): 未使用リソース除去 {optimizer.pruned_count}件, "
+                         f"ストリーム圧縮 {optimizer.compressed_count}件, 推定削減 {optimizer.bytes_saved / 1024:.1f}KB")
+        if compactor is not None:
+            logger.debug(f"画像圧縮 ({stem}): 縮小 {compactor.downsampled_count}件, "
+                         f"可逆圧縮 {compactor.recompressed_count}件, 推定削減 {compactor.bytes_saved / 1024:.1f}KB")
+        if len(groups) != total_pages:
+            logger.debug(f"分割 ({stem}): {total_pages}ページ → {len(groups)}ファイル（{strategy.describe()}）")
+
+        return split_files
+
+    def extract_page_texts(self, stream, reader, window=0):
+        """全ページのテキスト（区切りの検出用。キャッシュにあるページは抽出しない）"""
+        from PyPDF2 import PdfReader
+
+        def pages():
+            nonlocal reader
+            for page_num in range(len(reader.pages)):
+                self.check_cancelled()
+                if window and page_num and page_num % window == 0:
+                    reader = None
+                    gc.collect()
+                    reader = PdfReader(stream)
+                yield reader.pages[page_num]
+
+        with self.open_text_cache() as cache:
+            return page_texts(pages(), cache)
+
+    @contextmanager
+    def open_text_cache(self):
+        """ページのテキストのキャッシュを開く（開けない場合は None を返し、キャッシュせずに抽出する）"""
+        path = self.config.strategy.text_cache or default_text_cache_path()
+        try:
+            cache = PageTextCache(path)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"テキストキャッシュを開けません（キャッシュせずに抽出します）: {path}: {e}")
+            yield None
+            return
+        try:
+            yield cache
+        finally:
+            logger.debug(f"テキストキャッシュ: ヒット {cache.hits}件, 抽出 {cache.misses}件")
+            cache.close()
+
+    def cleanup_previous_files(self, folder_path, stems):
+        """前回の分割ファイルと書き込み途中の一時ファイルを削除（このZIPに含まれるPDFの分のみ）"""
+        try:
+            deleted_files = []
+            for stem in stems:
+                # サブフォルダ・入れ子のZIPのPDF（stem が「sub/a」など）はそのフォルダの中を探す
+                folder, name = folder_path / Path(stem).parent, glob.escape(Path(stem).name)
+                deleted_files.extend(folder.glob(f"{name}_page_*.pdf"))
+                deleted_files.extend(folder.glob(f".{name}_page_*.tmp"))
+
+            for pdf_file in deleted_files:
+                pdf_file.unlink()
+
+            if deleted_files:
+                logger.info(f"前回ファイル削除: {len(deleted_files)}個")
+
+        except Exception as e:
+            logger.error(f"前回ファイル削除エラー: {e}")
@@ -0,0 +1,296 @@
+"""ZIPの解凍計画と一括解凍（解凍先の既存ファイルはフォルダ単位の scandir で索引化して照合する）"""
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import List
+from zipfile import ZipInfo
+
+from .sinks import is_page_archive
+
+COPY_BUFSIZE = 1024 * 1024
+WINDOWS_INVALID_CHARS = re.compile(r'[:<>|"?*]')
+
+# ZIP内のZIP（入れ子のアーカイブ）のメンバー名の区切り（例: inner.zip!/statement.pdf）
+NESTED_SEPARATOR = '!/'
+DEFAULT_MAX_DEPTH = 3  # サブフォルダ・入れ子のアーカイブをたどる深さの上限
+DEFAULT_NESTED_LIMIT = 512 * 1024 * 1024  # 展開する入れ子のアーカイブ1個のサイズの上限
+NESTED_CACHE_SIZE = 4  # 展開したまま再利用する入れ子のアーカイブの数（外側のZIP1個あたり）
+
+
+def member_path(filename):
+    """メンバー名を解凍先からの相対パスに変換（zipfile.extract と同じく絶対パス・「..」・ドライブ名を除く）
+
+    解凍先の外を指すだけのメンバーは空文字列を返す。
+    """
+    arcname = filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [part for part in arcname.split(os.path.sep) if part not in ('', os.path.curdir, os.path.pardir)]
+    if os.path.sep == '\\':
+        # Windows で使えない文字は zipfile.extract と同じく「_」に置き換える
+        parts = [WINDOWS_INVALID_CHARS.sub('_', part).rstrip('.') for part in parts]
+        parts = [part for part in parts if part]
+    return os.path.join(*parts) if parts else ''
+
+
+def is_split_target(name):
+    """分割対象のPDFのファイル名か（既に分割されたページは除く）"""
+    path = PurePosixPath(name)
+    return path.suffix.lower() == '.pdf' and "_page_" not in path.stem
+
+
+def is_nested_archive(name):
+    """展開してPDFを探す入れ子のZIPか（分割ページのアーカイブは除く）"""
+    return name.lower().endswith('.zip') and not is_page_archive(name)
+
+
+def is_nested_member(member):
+    """入れ子のアーカイブ内のメンバーか（ディスクに解凍されないため、常にZIPから直接読み込む）"""
+    return NESTED_SEPARATOR in member
+
+
+def output_stem(member):
+    """分割ページのファイル名の元になる出力先からの相対パス（拡張子なし、区切りは「/」）
+
+    ZIP直下の statement.pdf は「statement」、サブフォルダの 2024/03/statement.pdf は「2024/03/statement」、
+    入れ子のアーカイブの inner.zip!/statement.pdf は「inner/statement」とする。
+    """
+    # 解凍と同じく絶対パス・「..」を除き、出力先の外に書き込まない
+    parts = [Path(member_path(part)).as_posix() for part in member.split(NESTED_SEPARATOR)]
+    # 入れ子のアーカイブは拡張子を除いたフォルダとして出力する
+    folders = [str(PurePosixPath(part).with_suffix('')) for part in parts[:-1]]
+    path = PurePosixPath(*folders, parts[-1])
+    return str(path.with_name(path.stem))
+
+
+def spool_file(limit):
+    """入れ子のアーカイブを読み込むバッファ（limit までメモリ上、超えたら一時ファイル。0 なら常に一時ファイル）"""
+    if limit <= 0:
+        return tempfile.TemporaryFile()
+    return tempfile.SpooledTemporaryFile(max_size=limit)
+
+
+class NestedArchives:
+    """外側のZIP1個の入れ子のZIPを、展開したまま再利用する
+
+    同じ入れ子のZIPにある複数のPDFを読むときに、入れ子のZIPを毎回展開し直さない。
+    最近使った size 個までを開いたままにし（外側からのパスごと）、close() で一時ファイルを削除する。
+    外側のZIP（zip_ref）は閉じない。
+    """
+
+    def __init__(self, zip_ref, spool_limit=COPY_BUFSIZE * 64, size=NESTED_CACHE_SIZE):
+        self.zip_ref = zip_ref
+        self.spool_limit = spool_limit
+        self.size = size
+        self.archives = OrderedDict()  # 入れ子のZIPのパス（外側から順） -> (ZipFile, バッファ)
+        self.expanded = 0  # 入れ子のZIPを展開した回数
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self, archives):
+        """入れ子のZIPのパス（外側から順）の最も内側の ZipFile（空なら外側のZIP）"""
+        archives = tuple(archives)
+        if not archives:
+            return self.zip_ref
+        entry = self.archives.get(archives)
+        if entry is not None:
+            self.archives.move_to_end(archives)
+            return entry[0]
+
+        parent = self.open(archives[:-1])
+        buffer = spool_file(self.spool_limit)
+        try:
+            with parent.open(archives[-1]) as source:
+                shutil.copyfileobj(source, buffer, COPY_BUFSIZE)
+            nested = zipfile.ZipFile(buffer)
+        except BaseException:
+            buffer.close()
+            raise
+        self.expanded += 1
+        self.archives[archives] = (nested, buffer)
+        while len(self.archives) > self.size:
+            _, (evicted, evicted_buffer) = self.archives.popitem(last=False)
+            evicted.close()
+            evicted_buffer.close()
+        return nested
+
+    def close(self):
+        while self.archives:
+            _, (nested, buffer) = self.archives.popitem()
+            nested.close()
+            buffer.close()
+
+
+def iter_pdf_targets(zip_ref, recursive=False, max_depth=DEFAULT_MAX_DEPTH, nested_limit=DEFAULT_NESTED_LIMIT,
+                     spool_limit=COPY_BUFSIZE * 64, nested=None):
+    """分割対象となるPDFの (メンバー名, 展開後サイズ) を格納順に返す
+
+    recursive=False ならZIP直下のPDFのみ。recursive=True ならサブフォルダのPDFと、
+    max_depth 階層までの入れ子のZIP（nested_limit 以下のもの）の中のPDFも対象にする。
+    入れ子のZIPは spool_limit まではメモリ上に読み込み、ディスクには解凍しない。
+    nested（NestedArchives）を渡すと、展開した入れ子のZIPを分割時に再利用できるよう開いたまま残す。
+    """
+    with ExitStack() as stack:
+        if nested is None:
+            nested = stack.enter_context(NestedArchives(zip_ref, spool_limit))
+        yield from _iter_pdf_targets(nested, (), recursive, max_depth, nested_limit)
+
+
+def _iter_pdf_targets(nested, archives, recursive, max_depth, nested_limit):
+    prefix = ''.join(archive + NESTED_SEPARATOR for archive in archives)
+    for info in nested.open(archives).infolist():
+        name = info.filename
+        if info.is_dir():
+            continue
+        if not recursive and '/' in name:
+            continue
+        if is_split_target(name):
+            yield prefix + name, info.file_size
+        elif (recursive and is_nested_archive(name) and len(archives) < max_depth
+              and info.file_size <= nested_limit):
+            try:
+                nested.open(archives + (name,))
+            except zipfile.BadZipFile:
+                # ZIPとして読めないファイルはそのまま解凍するだけにする
+                continue
+            yield from _iter_pdf_targets(nested, archives + (name,), recursive, max_depth, nested_limit)
+
+
+def pdf_targets(zip_ref, recursive=False, **limits):
+    """分割対象となるPDFのメンバー名の一覧（既定ではZIP直下のPDFのみ）"""
+    return [member for member, _ in iter_pdf_targets(zip_ref, recursive, **limits)]
+
+
+@contextmanager
+def open_member(zip_ref, member, spool_limit=COPY_BUFSIZE * 64, nested=None):
+    """メンバーを読み込み用に開く（入れ子のアーカイブ内のメンバーは外側から順に展開して開く）
+
+    nested（zip_ref の NestedArchives）を渡すと、展開済みの入れ子のZIPを再利用する。
+    """
+    *archives, name = member.split(NESTED_SEPARATOR)
+    with ExitStack() as stack:
+        if nested is None:
+            nested = stack.enter_context(NestedArchives(zip_ref, spool_limit))
+        yield stack.enter_context(nested.open(archives).open(name))
+
+
+class DestinationIndex:
+    """解凍先の既存ファイル・フォルダの索引
+
+    照合するメンバーのフォルダだけを、フォルダごとに os.scandir で1回読み込む（メンバーごとの stat を行わない）。
+    親フォルダにないフォルダは読み込まずに存在しないと判定する。
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.listings = {}  # 相対フォルダ → フォルダ内の名前（os.path.normcase 済み）、存在しない場合は None
+        self.scan_count = 0
+
+    def listing(self, rel_dir):
+        if rel_dir in self.listings:
+            return self.listings[rel_dir]
+        names = None
+        # 親フォルダにないフォルダは読み込まない
+        if not rel_dir or self.exists(rel_dir):
+            try:
+                with os.scandir(self.root / rel_dir) as entries:
+                    names = {os.path.normcase(entry.name) for entry in entries}
+                self.scan_count += 1
+            except (FileNotFoundError, NotADirectoryError):
+                names = None
+        self.listings[rel_dir] = names
+        return names
+
+    def exists(self, rel_path):
+        rel_dir, name = os.path.split(rel_path)
+        names = self.listing(rel_dir)
+        return names is not None and os.path.normcase(name) in names
+
+
+@dataclass
+class ExtractionPlan:
+    """解凍前の見積もり（書き込むメンバーとスキップする既存のメンバー）"""
+    to_write: List[ZipInfo] = field(default_factory=list)
+    skipped: List[ZipInfo] = field(default_factory=list)
+    elapsed: float = 0.0  # 計画にかかった時間（秒）
+    scan_count: int = 0   # 解凍先で読み込んだフォルダ数
+
+    @property
+    def bytes_to_write(self):
+        return sum(info.file_size for info in self.to_write if not info.is_dir())
+
+    @property
+    def bytes_skipped(self):
+        return sum(info.file_size for info in self.skipped if not info.is_dir())
+
+    def to_dict(self):
+        return {
+            'write_count': len(self.to_write),
+            'skip_count': len(self.skipped),
+            'bytes_to_write': self.bytes_to_write,
+            'bytes_skipped': self.bytes_skipped,
+            'folders_scanned': self.scan_count,
+            'elapsed_ms': round(self.elapsed * 1000, 3),
+        }
+
+
+def plan_extraction(zip_ref, extract_path, overwrite=True, exclude=frozenset()):
+    """開いたZIPファイルの解凍計画を作成（ファイルは変更しない）
+
+    overwrite=False の場合は解凍先の索引と照合し、既に存在するメンバーをスキップする。
+    書き込むメンバーはZIP内の格納順に並べ、ZIPファイルを先頭から順に読めるようにする。
+    """
+    start = time.perf_counter()
+    index = None if overwrite else DestinationIndex(extract_path)
+    plan = ExtractionPlan()
+    for info in zip_ref.infolist():
+        if info.filename in exclude:
+            continue
+        rel_path = member_path(info.filename)
+        if not rel_path:
+            continue
+        if index is not None and index.exists(rel_path):
+            plan.skipped.append(info)
+        else:
+            plan.to_write.append(info)
+    plan.to_write.sort(key=lambda info: info.header_offset)
+    plan.scan_count = index.scan_count if index is not None else 0
+    plan.elapsed = time.perf_counter() - start
+    return plan
+
+
+def extract_batch(zip_ref, extract_path, infos, check_cancelled=None):
+    """メンバーをまとめて解凍（フォルダは1回だけ作成し、メンバーごとの存在確認は行わない）
+
+    check_cancelled はメンバーごとに呼び、中止する場合は例外を送出する。
+    """
+    extract_path = os.fspath(extract_path)
+    created = set()
+    for info in infos:
+        if check_cancelled is not None:
+            check_cancelled()
+        target = os.path.join(extract_path, member_path(info.filename))
+        folder = target if info.is_dir() else os.path.dirname(target)
+        if folder not in created:
+            os.makedirs(folder, exist_ok=True)
+            created.add(folder)
+        if info.is_dir():
+            continue
+        with zip_ref.open(info) as source, open(target, 'wb') as dest:
+            if info.file_size <= COPY_BUFSIZE:
+                # 小さなメンバーは1回で読み書きする（コピー用バッファを確保しない）
+                dest.write(source.read())
+            else:
+                shutil.copyfileobj(source, dest, COPY_BUFSIZE)
@@ -0,0 +1,222 @@
+"""分割ページの画像圧縮
+
+スキャンした明細（300〜600dpi）は画像がページの大半を占め、1ページずつに分割しても出力は元のPDFと同じ容量になる。
+ここでは各ページが参照する画像（XObject）について
+
+* 非圧縮・FlateDecode の画像を最大の圧縮レベルで可逆圧縮し直し
+* target_dpi を指定した場合は、それを超える解像度の画像を縮小して JPEG で圧縮し直す（Pillow が必要）
+
+画像は PDF（PdfReader）1個につき共有オブジェクトごとに1回だけ処理し、以降のページでは処理済みのオブジェクトを再利用する。
+元より小さくならない場合は元の画像のまま出力する。
+"""
+import importlib.util
+import io
+import logging
+import zlib
+
+from PyPDF2.generic import ArrayObject, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject, NumberObject
+
+from .logs import PER_PAGE
+from .resources import stream_size
+
+logger = logging.getLogger(__name__)
+
+# Pillow は任意（未インストールの場合は可逆圧縮のみ行う）
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# 解像度が target_dpi をこの倍率より超える画像だけ縮小する（わずかな縮小で画質を落とさない）
+DOWNSAMPLE_MARGIN = 1.2
+# これより小さい画像は圧縮し直しても効果が薄い
+MIN_IMAGE_SIZE = 1024
+# 縮小に対応する色空間（8ビットのグレー・RGB）と Pillow のモード
+PIL_MODES = {'/DeviceGray': 'L', '/DeviceRGB': 'RGB'}
+
+
+def image_filters(obj):
+    """画像ストリームのフィルター名の一覧"""
+    filters = obj.get('/Filter')
+    if filters is None:
+        return []
+    filters = filters.get_object()
+    if isinstance(filters, ArrayObject):
+        return [str(name) for name in filters]
+    return [str(filters)]
+
+
+def copy_stream(obj, excluded):
+    """excluded 以外のキーを引き継いだ空の画像ストリーム"""
+    stream = EncodedStreamObject()
+    for name, value in obj.items():
+        if name not in excluded:
+            stream[NameObject(name)] = value
+    return stream
+
+
+class PageImageCompactor:
+    """PDF1個（PdfReader）ごとのページ画像の圧縮"""
+
+    def __init__(self, reader, target_dpi, jpeg_quality):
+        # Pillow がない場合は縮小せず、可逆圧縮のみ行う
+        self.target_dpi = target_dpi if PIL_AVAILABLE else 0
+        self.jpeg_quality = jpeg_quality
+        self.reset(reader)
+        self.bytes_saved = 0   # 推定削減バイト数（出力ファイルごとの合計）
+        self.recompressed_count = 0
+        self.downsampled_count = 0
+
+    def reset(self, reader):
+        """同じPDFを読み直したリーダーに切り替える（集計値は引き継ぐ）"""
+        self.reader = reader
+        self.checked = set()   # 処理済みの画像 (generation, idnum)
+        self.savings = {}      # 圧縮し直した画像 -> 削減バイト数
+
+    def compact_pages(self, pages):
+        """出力ファイル1個分のページの画像を書き出す前に圧縮し、推定削減バイト数を返す
+
+        同じファイル内で共有される画像は1回だけ書き出されるため、1回だけ数える。
+        """
+        saved = {}
+        for page in pages:
+            for key, obj in self.iter_images(page):
+                if key not in self.checked:
+                    self.checked.add(key)
+                    self.compact_image(key, obj, page)
+                saved[key] = self.savings.get(key, 0)
+        total = sum(saved.values())
+        self.bytes_saved += total
+        return total
+
+    @staticmethod
+    def iter_images(page):
+        """ページから参照される画像を (キー, オブジェクト) で列挙（フォーム XObject の中も辿る）"""
+        seen = set()
+        stack = [page.get('/Resources')]
+        while stack:
+            resources = stack.pop()
+            resources = resources.get_object() if resources is not None else None
+            xobjects = resources.get('/XObject') if isinstance(resources, DictionaryObject) else None
+            if xobjects is None:
+                continue
+            for ref in xobjects.get_object().values():
+                if not isinstance(ref, IndirectObject):
+                    continue
+                key = (ref.generation, ref.idnum)
+                if key in seen:
+                    continue
+                seen.add(key)
+                obj = ref.get_object()
+                subtype = obj.get('/Subtype')
+                if subtype == '/Image':
+                    yield key, obj
+                elif subtype == '/Form':
+                    stack.append(obj.get('/Resources'))
+
+    def compact_image(self, key, obj, page):
+        """画像を縮小または可逆圧縮した版に差し替える（PdfReader のキャッシュを置き換える）"""
+        original_size = stream_size(obj)
+        if original_size < MIN_IMAGE_SIZE:
+            return
+
+        scale = self.downsample_scale(obj, page)
+        candidates = [(self.downsample(obj, scale) if scale < 1 else None, True), (self.recompress(obj), False)]
+        candidates = [(stream, downsampled) for stream, downsampled in candidates if stream is not None]
+        if not candidates:
+            return
+        # 文字中心のスキャンなどは縮小した JPEG より元の解像度の可逆圧縮のほうが小さい場合がある
+        replacement, downsampled = min(candidates, key=lambda candidate: len(candidate[0]._data))
+        if len(replacement._data) >= original_size:
+            return
+
+        generation, idnum = key
+        self.reader.resolved_objects[key] = replacement
+        replacement.indirect_reference = IndirectObject(idnum, generation, self.reader)
+        self.savings[key] = original_size - len(replacement._data)
+        if downsampled:
+            self.downsampled_count += 1
+        else:
+            self.recompressed_count += 1
+
+    def downsample_scale(self, obj, page):
+        """画像を target_dpi にする縮小率（縮小しない場合は 1）
+
+        画像の表示サイズはコンテンツストリームを解釈しないと分からないため、ページ全体に表示されるものとして
+        解像度を見積もる（小さく表示されるロゴなどは解像度を低く見積もるため、縮小しすぎない）。
+        """
+        if not self.target_dpi:
+            return 1.0
+        try:
+            width, height = int(obj.get('/Width', 0)), int(obj.get('/Height', 0))
+            page_width, page_height = float(page.mediabox.width), float(page.mediabox.height)
+        except (TypeError, ValueError):
+            return 1.0
+        if width <= 0 or height <= 0 or page_width <= 0 or page_height <= 0:
+            return 1.0
+        dpi = max(width * 72 / page_width, height * 72 / page_height)
+        if dpi <= self.target_dpi * DOWNSAMPLE_MARGIN:
+            return 1.0
+        return self.target_dpi / dpi
+
+    def downsample(self, obj, scale):
+        """画像を縮小して圧縮し直したストリーム（対応しない形式の場合は None）
+
+        8ビットのグレー・RGB で、JPEG・FlateDecode・非圧縮のもののみ対象とし、
+        マスク・色の変換（/Decode）を伴う画像は色が変わらないよう縮小しない。
+        縮小した画像は JPEG と FlateDecode のうち小さいほうで圧縮する（元が JPEG の場合は JPEG のみ）。
+        """
+        from PIL import Image
+
+        color_space = obj.get('/ColorSpace')
+        mode = PIL_MODES.get(str(color_space.get_object())) if color_space is not None else None
+        if (mode is None or obj.get('/BitsPerComponent') != 8 or obj.get('/ImageMask')
+                or '/Decode' in obj or '/Mask' in obj):
+            return None
+        filters = image_filters(obj)
+        width, height = int(obj['/Width']), int(obj['/Height'])
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        try:
+            if filters == ['/DCTDecode']:
+                image = Image.open(io.BytesIO(obj._data))
+                if image.mode != mode:
+                    # CMYK・Adobe 形式の JPEG などは色が変わるため対象外
+                    return None
+                # JPEG は縮小後の大きさに近い解像度で復号する（大きなスキャン画像の復号を速くする）
+                image.draft(mode, size)
+            elif filters in ([], ['/FlateDecode']):
+                image = Image.frombytes(mode, (width, height), obj.get_data())
+            else:
+                return None
+            image = image.resize(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=self.jpeg_quality, optimize=True)
+        except Exception as e:
+            logger.debug(f"画像を縮小できません（可逆圧縮のみ行います）: {e}", extra=PER_PAGE)
+            return None
+
+        data, filter_name = buffer.getvalue(), '/DCTDecode'
+        if filters != ['/DCTDecode']:
+            flate = zlib.compress(image.tobytes(), 9)
+            if len(flate) < len(data):
+                data, filter_name = flate, '/FlateDecode'
+        stream = copy_stream(obj, ('/Length', '/Filter', '/DecodeParms', '/Width', '/Height'))
+        stream[NameObject('/Width')] = NumberObject(size[0])
+        stream[NameObject('/Height')] = NumberObject(size[1])
+        stream[NameObject('/Filter')] = NameObject(filter_name)
+        stream._data = data
+        return stream
+
+    @staticmethod
+    def recompress(obj):
+        """非圧縮・FlateDecode の画像を最大の圧縮レベルで圧縮し直したストリーム（対象外の場合は None）"""
+        filters = image_filters(obj)
+        if filters not in ([], ['/FlateDecode']):
+            # JPEG・JBIG2・CCITT などは既に画像向けの圧縮がされている
+            return None
+        try:
+            data = obj.get_data()
+        except Exception as e:
+            logger.debug(f"画像を展開できません: {e}", extra=PER_PAGE)
+            return None
+        stream = copy_stream(obj, ('/Length', '/Filter', '/DecodeParms'))
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+        stream._data = zlib.compress(data, 9)
+        return stream
@@ -0,0 +1,304 @@
+"""共有ジョブキュー（SQLite）: サービスモードで受け付けたZIPを複数のワーカーに配る
+
+ジョブはZIP1個単位で、ワーカーはキューから1件ずつ取り出して（リース）処理する。
+リースは処理中に定期的に延長し、期限切れのジョブ（ワーカーのプロセス・ホストが停止した場合）は別のワーカーが取り直す。
+同じマシンのワーカーはキューのファイルを直接開き、別のホストのワーカーはサービスの HTTP API 経由で取り出す。
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .ledger import now_text, path_key
+from .paths import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+QUEUE_NAME = "queue.sqlite3"
+QUEUE_VERSION = 1
+DEFAULT_LEASE = 60.0  # リースの期限（秒）。ワーカーは処理中に定期的に延長する
+MAX_ATTEMPTS = 3      # リース切れで取り直す回数の上限（超えたらエラーとする）
+
+# ジョブの状態
+TASK_QUEUED = 'queued'
+TASK_RUNNING = 'running'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'        # エラーのあるPDF・ZIPがある、またはワーカーの停止が続いた
+TASK_CANCELLED = 'cancelled'
+TASK_STATES = (TASK_QUEUED, TASK_RUNNING, TASK_DONE, TASK_FAILED, TASK_CANCELLED)
+FINISHED_STATES = (TASK_DONE, TASK_FAILED, TASK_CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch TEXT,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL,
+    output_dir TEXT,
+    options TEXT NOT NULL,
+    submitted_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id);
+"""
+
+COLUMNS = ("id, batch, status, source, output_dir, options, submitted_at, started_at, finished_at, "
+           "worker, lease_until, attempts, cancel_requested, result, error")
+
+
+def default_queue_path():
+    """既定のジョブキューのファイル"""
+    return default_cache_dir() / "service" / QUEUE_NAME
+
+
+@dataclass
+class QueueTask:
+    """キューのジョブ1件（ZIP1個分）"""
+    id: int
+    status: str
+    source: Path                 # 処理するZIP（アップロードされたZIPはサービスの保存先）
+    output_dir: Optional[Path] = None
+    options: dict = field(default_factory=dict)  # ジョブ設定の上書き（JobConfig の項目）
+    batch: Optional[str] = None  # 同時に投入したジョブのまとまり（フォルダ指定など）
+    submitted_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    worker: Optional[str] = None
+    lease_until: Optional[float] = None
+    attempts: int = 0
+    cancel_requested: bool = False
+    result: Optional[dict] = None  # ZipResult.to_dict()
+    error: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row):
+        (task_id, batch, status, source, output_dir, options, submitted_at, started_at, finished_at,
+         worker, lease_until, attempts, cancel_requested, result, error) = row
+        return cls(task_id, status, Path(source), Path(output_dir) if output_dir else None,
+                   json.loads(options or '{}'), batch, submitted_at, started_at, finished_at,
+                   worker, lease_until, attempts, bool(cancel_requested),
+                   json.loads(result) if result else None, error)
+
+    @classmethod
+    def from_dict(cls, data):
+        """to_dict() の内容から復元（HTTP API 経由で取り出したジョブ）"""
+        return cls(data['id'], data['status'], Path(data['source']),
+                   Path(data['output_dir']) if data.get('output_dir') else None,
+                   data.get('options') or {}, data.get('batch'), data.get('submitted_at'),
+                   data.get('started_at'), data.get('finished_at'), data.get('worker'),
+                   data.get('lease_until'), data.get('attempts', 0), data.get('cancel_requested', False),
+                   data.get('result'), data.get('error'))
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'batch': self.batch,
+            'status': self.status,
+            'source': str(self.source),
+            'output_dir': str(self.output_dir) if self.output_dir else None,
+            'options': dict(self.options),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'worker': self.worker,
+            'lease_until': self.lease_until,
+            'attempts': self.attempts,
+            'cancel_requested': self.cancel_requested,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobQueue:
+    """ジョブキュー
+
+    WAL モードで開き、同じマシンの複数のプロセス（サービス・ワーカー）が同時に読み書きできる。
+    取り出しは書き込みロックを取ってから行うため、同じジョブを2個のワーカーが取ることはない。
+    サービスの要求処理スレッド・ワーカースレッドで1個の接続を共有するため、接続の使用はロックで1件ずつ行う。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.migrate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, QUEUE_VERSION):
+            raise sqlite3.DatabaseError(f"未対応のジョブキューのバージョンです: {version}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version={QUEUE_VERSION}")
+
+    def transaction(self):
+        """書き込みロックを取ったトランザクション（BEGIN IMMEDIATE）"""
+        return _Transaction(self.conn, self.lock)
+
+    def submit(self, sources, options=None, batch=None, output_root=None):
+        """ZIP群をジョブとして投入し、投入したジョブの一覧を返す
+
+        output_root を指定した場合、各ジョブの出力先は output_root/{ジョブID} とする。
+        """
+        timestamp = now_text()
+        options_text = json.dumps(options or {}, ensure_ascii=False, default=str)
+        ids = []
+        with self.transaction():
+            for source in sources:
+                cursor = self.conn.execute(
+                    "INSERT INTO tasks (batch, status, source, options, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                    (batch, TASK_QUEUED, path_key(source), options_text, timestamp))
+                task_id = cursor.lastrowid
+                if output_root is not None:
+                    self.conn.execute("UPDATE tasks SET output_dir = ? WHERE id = ?",
+                                      (path_key(Path(output_root) / str(task_id)), task_id))
+                ids.append(task_id)
+        return [self.get(task_id) for task_id in ids]
+
+    def claim(self, worker, lease=DEFAULT_LEASE):
+        """次のジョブを取り出して worker に割り当てる（ない場合は None）
+
+        待機中のジョブと、リースが切れた実行中のジョブを投入順に取り出す。
+        取り直しが MAX_ATTEMPTS 回を超えたジョブはエラーにする。
+        """
+        now = time.time()
+        with self.transaction():
+            while True:
+                row = self.conn.execute(
+                    f"SELECT {COLUMNS} FROM tasks WHERE status = ? OR (status = ? AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1", (TASK_QUEUED, TASK_RUNNING, now)).fetchone()
+                if row is None:
+                    return None
+                task = QueueTask.from_row(row)
+                if task.status == TASK_RUNNING:
+                    logger.warning(f"ジョブ {task.id} のリースが切れました（ワーカー: {task.worker}）")
+                    if task.cancel_requested or task.attempts >= MAX_ATTEMPTS:
+                        status = TASK_CANCELLED if task.cancel_requested else TASK_FAILED
+                        error = None if task.cancel_requested else f"ワーカーが {task.attempts}回停止しました"
+                        self.conn.execute(
+                            "UPDATE tasks SET status = ?, error = ?, finished_at = ?, worker = NULL, "
+                            "lease_until = NULL WHERE id = ?", (status, error, now_text(), task.id))
+                        continue
+                self.conn.execute(
+                    "UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, "
+                    "started_at = ? WHERE id = ?", (TASK_RUNNING, worker, now + lease, now_text(), task.id))
+                break
+        return self.get(task.id)
+
+    def heartbeat(self, task_id, worker, lease=DEFAULT_LEASE):
+        """リースを延長し、中止が要求されているかを返す
+
+        リースを失っている（期限切れで別のワーカーが取り直した）場合は LookupError。
+        """
+        with self.transaction():
+            row = self.conn.execute("SELECT cancel_requested FROM tasks WHERE id = ? AND status = ? AND worker = ?",
+                                    (task_id, TASK_RUNNING, worker)).fetchone()
+            if row is None:
+                raise LookupError(f"ジョブ {task_id} のリースがありません")
+            self.conn.execute("UPDATE tasks SET lease_until = ? WHERE id = ?", (time.time() + lease, task_id))
+        return bool(row[0])
+
+    def finish(self, task_id, worker, status, result=None, error=None):
+        """worker が処理したジョブの結果を記録（リースを失っていた場合は記録せず False）"""
+        if status not in FINISHED_STATES:
+            raise ValueError(f"終了状態ではありません: {status}")
+        with self.transaction():
+            cursor = self.conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 error, now_text(), task_id, TASK_RUNNING, worker))
+        return cursor.rowcount > 0
+
+    def release(self, task_id, worker):
+        """ワーカーの停止時に、処理中のジョブを待機中に戻す（取り直しの回数には数えない）"""
+        with self.transaction():
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND status = ? AND worker = ?", (TASK_QUEUED, task_id, TASK_RUNNING, worker))
+
+    def cancel(self, task_id):
+        """ジョブの中止を要求（待機中なら即座に中止、実行中ならワーカーが次のリース延長で中止する）"""
+        with self.transaction():
+            self.conn.execute("UPDATE tasks SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                              (TASK_CANCELLED, now_text(), task_id, TASK_QUEUED))
+            self.conn.execute("UPDATE tasks SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                              (task_id, TASK_RUNNING))
+        return self.get(task_id)
+
+    def get(self, task_id):
+        with self.lock:
+            row = self.conn.execute(f"SELECT {COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return QueueTask.from_row(row) if row else None
+
+    def list_tasks(self, status=None, batch=None, limit=100):
+        """新しい順のジョブ一覧"""
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if batch:
+            conditions.append("batch = ?")
+            params.append(batch)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {COLUMNS} FROM tasks {where} ORDER BY id DESC LIMIT ?",
+                                     (*params, int(limit))).fetchall()
+        return [QueueTask.from_row(row) for row in rows]
+
+    def counts(self):
+        """状態ごとのジョブ数"""
+        counts = {status: 0 for status in TASK_STATES}
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        for status, count in rows:
+            counts[status] = count
+        return counts
+
+
+class _Transaction:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
@@ -0,0 +1,274 @@
+"""ジョブ台帳（SQLite）: ZIP・PDFごとの処理状況を記録し、中断したジョブを途中から再開する"""
+import json
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .paths import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+LEDGER_NAME = "jobs.sqlite3"
+LEDGER_VERSION = 1
+RETENTION_DAYS = 30  # 完了したジョブの記録を残す日数
+
+# ジョブの状態
+JOB_RUNNING = 'running'        # 実行中（プロセスが終了した場合もこのまま残る）
+JOB_INCOMPLETE = 'incomplete'  # 終了したが未完了・エラーのZIPがある
+JOB_COMPLETED = 'completed'
+
+# ZIPの状態
+ZIP_PENDING = 'pending'      # 未処理（解凍途中を含む）
+ZIP_EXTRACTED = 'extracted'  # 解凍済み・PDF分割中
+ZIP_SPLIT = 'split'          # PDF分割まで終了（リネーム・マニフェスト記録前）
+ZIP_DONE = 'done'
+ZIP_SKIPPED = 'skipped'      # 増分処理でスキップ
+ZIP_ERROR = 'error'
+
+# PDFの状態
+PDF_PENDING = 'pending'
+PDF_DONE = 'done'      # 全ページの書き込みが完了
+PDF_ERROR = 'error'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    config TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS zips (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    extract_path TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, path)
+);
+CREATE TABLE IF NOT EXISTS pdfs (
+    job_id INTEGER NOT NULL,
+    zip_path TEXT NOT NULL,
+    member TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pages TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, zip_path, member),
+    FOREIGN KEY (job_id, zip_path) REFERENCES zips(job_id, path) ON DELETE CASCADE
+);
+"""
+
+
+def default_ledger_path():
+    """既定のジョブ台帳ファイル"""
+    return default_cache_dir() / LEDGER_NAME
+
+
+def now_text():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def path_key(path):
+    """台帳に記録するパス（作業フォルダによらず再開できるよう絶対パス）"""
+    return os.path.abspath(path)
+
+
+@dataclass
+class LedgerJob:
+    """台帳に記録されたジョブ1件"""
+    id: int
+    status: str
+    config: dict
+    created_at: str
+    updated_at: str
+    zip_count: int = 0
+    finished_count: int = 0  # 完了またはスキップしたZIP数
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'zip_count': self.zip_count,
+            'finished_count': self.finished_count,
+        }
+
+
+@dataclass
+class ResumePoint:
+    """再開時のZIP1個分の再開位置"""
+    zip_file: Path
+    extract_path: Optional[Path] = None  # None の場合は解凍からやり直す
+    done: Dict[str, List[Path]] = field(default_factory=dict)  # 分割済みPDF → ページ
+    pending: List[str] = field(default_factory=list)           # 未分割・エラーのPDF
+
+
+class JobLedger:
+    """ジョブ台帳
+
+    記録は処理を実行するスレッド（並列処理では結果を集計する親プロセス）からのみ行う。
+    WAL モードで開くため、監視モードなど複数のジョブが同じ台帳に並行して記録できる。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.migrate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, LEDGER_VERSION):
+            raise sqlite3.DatabaseError(f"未対応のジョブ台帳のバージョンです: {version}")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f"PRAGMA user_version={LEDGER_VERSION}")
+
+    def create_job(self, config, zip_files):
+        """新しいジョブと処理対象のZIPを記録し、ジョブIDを返す"""
+        self.prune()
+        timestamp = now_text()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (status, config, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (JOB_RUNNING, json.dumps(config, ensure_ascii=False, default=str), timestamp, timestamp))
+            job_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO zips (job_id, path, seq, status) VALUES (?, ?, ?, ?)",
+                ((job_id, path_key(zip_file), seq, ZIP_PENDING) for seq, zip_file in enumerate(zip_files)))
+        return job_id
+
+    def add_zips(self, job_id, zip_files, start_seq):
+        """実行中のジョブに処理対象のZIPを追加（フォルダを探索しながら処理する場合）"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO zips (job_id, path, seq, status) VALUES (?, ?, ?, ?)",
+                ((job_id, path_key(zip_file), start_seq + offset, ZIP_PENDING)
+                 for offset, zip_file in enumerate(zip_files)))
+            self.conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                              (JOB_RUNNING, now_text(), job_id))
+
+    def zip_extracted(self, job_id, zip_file, extract_path, members):
+        """解凍の完了と分割対象のPDFを記録（以前の分割状況は破棄）"""
+        key = path_key(zip_file)
+        with self.conn:
+            self.conn.execute("DELETE FROM pdfs WHERE job_id = ? AND zip_path = ?", (job_id, key))
+            self.conn.execute(
+                "UPDATE zips SET status = ?, extract_path = ?, error = NULL WHERE job_id = ? AND path = ?",
+                (ZIP_EXTRACTED, path_key(extract_path), job_id, key))
+            self.conn.executemany(
+                "INSERT INTO pdfs (job_id, zip_path, member, status) VALUES (?, ?, ?, ?)",
+                ((job_id, key, member, PDF_PENDING) for member in members))
+
+    def pdf_done(self, job_id, zip_file, member, pages):
+        """PDF1個の全ページの書き込み完了を記録"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE pdfs SET status = ?, pages = ?, error = NULL WHERE job_id = ? AND zip_path = ? AND member = ?",
+                (PDF_DONE, json.dumps([path_key(page) for page in pages], ensure_ascii=False),
+                 job_id, path_key(zip_file), member))
+
+    def pdf_failed(self, job_id, zip_file, member, error):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE pdfs SET status = ?, error = ? WHERE job_id = ? AND zip_path = ? AND member = ?",
+                (PDF_ERROR, str(error), job_id, path_key(zip_file), member))
+
+    def zip_status(self, job_id, zip_file, status, error=None):
+        with self.conn:
+            self.conn.execute("UPDATE zips SET status = ?, error = ? WHERE job_id = ? AND path = ?",
+                              (status, error, job_id, path_key(zip_file)))
+
+    def job_resumed(self, job_id):
+        with self.conn:
+            self.conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                              (JOB_RUNNING, now_text(), job_id))
+
+    def finish_job(self, job_id, zip_results):
+        """処理結果を反映してジョブを終了（エラーのないZIPを完了とする）"""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE zips SET status = ?, error = NULL WHERE job_id = ? AND path = ?",
+                ((ZIP_DONE, job_id, path_key(result.zip_file)) for result in zip_results
+                 if result.success and not result.pdf_errors and not result.skipped))
+            remaining = self.conn.execute(
+                "SELECT COUNT(*) FROM zips WHERE job_id = ? AND status NOT IN (?, ?)",
+                (job_id, ZIP_DONE, ZIP_SKIPPED)).fetchone()[0]
+            status = JOB_INCOMPLETE if remaining else JOB_COMPLETED
+            self.conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                              (status, now_text(), job_id))
+        return status
+
+    def jobs(self, where="", params=(), limit=None):
+        query = ("SELECT j.id, j.status, j.config, j.created_at, j.updated_at, COUNT(z.path), "
+                 "COALESCE(SUM(z.status IN (?, ?)), 0) "
+                 "FROM jobs j LEFT JOIN zips z ON z.job_id = j.id "
+                 f"{where} GROUP BY j.id ORDER BY j.id DESC")
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        rows = self.conn.execute(query, (ZIP_DONE, ZIP_SKIPPED, *params)).fetchall()
+        return [LedgerJob(job_id, status, json.loads(config), created_at, updated_at, zip_count, finished)
+                for job_id, status, config, created_at, updated_at, zip_count, finished in rows]
+
+    def list_jobs(self, limit=20):
+        """新しい順のジョブ一覧"""
+        return self.jobs(limit=limit)
+
+    def get_job(self, job_id):
+        jobs = self.jobs("WHERE j.id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def latest_unfinished(self):
+        """最後に開始した未完了のジョブ（中断・エラーを含む）"""
+        jobs = self.jobs("WHERE j.status != ?", (JOB_COMPLETED,), limit=1)
+        return jobs[0] if jobs else None
+
+    def resume_plan(self, job_id):
+        """未完了のZIPごとの再開位置を記録順に返す"""
+        zips = self.conn.execute(
+            "SELECT path, status, extract_path FROM zips WHERE job_id = ? AND status NOT IN (?, ?) ORDER BY seq",
+            (job_id, ZIP_DONE, ZIP_SKIPPED)).fetchall()
+        points = []
+        for path, status, extract_path in zips:
+            point = ResumePoint(Path(path))
+            points.append(point)
+            # 解凍途中・解凍エラーのZIPはやり直す
+            if status not in (ZIP_EXTRACTED, ZIP_SPLIT) or not extract_path:
+                continue
+            point.extract_path = Path(extract_path)
+            rows = self.conn.execute(
+                "SELECT member, status, pages FROM pdfs WHERE job_id = ? AND zip_path = ? ORDER BY member",
+                (job_id, path)).fetchall()
+            for member, pdf_status, pages in rows:
+                if pdf_status == PDF_DONE:
+                    point.done[member] = [Path(page) for page in json.loads(pages or '[]')]
+                else:
+                    point.pending.append(member)
+        return points
+
+    def prune(self, days=RETENTION_DAYS):
+        """完了してから一定期間が過ぎたジョブの記録を削除"""
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        with self.conn:
+            deleted = self.conn.execute("DELETE FROM jobs WHERE status = ? AND updated_at < ?",
+                                        (JOB_COMPLETED, cutoff)).rowcount
+        if deleted:
+            logger.debug(f"古いジョブの記録を削除: {deleted}件")
@@ -0,0 +1,311 @@
+"""ログ設定（キュー経由の非同期書き込み・ローテーション・JSON Lines・ジョブごとの相関ID・繰り返しログの間引き）
+
+非同期モードではログを出したスレッドはレコードをキューに積むだけで、ファイル・コンソールへの書き込みは
+QueueListener のスレッドが行う。プロセスプールのワーカーのログは multiprocessing のキューで親プロセスに集める。
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_FORMAT_TEXT = 'text'
+LOG_FORMAT_JSON = 'json'  # 1行1レコードの JSON（JSON Lines）
+LOG_FORMATS = (LOG_FORMAT_TEXT, LOG_FORMAT_JSON)
+
+MB = 1024 * 1024
+DEFAULT_MAX_BYTES = 5 * MB
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_RATE_LIMIT = 20  # ページごとのログを同じ箇所につき RATE_LIMIT_INTERVAL 秒あたりこの件数までに間引く（0 は間引かない）
+RATE_LIMIT_INTERVAL = 10.0
+
+# ページごとに繰り返し出るログに付ける extra（このログだけを間引き、ZIP単位のログは履歴として全件残す）
+PER_PAGE = {'rate_limited': True}
+
+# ログの相関ID（ジョブ台帳のジョブID、台帳を使わない場合は実行ID）
+log_job_id = contextvars.ContextVar('log_job_id', default=None)
+
+_active = None  # configure_logging で設定した非同期ログ（AsyncLogging）
+
+
+@contextmanager
+def log_context(job_id):
+    """このスレッド（コンテキスト）のログに相関IDを付ける"""
+    token = log_job_id.set(job_id)
+    try:
+        yield
+    finally:
+        log_job_id.reset(token)
+
+
+def bind_context(func):
+    """スレッドプールで実行する関数に、呼び出し元の相関IDを引き継ぐ"""
+    job_id = log_job_id.get()
+
+    def run(*args, **kwargs):
+        with log_context(job_id):
+            return func(*args, **kwargs)
+    return run
+
+
+class CorrelationFilter(logging.Filter):
+    """レコードに相関ID（job_id）を付ける（ログを出したスレッドで実行する）"""
+
+    def filter(self, record):
+        if not hasattr(record, 'job_id'):
+            record.job_id = log_job_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """extra=PER_PAGE を付けたログを、同じ箇所（ファイル・行）ごとに間引く
+
+    interval 秒ごとに limit 件までを出力し、超えた分は捨てて次の区間の最初のレコードに省略件数を付ける。
+    ERROR 以上は間引かない。複数のハンドラーに付けても1レコードにつき1回だけ数える。
+    """
+
+    def __init__(self, limit=DEFAULT_RATE_LIMIT, interval=RATE_LIMIT_INTERVAL, clock=time.monotonic):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.windows = {}  # (ファイル, 行) → [区間の開始時刻, 出力件数, 省略件数]
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.ERROR or not getattr(record, 'rate_limited', False):
+            return True
+        allowed = getattr(record, 'rate_allowed', None)
+        if allowed is None:
+            allowed = record.rate_allowed = self.check(record)
+        return allowed
+
+    def check(self, record):
+        key = (record.pathname, record.lineno)
+        now = self.clock()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg}（同じ箇所のログを{suppressed}件省略）"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコードを1行の JSON に整形"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'job_id': getattr(record, 'job_id', None),
+            'process': record.processName,
+            'thread': record.threadName,
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class WorkerQueueListener(logging.handlers.QueueListener):
+    """プロセスプールのワーカーから届いたログを書き込む（繰り返しログの間引きは親プロセス側で行う）"""
+
+    def __init__(self, log_queue, handlers, rate_filter=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.rate_filter = rate_filter
+
+    def handle(self, record):
+        if self.rate_filter is None or self.rate_filter.filter(record):
+            super().handle(record)
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """同じプロセス内のキューに積むハンドラー（整形は書き込みスレッドで行うため、レコードをそのまま積む）"""
+
+    def prepare(self, record):
+        return record
+
+
+@dataclass
+class LogConfig:
+    """ログの出力設定"""
+    level: int = logging.INFO
+    log_file: Optional[Path] = None  # None の場合はファイルに出力しない
+    log_format: str = LOG_FORMAT_TEXT
+    console: bool = True  # 標準エラーにも出力
+    asynchronous: bool = True  # キュー経由で別スレッドから書き込む
+    max_bytes: int = DEFAULT_MAX_BYTES  # これを超えたらログファイルをローテーション（0 はしない）
+    backup_count: int = DEFAULT_BACKUP_COUNT  # 残す過去のログファイル数
+    rollover: bool = False  # 起動時に前回のログを .1 に回して新しいファイルから書き始める
+    rate_limit: int = DEFAULT_RATE_LIMIT
+
+    def __post_init__(self):
+        if self.log_format not in LOG_FORMATS:
+            raise ValueError(f"不明なログ形式: {self.log_format}")
+        self.max_bytes = max(0, self.max_bytes)
+        self.backup_count = max(0, self.backup_count)
+        self.rate_limit = max(0, self.rate_limit)
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """環境変数（.env）から設定を生成"""
+        config = cls(
+            log_file=Path(os.getenv('LOG_FILE')).expanduser() if os.getenv('LOG_FILE') else None,
+            log_format=os.getenv('LOG_FORMAT', LOG_FORMAT_TEXT).lower(),
+            asynchronous=os.getenv('LOG_ASYNC', 'True').lower() == 'true',
+            max_bytes=int(float(os.getenv('LOG_MAX_MB') or DEFAULT_MAX_BYTES / MB) * MB),
+            backup_count=int(os.getenv('LOG_BACKUPS') or DEFAULT_BACKUP_COUNT),
+            rate_limit=int(os.getenv('LOG_RATE_LIMIT') or DEFAULT_RATE_LIMIT),
+        )
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(config, key, value)
+        config.__post_init__()
+        return config
+
+
+def build_handlers(config):
+    """実際に書き込むハンドラー（ファイル・コンソール）を生成"""
+    formatter = JsonFormatter() if config.log_format == LOG_FORMAT_JSON else logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if config.log_file is not None:
+        config.log_file.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(config.log_file, maxBytes=config.max_bytes,
+                                                       backupCount=config.backup_count, encoding='utf-8',
+                                                       delay=True)
+        if config.rollover and config.backup_count and config.log_file.exists() \
+                and config.log_file.stat().st_size > 0:
+            handler.doRollover()
+        handlers.append(handler)
+    if config.console:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+class AsyncLogging:
+    """キューと書き込みスレッド（QueueListener）"""
+
+    def __init__(self, handlers, rate_filter=None):
+        self.handlers = handlers
+        self.rate_filter = rate_filter
+        self.queue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self.worker_queue = None
+        self.worker_listener = None
+        self.lock = threading.Lock()
+
+    def get_worker_queue(self):
+        """プロセスプールのワーカー用のキュー（最初に要求されたときに作成）"""
+        with self.lock:
+            if self.worker_queue is None:
+                self.worker_queue = multiprocessing.Queue()
+                self.worker_listener = WorkerQueueListener(self.worker_queue, self.handlers, self.rate_filter)
+                self.worker_listener.start()
+            return self.worker_queue
+
+    def stop(self):
+        """キューに残ったログを書き終えてから書き込みスレッドを止める"""
+        for listener in (self.worker_listener, self.listener):
+            if listener is not None:
+                listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+
+def configure_logging(config):
+    """ルートロガーを設定（既存のハンドラーは置き換える）"""
+    global _active
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(config.level)
+
+    handlers = build_handlers(config)
+    rate_filter = RateLimitFilter(config.rate_limit) if config.rate_limit else None
+    if config.asynchronous:
+        _active = AsyncLogging(handlers, rate_filter)
+        handlers = [LocalQueueHandler(_active.queue)]
+    # 相関IDの付与と間引きはログを出したスレッドで行う（間引いたレコードはキューに積まない）
+    producer_filters = [CorrelationFilter()] + ([rate_filter] if rate_filter is not None else [])
+    for handler in handlers:
+        for log_filter in producer_filters:
+            handler.addFilter(log_filter)
+        root.addHandler(handler)
+
+
+def shutdown_logging():
+    """非同期ログの書き込みスレッドを止める（終了時に自動で呼ばれる）"""
+    global _active
+    if _active is not None:
+        _active.stop()
+        _active = None
+
+
+def worker_log_queue():
+    """プロセスプールのワーカーがログを送るキュー（非同期モードでない場合は None）"""
+    return _active.get_worker_queue() if _active is not None else None
+
+
+def setup_worker_logging(log_queue, level, job_id=None):
+    """プロセスプールのワーカーのログを親プロセスのキューへ送る"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(CorrelationFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    log_job_id.set(job_id)
+
+
+def _after_fork_in_child():
+    # fork したプロセスには書き込みスレッドがないため、キューに積まずに直接書き込む
+    global _active
+    if _active is None:
+        return
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, LocalQueueHandler):
+            root.removeHandler(handler)
+            for target in _active.handlers:
+                for log_filter in handler.filters:
+                    target.addFilter(log_filter)
+                root.addHandler(target)
+    _active = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(shutdown_logging)
@@ -0,0 +1,235 @@
+"""増分処理用のマニフェスト（処理済みZIPの内容ハッシュと出力ページの記録）"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".receipt-splitter-manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 同じマニフェストを複数ジョブが同時に更新する場合（監視モードなど）の排他
+_save_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """ファイルのSHA-256ハッシュ値を計算"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_open(path, mode='wb', fsync=False, **kwargs):
+    """一時ファイルに書き込み、正常に閉じた場合のみ path に置き換える（途中で失敗しても壊れたファイルを残さない）
+
+    一時ファイルは同じフォルダに「.{ファイル名}.*.tmp」として作成する。
+    fsync=True なら置き換え前にディスクへ書き出す（電源断にも備える場合）。
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path, text):
+    """一時ファイルに書き込んでから置き換える（書き込み途中のクラッシュで壊さない）"""
+    with atomic_open(path, 'w', fsync=True, encoding='utf-8') as f:
+        f.write(text)
+
+
+class Manifest:
+    """出力フォルダ1個分のマニフェスト
+
+    ZIPごとにサイズ・更新日時・SHA-256と、そこから生成した分割ページを記録する。
+    ページのパスは出力フォルダからの相対パスで保存する。
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / MANIFEST_NAME
+        self.entries = {}
+        self.changed = set()
+        self.removed = set()
+
+    @classmethod
+    def load(cls, folder):
+        manifest = cls(folder)
+        if not manifest.path.exists():
+            return manifest
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                manifest.entries = data.get('zips', {})
+            else:
+                logger.warning(f"マニフェストのバージョンが異なるため破棄します: {manifest.path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"マニフェスト読み込みエラー（全件再処理します）: {manifest.path}: {e}")
+        return manifest
+
+    @property
+    def dirty(self):
+        return bool(self.changed or self.removed)
+
+    def save(self):
+        """変更した記録だけを最新のマニフェストに反映して保存"""
+        if not self.dirty:
+            return
+        with _save_lock:
+            # 読み込み後に他のジョブが保存した記録を消さないようマージする
+            entries = Manifest.load(self.folder).entries
+            for key in self.removed:
+                entries.pop(key, None)
+            for key in self.changed:
+                entries[key] = self.entries[key]
+
+            self.folder.mkdir(parents=True, exist_ok=True)
+            data = {'version': MANIFEST_VERSION, 'zips': entries}
+            atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1))
+
+        self.entries = entries
+        self.changed.clear()
+        self.removed.clear()
+
+    @staticmethod
+    def key(zip_file):
+        return str(Path(zip_file).resolve())
+
+    def relative(self, path):
+        try:
+            return Path(path).relative_to(self.folder).as_posix()
+        except ValueError:
+            return str(path)
+
+    def absolute(self, path):
+        return self.folder / path
+
+    def check(self, zip_file, options):
+        """変更がなく出力も揃っているZIPなら記録済みの情報を返す
+
+        サイズと更新日時が一致すればハッシュ計算を省略し、
+        異なる場合のみ内容ハッシュで比較する。戻り値は (記録, ハッシュ値)。
+        ハッシュ値は再処理が必要な場合に記録用として使う（未計算なら None）。
+        """
+        entry = self.entries.get(self.key(zip_file))
+        stat = Path(zip_file).stat()
+        if entry is None or entry.get('options') != options:
+            return None, None
+
+        digest = None
+        if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            digest = file_sha256(zip_file)
+            if digest != entry['sha256']:
+                return None, digest
+            # 内容は同じ（コピーやタッチで更新日時だけ変わった）
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self.changed.add(self.key(zip_file))
+
+        # アーカイブ出力ではページの代わりにアーカイブの有無を確認する
+        outputs = [entry['archive']] if entry.get('archive') else entry['pages']
+        missing = [page for page in outputs if not self.absolute(page).exists()]
+        if missing or not self.absolute(entry['extract_path']).exists():
+            logger.info(f"出力ファイルが欠落しているため再処理: {Path(zip_file).name} ({len(missing)}ページ)")
+            return None, digest
+        return entry, digest
+
+    def record(self, zip_file, result, options, digest=None):
+        stat = Path(zip_file).stat()
+        key = self.key(zip_file)
+        self.entries[key] = {
+            'name': Path(zip_file).name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest or file_sha256(zip_file),
+            'options': options,
+            'extract_path': self.relative(result.extract_path),
+            'pages': [self.relative(page) for page in result.split_files],
+            'processed_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        if result.output_archive is not None:
+            self.entries[key]['archive'] = self.relative(result.output_archive)
+        self.changed.add(key)
+        self.removed.discard(key)
+
+    def forget(self, zip_file):
+        key = self.key(zip_file)
+        if self.entries.pop(key, None) is not None:
+            self.removed.add(key)
+            self.changed.discard(key)
+
+
+class IncrementalTracker:
+    """ジョブ1回分の増分処理（スキップ判定とマニフェスト更新）"""
+
+    def __init__(self, options):
+        self.options = options
+        self.manifests = {}
+        self.digests = {}
+
+    def manifest_for(self, folder):
+        folder = Path(folder)
+        if folder not in self.manifests:
+            self.manifests[folder] = Manifest.load(folder)
+        return self.manifests[folder]
+
+    def partition(self, zip_files, base_dir_for):
+        """ZIP一覧を (処理が必要なZIP一覧, スキップするZIPの {zip: 記録}) に分ける"""
+        to_process = []
+        skipped = {}
+        for zip_file in zip_files:
+            manifest = self.manifest_for(base_dir_for(zip_file))
+            try:
+                entry, digest = manifest.check(zip_file, self.options)
+            except OSError as e:
+                logger.warning(f"マニフェスト照合エラー: {zip_file.name}: {e}")
+                entry, digest = None, None
+
+            if entry is None:
+                to_process.append(zip_file)
+                self.digests[zip_file] = digest
+            else:
+                skipped[zip_file] = (manifest, entry)
+
+        if skipped:
+            logger.info(f"変更のないZIPをスキップ: {len(skipped)}個 / 処理対象: {len(to_process)}個")
+        return to_process, skipped
+
+    def record(self, zip_results, base_dir_for):
+        """処理結果をマニフェストに反映して保存（エラーのあったZIPは次回再処理）"""
+        for result in zip_results:
+            manifest = self.manifest_for(base_dir_for(result.zip_file))
+            try:
+                if result.success and not result.pdf_errors:
+                    manifest.record(result.zip_file, result, self.options, self.digests.get(result.zip_file))
+                else:
+                    manifest.forget(result.zip_file)
+            except OSError as e:
+                logger.warning(f"マニフェスト記録エラー: {result.zip_file.name}: {e}")
+
+        for manifest in self.manifests.values():
+            try:
+                manifest.save()
+            except OSError as e:
+                logger.error(f"マニフェスト保存エラー: {manifest.path}: {e}")
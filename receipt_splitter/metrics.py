@@ -0,0 +1,233 @@
+"""処理メトリクス（カウンター・ゲージ・ヒストグラム）とJSON/Prometheus形式での出力"""
+import bisect
+import json
+import threading
+import time
+from pathlib import Path
+
+from .manifest import atomic_write_text
+
+# 処理時間（秒）用のヒストグラム区切り
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def format_value(value):
+    """Prometheus テキスト形式の数値表記"""
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    """ラベル付きメトリクスの基底クラス"""
+    kind = None
+
+    def __init__(self, name, help_text, labels=(), lock=None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.lock = lock or threading.Lock()
+        self.values = {}
+
+    def label_key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: ラベルが一致しません: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        with self.lock:
+            return sorted(self.values.items())
+
+
+class Counter(Metric):
+    """単調増加するカウンター"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(f"{self.name}: カウンターは減算できません")
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self.label_key(labels), 0)
+
+    def to_dict(self):
+        return [{'labels': dict(zip(self.label_names, key)), 'value': value} for key, value in self.samples()]
+
+    def to_prometheus(self):
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+                for key, value in self.samples()]
+
+
+class Gauge(Counter):
+    """任意に増減するゲージ"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_max(self, value, **labels):
+        """これまでの値より大きい場合のみ更新（ピーク値の記録用）"""
+        key = self.label_key(labels)
+        with self.lock:
+            if value > self.values.get(key, float('-inf')):
+                self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """区切り値ごとの件数・合計・件数を保持するヒストグラム"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS, lock=None):
+        super().__init__(name, help_text, labels, lock)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def cumulative(self, state):
+        """区切り値ごとの累積件数（Prometheus の le 形式）"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), state['counts']):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return [{
+            'labels': dict(zip(self.label_names, key)),
+            'count': state['count'],
+            'sum': round(state['sum'], 6),
+            'buckets': {format_value(bound): count for bound, count in self.cumulative(state)},
+        } for key, state in self.samples()]
+
+    def to_prometheus(self):
+        lines = []
+        for key, state in self.samples():
+            for bound, count in self.cumulative(state):
+                labels = format_labels(self.label_names, key, {'le': format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録と出力（スレッドセーフ）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric_class, name, help_text, labels=(), **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, help_text, labels, lock=self.lock, **kwargs)
+            elif not isinstance(metric, metric_class) or metric.label_names != tuple(labels):
+                raise ValueError(f"メトリクス {name} は別の種類・ラベルで登録済みです")
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, help_text, labels, buckets=buckets)
+
+    def to_dict(self):
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'metrics': {
+                name: {'type': metric.kind, 'help': metric.help, 'samples': metric.to_dict()}
+                for name, metric in sorted(self.metrics.items())
+            },
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.to_prometheus())
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        atomic_write_text(Path(path), json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + "\n")
+
+    def write_prometheus(self, path):
+        """node_exporter の textfile collector 用ファイルを出力（読み込み途中を見せないよう置き換えで書く）"""
+        atomic_write_text(Path(path), self.to_prometheus())
+
+
+class PipelineMetrics:
+    """ZIP解凍・PDF分割パイプラインのメトリクス一式"""
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        r = self.registry
+        self.zips = r.counter('receipt_splitter_zips_total', "処理したZIPファイル数", ['status'])
+        self.pdfs = r.counter('receipt_splitter_pdfs_total', "分割したPDFファイル数", ['status'])
+        self.pages = r.counter('receipt_splitter_pages_split_total', "分割して出力したページ数")
+        self.bytes_extracted = r.counter('receipt_splitter_bytes_extracted_total', "ZIPから解凍・読み込んだバイト数")
+        self.bytes_written = r.counter('receipt_splitter_bytes_written_total', "分割ページとして書き込んだバイト数")
+        self.bytes_saved = r.counter('receipt_splitter_bytes_saved_total', "共有リソース最適化による推定削減バイト数")
+        self.image_bytes_saved = r.counter('receipt_splitter_image_bytes_saved_total', "画像圧縮による推定削減バイト数")
+        self.zip_seconds = r.histogram('receipt_splitter_zip_seconds', "ZIP1個あたりの処理時間（秒）")
+        self.zip_stage_seconds = r.histogram('receipt_splitter_zip_stage_seconds',
+                                             "ZIP1個あたりの段階別処理時間（秒）", ['stage'])
+        self.pdf_split_seconds = r.histogram('receipt_splitter_pdf_split_seconds', "PDF1個あたりの分割時間（秒）")
+        self.duplicates = r.counter('receipt_splitter_duplicate_pages_total', "既存のページと重複した分割ページ数",
+                                    ['match', 'action'])
+        self.queue_depth = r.gauge('receipt_splitter_queue_depth', "処理待ちの件数", ['queue'])
+        self.queue_depth_max = r.gauge('receipt_splitter_queue_depth_max', "処理待ち件数の最大値", ['queue'])
+        self.workers = r.gauge('receipt_splitter_workers', "ワーカー数")
+        self.worker_busy_seconds = r.counter('receipt_splitter_worker_busy_seconds_total',
+                                             "ワーカーが処理に使った時間の合計（秒）")
+        self.worker_utilization = r.gauge('receipt_splitter_worker_utilization',
+                                          "直近の実行におけるワーカー稼働率（0〜1）")
+        self.run_seconds = r.gauge('receipt_splitter_run_duration_seconds', "直近の実行の所要時間（秒）")
+        self.last_run = r.gauge('receipt_splitter_last_run_timestamp_seconds', "直近の実行の終了時刻（UNIX時刻）")
+        self.rename_pages = r.counter('receipt_splitter_rename_pages_total', "OCR&AI自動リネームしたページ数", ['status'])
+        self.rename_cache = r.counter('receipt_splitter_rename_cache_total', "OCR・命名結果のキャッシュ参照数",
+                                      ['stage', 'result'])
+        self.rename_requests = r.counter('receipt_splitter_rename_requests_total', "OCR・命名バックエンドの呼び出し数",
+                                         ['backend', 'status'])
+        self.rename_request_seconds = r.histogram('receipt_splitter_rename_request_seconds',
+                                                  "OCR・命名バックエンドの1リクエストあたりの所要時間（秒）", ['backend'])
+
+    def observe_queue(self, queue, depth):
+        self.queue_depth.set(depth, queue=queue)
+        self.queue_depth_max.set_max(depth, queue=queue)
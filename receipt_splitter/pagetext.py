@@ -0,0 +1,121 @@
+"""ページのテキスト抽出（描画内容のハッシュをキーにしたキャッシュ付き）
+
+区切りの検出で抽出したテキストは SQLite に保存し、同じページ（再実行・再送された明細）では抽出し直さない。
+"""
+import logging
+import sqlite3
+from pathlib import Path
+
+from .ledger import now_text
+from .paths import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "texts.sqlite3"
+# テキストの抽出方法を変えたら上げる（古いキャッシュを使わない）
+CACHE_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS texts (
+    fingerprint BLOB PRIMARY KEY,
+    text TEXT NOT NULL,
+    extracted_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def default_text_cache_path():
+    """既定のテキストキャッシュのファイル"""
+    return default_cache_dir() / CACHE_NAME
+
+
+def extract_text(page):
+    """ページのテキストレイヤーを抽出（抽出できない場合は空文字列）"""
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        logger.debug(f"テキスト抽出エラー: {e}")
+        return ""
+
+
+class PageTextCache:
+    """ページの描画内容のフィンガープリント → テキスト
+
+    プロセスプールのワーカーからも同時に開けるよう WAL モードで開き、書き込みは PDF1個分ずつまとめて行う。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        with self.conn:
+            if version not in (0, CACHE_VERSION):
+                self.conn.execute("DROP TABLE IF EXISTS texts")
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f"PRAGMA user_version={CACHE_VERSION}")
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, fingerprint):
+        row = self.conn.execute("SELECT text FROM texts WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put_many(self, items):
+        """(フィンガープリント, テキスト) の一覧をまとめて保存"""
+        if not items:
+            return
+        timestamp = now_text()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO texts (fingerprint, text, extracted_at) VALUES (?, ?, ?)",
+                [(fingerprint, text, timestamp) for fingerprint, text in items])
+
+
+def page_texts(pages, cache=None):
+    """ページ群のテキストの一覧（キャッシュにあるページは抽出しない）
+
+    pages はページを順に返すイテラブル（省メモリ分割ではリーダーを作り直しながら返す）。
+    キャッシュの読み書きに失敗した場合はキャッシュを使わずに抽出する。
+    """
+    from .resources import page_fingerprint
+
+    texts = []
+    extracted = []
+    for page in pages:
+        text = None
+        fingerprint = None
+        if cache is not None:
+            fingerprint = page_fingerprint(page)
+            try:
+                text = cache.get(fingerprint)
+            except sqlite3.Error as e:
+                logger.warning(f"テキストキャッシュ読み込みエラー（キャッシュを使わずに抽出します）: {e}")
+                cache = None
+        if text is None:
+            text = extract_text(page)
+            if cache is not None:
+                extracted.append((fingerprint, text))
+        texts.append(text)
+
+    if cache is not None:
+        try:
+            cache.put_many(extracted)
+        except sqlite3.Error as e:
+            logger.warning(f"テキストキャッシュ書き込みエラー: {e}")
+    return texts
@@ -0,0 +1,12 @@
+"""ツールが使う既定のフォルダ"""
+import os
+from pathlib import Path
+
+
+def default_cache_dir():
+    """OSごとの既定のキャッシュフォルダ（台帳・索引・キャッシュ・サービスのデータを置く）"""
+    if os.name == 'nt' and os.getenv('LOCALAPPDATA'):
+        base = Path(os.environ['LOCALAPPDATA'])
+    else:
+        base = Path(os.getenv('XDG_CACHE_HOME') or Path.home() / ".cache")
+    return base / "receipt-splitter"
@@ -0,0 +1,73 @@
+"""処理段階の間の受け渡し（上限付きキューによる書き込み段階）と処理の中止"""
+import queue
+import threading
+
+WRITE_QUEUE_SIZE = 8  # 書き込み待ちにできる分割ページ数（これを超えると分割側を待たせる）
+
+
+class JobCancelled(Exception):
+    """処理の中止が要求された"""
+
+    def __init__(self, message="中止しました"):
+        super().__init__(message)
+
+
+class PageWriter:
+    """分割ページの書き込み段階
+
+    分割側はページをバイト列にして write() で渡し、専用スレッドが出力先（sinks の FileSink・ArchiveSink など）に書き込む。
+    キューには上限があり、書き込みが追いつかない場合は分割側が待つためメモリ使用量は一定に保たれる。
+    workers=0 の場合は呼び出し元のスレッドで書き込む。
+    close()（with ブロックの終了）で書き込み待ちのページをすべて書き終えてから戻り、
+    書き込みエラーがあれば送出する。
+    """
+
+    def __init__(self, sink, workers=1, queue_size=WRITE_QUEUE_SIZE):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.error = None
+        self.threads = [threading.Thread(target=self.write_loop, name=f"page-writer-{i+1}", daemon=True)
+                        for i in range(max(0, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except Exception:
+            # 分割側の例外を優先する
+            if exc_type is None:
+                raise
+
+    def write(self, name, data):
+        """ページを書き込み段階に渡す（キューが一杯の間は待つ）"""
+        if self.error is not None:
+            raise self.error
+        if not self.threads:
+            self.sink.write(name, data)
+            return
+        self.queue.put((name, data))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # エラー後は残りを読み捨てる
+            try:
+                self.sink.write(*item)
+            except BaseException as e:
+                self.error = e
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,175 @@
+"""解凍前の事前検査（ZIPの中央ディレクトリ・CRC・メンバーのパス、PDFのヘッダー・トレーラー・暗号化・ページ数）
+
+検査はZIPから直接読み込んで行い、ディスクには何も書き込まない。
+エラーのあるZIPは解凍先を作り直す前に除外できる。
+"""
+import importlib.util
+import io
+import re
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+from .extraction import COPY_BUFSIZE, pdf_targets
+
+# PyPDF2 は読み込みに時間がかかるため、ページ数を数えるときに読み込む
+PDF_AVAILABLE = importlib.util.find_spec('PyPDF2') is not None
+
+HEADER_BYTES = 1024   # PDFヘッダー（%PDF-）を探す先頭のバイト数
+TRAILER_BYTES = 1024  # %%EOF を探す末尾のバイト数
+DRIVE_PREFIX = re.compile(r'^[A-Za-z]:')
+
+
+def unsafe_member(filename):
+    """解凍先の外を指すメンバー名か（絶対パス・ドライブ名・「..」を含む）"""
+    name = filename.replace('\\', '/')
+    return name.startswith('/') or bool(DRIVE_PREFIX.match(name)) or '..' in name.split('/')
+
+
+@dataclass
+class PdfCheck:
+    """ZIP内のPDF1個の検査結果"""
+    member: str
+    size: int = 0
+    pages: Optional[int] = None  # ページ数（PyPDF2 がない場合は None）
+    encrypted: bool = False
+    error: Optional[str] = None
+    warning: Optional[str] = None
+
+    def to_dict(self):
+        return {'member': self.member, 'size': self.size, 'pages': self.pages,
+                'encrypted': self.encrypted, 'error': self.error, 'warning': self.warning}
+
+
+@dataclass
+class PreflightResult:
+    """ZIP1個分の事前検査の結果"""
+    zip_file: Path
+    size: int = 0               # ZIPファイルのサイズ
+    member_count: int = 0
+    bytes_uncompressed: int = 0  # 全メンバーの展開後サイズ
+    pdfs: List[PdfCheck] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def pdf_count(self):
+        return len(self.pdfs)
+
+    @property
+    def page_count(self):
+        """分割対象PDFの合計ページ数（数えられなかった場合は None）"""
+        if any(pdf.pages is None for pdf in self.pdfs):
+            return None
+        return sum(pdf.pages for pdf in self.pdfs)
+
+    def describe(self):
+        """一覧に表示する1行の説明"""
+        if not self.ok:
+            return f"エラー: {self.errors[0]}" + (f" ほか{len(self.errors) - 1}件" if len(self.errors) > 1 else "")
+        parts = [f"PDF {self.pdf_count}個"]
+        if self.page_count is not None:
+            parts.append(f"{self.page_count}ページ")
+        parts.append(f"{self.bytes_uncompressed / (1024 * 1024):.1f}MB")
+        if self.warnings:
+            parts.append(f"警告 {len(self.warnings)}件")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        return {
+            'zip_file': str(self.zip_file),
+            'ok': self.ok,
+            'size': self.size,
+            'member_count': self.member_count,
+            'bytes_uncompressed': self.bytes_uncompressed,
+            'pdf_count': self.pdf_count,
+            'page_count': self.page_count,
+            'errors': list(self.errors),
+            'warnings': list(self.warnings),
+            'elapsed_ms': round(self.elapsed * 1000, 3),
+            'pdfs': [pdf.to_dict() for pdf in self.pdfs],
+        }
+
+
+def check_pdf(member, data, count_pages=True):
+    """PDFのバイト列を検査（ヘッダー・末尾の %%EOF・暗号化・ページ数）"""
+    check = PdfCheck(member, size=len(data))
+    if b'%PDF-' not in data[:HEADER_BYTES]:
+        check.error = "PDFのヘッダーがありません"
+        return check
+    if b'%%EOF' not in data[-TRAILER_BYTES:]:
+        check.warning = "末尾に %%EOF がありません"
+
+    if not (count_pages and PDF_AVAILABLE):
+        # ページ数を数えない場合は末尾のトレーラーだけで暗号化を判定する
+        check.encrypted = b'/Encrypt' in data[-4 * TRAILER_BYTES:]
+    else:
+        from PyPDF2 import PdfReader
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            check.encrypted = reader.is_encrypted
+            if not check.encrypted:
+                check.pages = len(reader.pages)
+        except Exception as e:
+            check.error = f"PDFを読み込めません: {e}"
+            return check
+
+    if check.encrypted:
+        check.error = "暗号化されたPDFは分割できません"
+    elif check.pages == 0:
+        check.error = "ページがありません"
+    return check
+
+
+def check_zip(zip_file, verify_crc=True, count_pages=True):
+    """ZIPファイル1個を解凍せずに検査し、PreflightResult を返す（プロセスプールのワーカーからも呼べる）
+
+    中央ディレクトリを読み込み、メンバーのパス・暗号化を確認する。verify_crc=True なら全メンバーを読み込んで CRC を照合する。
+    分割対象のPDFはメモリに読み込み、ヘッダー・トレーラー・暗号化・ページ数を確認する。
+    """
+    zip_file = Path(zip_file)
+    start = time.perf_counter()
+    result = PreflightResult(zip_file)
+    try:
+        result.size = zip_file.stat().st_size
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            infos = zip_ref.infolist()
+            result.member_count = len(infos)
+            result.bytes_uncompressed = sum(info.file_size for info in infos)
+            targets = set(pdf_targets(zip_ref))
+            for info in infos:
+                if unsafe_member(info.filename):
+                    result.errors.append(f"解凍先の外を指すメンバー: {info.filename}")
+                    continue
+                if info.flag_bits & 0x1:
+                    result.errors.append(f"パスワード付きのメンバー: {info.filename}")
+                    continue
+                if info.is_dir():
+                    continue
+                try:
+                    if info.filename in targets:
+                        # 最後まで読むと CRC も照合される
+                        pdf = check_pdf(info.filename, zip_ref.read(info), count_pages)
+                        result.pdfs.append(pdf)
+                        if pdf.error:
+                            result.errors.append(f"{info.filename}: {pdf.error}")
+                        elif pdf.warning:
+                            result.warnings.append(f"{info.filename}: {pdf.warning}")
+                    elif verify_crc:
+                        with zip_ref.open(info) as source:
+                            while source.read(COPY_BUFSIZE):
+                                pass
+                except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, NotImplementedError, EOFError) as e:
+                    result.errors.append(f"{info.filename}: {e}")
+    except (OSError, zipfile.BadZipFile) as e:
+        result.errors.append(f"ZIPファイルを読み込めません: {e}")
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,83 @@
+"""進捗通知（処理側はイベントを積むだけ、画面側は一定間隔でまとめて取り出す）"""
+import queue
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+RATE_WINDOW = 5.0  # 処理速度（ページ/秒）を計算する直近の期間（秒）
+
+
+@dataclass
+class ProgressSnapshot:
+    """ある時点の進捗（複数のイベントをまとめた結果）"""
+    message: Optional[str] = None
+    done: int = 0     # 処理済みZIP数
+    total: int = 0    # 処理対象ZIP数
+    pages: int = 0    # 分割済みページ数
+    elapsed: float = 0.0
+    pages_per_sec: float = 0.0
+    eta: Optional[float] = None  # 残り時間の見込み（秒、算出できない場合は None）
+    changed: bool = False        # 前回の取り出し以降にイベントがあったか
+
+
+def format_duration(seconds):
+    """秒数を H:MM:SS / M:SS 形式に整形"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ProgressChannel:
+    """ワーカーからの進捗イベントを受け取り、画面の定期処理でまとめて反映するためのチャネル
+
+    status / pages はキュー（SimpleQueue）に積むだけでロックを取らないため、
+    画面の更新速度が処理速度を制限しない。snapshot は画面側のスレッドから一定間隔で呼ぶ。
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.events = queue.SimpleQueue()
+        self.start_time = clock()
+        self.current = ProgressSnapshot()
+        self.samples = deque()  # (時刻, 分割済みページ数)
+
+    def status(self, message, done, total):
+        """処理状況の更新（message が None の場合は件数のみ）"""
+        self.events.put(('status', (message, done, total)))
+
+    def pages(self, count=1):
+        """分割したページ数の加算"""
+        self.events.put(('pages', count))
+
+    def snapshot(self):
+        """溜まったイベントをまとめて反映し、現在の進捗を返す"""
+        current = self.current
+        current.changed = False
+        while True:
+            try:
+                kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            current.changed = True
+            if kind == 'status':
+                message, current.done, current.total = value
+                if message is not None:
+                    current.message = message
+            elif kind == 'pages':
+                current.pages += value
+
+        now = self.clock()
+        current.elapsed = now - self.start_time
+        self.samples.append((now, current.pages))
+        while len(self.samples) > 2 and now - self.samples[0][0] > RATE_WINDOW:
+            self.samples.popleft()
+        first_time, first_pages = self.samples[0]
+        current.pages_per_sec = (current.pages - first_pages) / (now - first_time) if now > first_time else 0.0
+
+        if 0 < current.done < current.total:
+            current.eta = current.elapsed / current.done * (current.total - current.done)
+        else:
+            current.eta = None
+        return ProgressSnapshot(**vars(current))
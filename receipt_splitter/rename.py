@@ -0,0 +1,507 @@
+"""OCR&AI自動リネーム（分割後のページをOCRし、内容からファイル名を決めて付け替える）
+
+OCR・命名はバックエンドを差し替えられる（Google Cloud Vision / OpenAI / オフライン用のスタブ）。
+ページはまとめて（バッチで）送信し、asyncio で並行実行する（asyncio はリネームを実行するときに読み込む）。バックエンドごとにレート制限と
+指数バックオフ付きのリトライを行い、結果はページ内容のハッシュをキーにディスクへキャッシュするため、
+再実行や重複ページで同じ問い合わせを繰り返さない。
+"""
+import io
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .ledger import path_key
+from .logs import PER_PAGE
+from .manifest import atomic_write_text, file_sha256
+from .paths import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# キャッシュ形式・命名ルールを変えたら上げる（古いキャッシュを使わない）
+CACHE_VERSION = 1
+DEFAULT_OPENAI_MODEL = 'gpt-4o-mini'
+MAX_PROMPT_CHARS = 4000  # 命名に送るOCRテキストの最大文字数（1ページあたり）
+MAX_NAME_LENGTH = 100
+
+INVALID_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+DATE_PATTERN = re.compile(r"(20\d{2})\s*[年/.\-]\s*(\d{1,2})\s*[月/.\-]\s*(\d{1,2})")
+AMOUNT_PATTERN = re.compile(r"[¥￥]\s*([\d,]+)|([\d,]+)\s*円")
+TRANSACTION_PATTERN = re.compile(r"(?:Transaction No\.?|取引番号|受付番号)\s*[:：]?\s*([\w\-]+)", re.IGNORECASE)
+
+
+class BackendError(Exception):
+    """バックエンド呼び出しの失敗（リトライ対象）"""
+
+
+class BackendUnavailable(BackendError):
+    """バックエンドが使用できない（ライブラリ未導入・認証情報なしなど、リトライしない）"""
+
+
+def sanitize_filename(name):
+    """ファイル名に使えない文字を除去（空になった場合は None）"""
+    if not name:
+        return None
+    name = INVALID_FILENAME_CHARS.sub('', str(name))
+    name = re.sub(r"\s+", "_", name.strip()).strip('._')
+    if name.lower().endswith('.pdf'):
+        name = name[:-4]
+    return name[:MAX_NAME_LENGTH] or None
+
+
+def page_text(pdf_file):
+    """1ページPDFのテキストレイヤーを抽出"""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(str(pdf_file))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def merge_pages(page_files):
+    """1ページPDF群を1個のPDF（バイト列）にまとめる"""
+    from PyPDF2 import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for page_file in page_files:
+        for page in PdfReader(str(page_file)).pages:
+            writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class StubOcrBackend:
+    """オフライン用OCR（PDFのテキストレイヤーを読むだけで外部サービスは使わない）"""
+    name = 'stub'
+    max_batch_size = 50
+
+    def __init__(self, latency=0.0):
+        self.latency = latency  # 1リクエストあたりの擬似的な待ち時間（秒）
+
+    def recognize(self, page_files):
+        if self.latency:
+            time.sleep(self.latency)
+        return [page_text(page_file) for page_file in page_files]
+
+
+class VisionOcrBackend:
+    """Google Cloud Vision によるOCR（GOOGLE_APPLICATION_CREDENTIALS の認証情報を使用）"""
+    name = 'vision'
+    max_batch_size = 5  # files:annotate は1リクエストあたり5ページまで
+
+    def __init__(self, latency=0.0):
+        try:
+            from google.cloud import vision
+        except ImportError:
+            raise BackendUnavailable("Google Cloud Vision を使用するには 'pip install google-cloud-vision' が必要です")
+        try:
+            self.client = vision.ImageAnnotatorClient()
+        except Exception as e:
+            raise BackendUnavailable(f"Google Cloud Vision の認証に失敗しました: {e}")
+        self.vision = vision
+
+    def recognize(self, page_files):
+        # 複数ページを1個のPDFにまとめ、1回のリクエストで送る
+        vision = self.vision
+        request = vision.AnnotateFileRequest(
+            input_config=vision.InputConfig(content=merge_pages(page_files), mime_type='application/pdf'),
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+            pages=list(range(1, len(page_files) + 1)),
+        )
+        response = self.client.batch_annotate_files(requests=[request])
+        texts = []
+        for page_response in response.responses[0].responses:
+            if page_response.error.message:
+                raise BackendError(f"Vision API エラー: {page_response.error.message}")
+            texts.append(page_response.full_text_annotation.text)
+        if len(texts) != len(page_files):
+            raise BackendError(f"Vision API の応答ページ数が一致しません（{len(texts)}/{len(page_files)}）")
+        return texts
+
+
+class StubNamingBackend:
+    """オフライン用の命名（日付・取引番号・金額を正規表現で抜き出す）"""
+    name = 'stub'
+    max_batch_size = 50
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def suggest_names(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.suggest_name(text) for text in texts]
+
+    @staticmethod
+    def suggest_name(text):
+        parts = []
+        date = DATE_PATTERN.search(text)
+        if date:
+            parts.append(f"{date.group(1)}{int(date.group(2)):02d}{int(date.group(3)):02d}")
+        transaction = TRANSACTION_PATTERN.search(text)
+        if transaction:
+            parts.append(transaction.group(1))
+        amount = AMOUNT_PATTERN.search(text)
+        if amount:
+            parts.append((amount.group(1) or amount.group(2)).replace(',', '') + "円")
+        return "_".join(parts) or None
+
+
+class OpenAINamingBackend:
+    """OpenAI によるファイル名の提案（OPENAI_API_KEY を使用、モデルは OPENAI_MODEL）"""
+    name = 'openai'
+    max_batch_size = 20
+
+    SYSTEM_PROMPT = (
+        "あなたは銀行の振込受付票・取引明細のファイル名を決めるアシスタントです。"
+        "各ページのOCRテキストから「振込日(YYYYMMDD)_振込先_金額円」の形式でファイル名を1つずつ提案してください。"
+        "読み取れない項目は省略し、何も読み取れない場合は null にしてください。"
+        '入力と同じ順番で {"names": [...]} のJSONだけを返してください。'
+    )
+
+    def __init__(self, latency=0.0):
+        try:
+            import openai
+        except ImportError:
+            raise BackendUnavailable("OpenAI を使用するには 'pip install openai' が必要です")
+        if not os.getenv('OPENAI_API_KEY'):
+            raise BackendUnavailable("OPENAI_API_KEY が設定されていません")
+        self.client = openai.OpenAI()
+        self.model = os.getenv('OPENAI_MODEL', DEFAULT_OPENAI_MODEL)
+
+    def suggest_names(self, texts):
+        pages = [{'page': i + 1, 'text': text[:MAX_PROMPT_CHARS]} for i, text in enumerate(texts)]
+        response = self.client.chat.completions.create(
+            model=self.model,
+            temperature=0,
+            response_format={'type': 'json_object'},
+            messages=[
+                {'role': 'system', 'content': self.SYSTEM_PROMPT},
+                {'role': 'user', 'content': json.dumps(pages, ensure_ascii=False)},
+            ],
+        )
+        try:
+            names = json.loads(response.choices[0].message.content)['names']
+        except (ValueError, KeyError, TypeError) as e:
+            raise BackendError(f"OpenAI の応答を解析できません: {e}")
+        if not isinstance(names, list) or len(names) != len(texts):
+            raise BackendError("OpenAI の応答の件数が一致しません")
+        return [str(name) if name else None for name in names]
+
+
+OCR_BACKENDS = {'vision': VisionOcrBackend, 'stub': StubOcrBackend}
+NAMING_BACKENDS = {'openai': OpenAINamingBackend, 'stub': StubNamingBackend}
+
+
+@dataclass
+class RenameConfig:
+    """OCR&AI自動リネームの設定"""
+    ocr_backend: str = 'vision'
+    naming_backend: str = 'openai'
+    concurrency: int = 4      # 同時に実行するリクエスト数
+    batch_size: int = 5       # 1リクエストにまとめるページ数（バックエンドの上限まで）
+    rate_limit: float = 5.0   # バックエンドごとの1秒あたりのリクエスト数（0 は無制限）
+    max_retries: int = 3
+    retry_delay: float = 1.0  # リトライ間隔の初期値（秒、回数ごとに倍）
+    cache_dir: Optional[Path] = None  # None の場合は OS の既定のキャッシュフォルダ
+    stub_latency: float = 0.0  # スタブバックエンドの1リクエストあたりの擬似的な待ち時間（秒）
+
+    def __post_init__(self):
+        if self.ocr_backend not in OCR_BACKENDS:
+            raise ValueError(f"不明なOCRバックエンド: {self.ocr_backend}")
+        if self.naming_backend not in NAMING_BACKENDS:
+            raise ValueError(f"不明な命名バックエンド: {self.naming_backend}")
+        self.concurrency = max(1, self.concurrency)
+        self.batch_size = max(1, self.batch_size)
+        self.max_retries = max(0, self.max_retries)
+
+    @classmethod
+    def from_env(cls):
+        """環境変数（.env）から設定を生成"""
+        cache_dir = os.getenv('RENAME_CACHE_DIR')
+        return cls(
+            ocr_backend=os.getenv('RENAME_OCR_BACKEND', 'vision').lower(),
+            naming_backend=os.getenv('RENAME_LLM_BACKEND', 'openai').lower(),
+            concurrency=int(os.getenv('RENAME_CONCURRENCY') or 4),
+            batch_size=int(os.getenv('RENAME_BATCH_SIZE') or 5),
+            rate_limit=float(os.getenv('RENAME_RATE_LIMIT') or 5.0),
+            max_retries=int(os.getenv('RENAME_MAX_RETRIES') or 3),
+            cache_dir=Path(cache_dir).expanduser() if cache_dir else None,
+            stub_latency=float(os.getenv('RENAME_STUB_LATENCY') or 0.0),
+        )
+
+
+class ResultCache:
+    """ページ内容のハッシュをキーにしたディスクキャッシュ（1件1ファイルのJSON）"""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+
+    def path(self, namespace, key):
+        return self.folder / f"v{CACHE_VERSION}" / namespace / key[:2] / f"{key}.json"
+
+    def get(self, namespace, key):
+        try:
+            with open(self.path(namespace, key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"キャッシュ読み込みエラー（再取得します）: {key}: {e}", extra=PER_PAGE)
+            return None
+
+    def put(self, namespace, key, value):
+        path = self.path(namespace, key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(path, json.dumps(value, ensure_ascii=False))
+        except OSError as e:
+            logger.warning(f"キャッシュ書き込みエラー: {key}: {e}", extra=PER_PAGE)
+
+
+class RateLimiter:
+    """トークンバケット方式のレート制限（1秒あたり rate 回）"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = None  # 使用するイベントループの中で作る
+
+    async def acquire(self):
+        import asyncio
+
+        if self.rate <= 0:
+            return
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Page:
+    """リネーム対象のページ1枚（同じ内容のページはまとめて1回だけ問い合わせる）"""
+
+    def __init__(self, digest, path):
+        self.digest = digest
+        self.path = path
+        self.text = None
+        self.name = None
+        self.error = None
+
+
+class RenameStage:
+    """分割後のページをOCRし、命名バックエンドの提案したファイル名に付け替える"""
+
+    def __init__(self, config, metrics=None, page_index=None):
+        self.config = config
+        self.metrics = metrics
+        self.page_index = page_index  # 重複検出のページ索引（リネームしたページのパスを付け替える）
+        self.cache = ResultCache(config.cache_dir or default_cache_dir())
+
+    def run(self, zip_results):
+        """ZIPごとの分割結果のページをリネームし、split_files を書き換える"""
+        targets = [(result, index, path)
+                   for result in zip_results for index, path in enumerate(result.split_files)]
+        if not targets:
+            return
+
+        try:
+            ocr = OCR_BACKENDS[self.config.ocr_backend](latency=self.config.stub_latency)
+            naming = NAMING_BACKENDS[self.config.naming_backend](latency=self.config.stub_latency)
+        except BackendUnavailable as e:
+            logger.error(f"OCR&AI自動リネームをスキップ: {e}")
+            return
+
+        start = time.perf_counter()
+        logger.info(f"OCR&AI自動リネーム開始: {len(targets)}ページ（OCR: {ocr.name}, 命名: {naming.name}）")
+
+        # 同じ内容のページは1回だけ問い合わせる
+        pages = {}
+        page_of = []
+        for result, index, path in targets:
+            try:
+                digest = file_sha256(path)
+            except OSError as e:
+                result.pdf_errors.append(f"リネームエラー ({path.name}): {e}")
+                page_of.append(None)
+                continue
+            page_of.append(pages.setdefault(digest, _Page(digest, path)))
+
+        import asyncio
+
+        asyncio.run(self.resolve_names(list(pages.values()), ocr, naming))
+
+        # 同じフォルダで同じ名前になったページは連番を付ける
+        claimed = set()
+        moves = []
+        for (result, index, path), page in zip(targets, page_of):
+            if page is None:
+                continue
+            if page.error:
+                result.pdf_errors.append(f"リネームエラー ({path.name}): {page.error}")
+                self.count_page('error')
+                continue
+            new_path = self.apply_name(path, page.digest, page.name, claimed)
+            result.split_files[index] = new_path
+            if new_path != path:
+                moves.append((path, new_path))
+                self.count_page('renamed')
+            else:
+                self.count_page('unchanged')
+        self.update_duplicates(zip_results, moves)
+
+        # 段階別の経過時間はページ数で按分してZIPごとに加算
+        elapsed = time.perf_counter() - start
+        for result, _, _ in targets:
+            result.stage_times['rename'] = result.stage_times.get('rename', 0.0) + elapsed / len(targets)
+        logger.info(f"OCR&AI自動リネーム完了: {len(moves)}/{len(targets)}ページ ({elapsed:.1f}秒)")
+
+    def update_duplicates(self, zip_results, moves):
+        """リネームしたページのパスを、重複ページの記録（処理結果・ページ索引）に反映"""
+        if not moves:
+            return
+        renamed = {path_key(old): path_key(new) for old, new in moves}
+        for result in zip_results:
+            for duplicate in result.duplicates:
+                for key in ('path', 'original'):
+                    duplicate[key] = renamed.get(duplicate[key], duplicate[key])
+            # 同じページを出力し直して元のページと同じ名前になったもの（再実行時）は重複としない
+            result.duplicates = [duplicate for duplicate in result.duplicates
+                                 if duplicate['path'] != duplicate['original']]
+        if self.page_index is not None:
+            try:
+                self.page_index.rename(moves)
+            except sqlite3.Error as e:
+                logger.error(f"ページ索引の更新エラー（リネームしたページ）: {e}")
+
+    async def resolve_names(self, pages, ocr, naming):
+        """全ページの名前をバッチ単位で並行して決定"""
+        import asyncio
+
+        semaphore = asyncio.Semaphore(self.config.concurrency)
+        limiters = {'ocr': RateLimiter(self.config.rate_limit), 'naming': RateLimiter(self.config.rate_limit)}
+        size = min(self.config.batch_size, ocr.max_batch_size, naming.max_batch_size)
+        batches = [pages[i:i + size] for i in range(0, len(pages), size)]
+        await asyncio.gather(*(self.resolve_batch(batch, ocr, naming, semaphore, limiters) for batch in batches))
+
+    async def resolve_batch(self, batch, ocr, naming, semaphore, limiters):
+        """バッチ1個分のOCR → 命名（キャッシュ済みのページは問い合わせない）"""
+        ocr_namespace = f"ocr-{ocr.name}"
+        name_namespace = f"name-{ocr.name}-{naming.name}"
+
+        uncached = []
+        for page in batch:
+            cached = self.cache.get(ocr_namespace, page.digest)
+            if cached is not None:
+                page.text = cached['text']
+            else:
+                uncached.append(page)
+        self.count_cache('ocr', len(batch) - len(uncached), len(uncached))
+        if uncached:
+            try:
+                texts = await self.call(ocr, 'recognize', [page.path for page in uncached], semaphore, limiters['ocr'])
+            except Exception as e:
+                for page in uncached:
+                    page.error = f"OCR失敗: {e}"
+            else:
+                for page, text in zip(uncached, texts):
+                    page.text = text or ""
+                    self.cache.put(ocr_namespace, page.digest, {'text': page.text})
+
+        recognized = [page for page in batch if page.error is None]
+        uncached = []
+        for page in recognized:
+            cached = self.cache.get(name_namespace, page.digest)
+            if cached is not None:
+                page.name = cached['name']
+            else:
+                uncached.append(page)
+        self.count_cache('naming', len(recognized) - len(uncached), len(uncached))
+        if uncached:
+            try:
+                names = await self.call(naming, 'suggest_names', [page.text for page in uncached],
+                                        semaphore, limiters['naming'])
+            except Exception as e:
+                for page in uncached:
+                    page.error = f"命名失敗: {e}"
+            else:
+                for page, name in zip(uncached, names):
+                    page.name = sanitize_filename(name)
+                    self.cache.put(name_namespace, page.digest, {'name': page.name})
+
+    async def call(self, backend, method, items, semaphore, limiter):
+        """レート制限・同時実行数の範囲でバックエンドを呼び出す（失敗時は指数バックオフでリトライ）"""
+        import asyncio
+
+        func = getattr(backend, method)
+        for attempt in range(self.config.max_retries + 1):
+            await limiter.acquire()
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.to_thread(func, items)
+                except BackendUnavailable:
+                    self.count_request(backend, 'error', time.perf_counter() - start)
+                    raise
+                except Exception as e:
+                    final = attempt == self.config.max_retries
+                    self.count_request(backend, 'error' if final else 'retry', time.perf_counter() - start)
+                    if final:
+                        raise
+                    delay = self.config.retry_delay * (2 ** attempt) * random.uniform(0.5, 1.0)
+                    logger.warning(f"{backend.name} 呼び出し失敗（{delay:.1f}秒後に再試行 "
+                                   f"{attempt + 1}/{self.config.max_retries}）: {e}", extra=PER_PAGE)
+                else:
+                    self.count_request(backend, 'success', time.perf_counter() - start)
+                    return result
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def apply_name(path, digest, name, claimed):
+        """ページのファイル名を付け替えて新しいパスを返す
+
+        既存ファイルと名前が重なる場合、内容が同じなら置き換え（再実行時）、異なれば連番を付ける。
+        """
+        stem = sanitize_filename(name)
+        if not stem:
+            return path
+        number = 1
+        while True:
+            candidate = path.with_name(f"{stem}.pdf" if number == 1 else f"{stem}_{number}.pdf")
+            number += 1
+            if candidate == path:
+                return path
+            if candidate in claimed:
+                continue
+            if candidate.exists() and file_sha256(candidate) != digest:
+                continue
+            os.replace(path, candidate)
+            claimed.add(candidate)
+            return candidate
+
+    def count_page(self, status):
+        if self.metrics is not None:
+            self.metrics.rename_pages.inc(status=status)
+
+    def count_cache(self, stage, hits, misses):
+        if self.metrics is not None:
+            self.metrics.rename_cache.inc(hits, stage=stage, result='hit')
+            self.metrics.rename_cache.inc(misses, stage=stage, result='miss')
+
+    def count_request(self, backend, status, seconds):
+        if self.metrics is not None:
+            self.metrics.rename_requests.inc(backend=backend.name, status=status)
+            self.metrics.rename_request_seconds.observe(seconds, backend=backend.name)
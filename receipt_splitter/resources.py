@@ -0,0 +1,191 @@
+"""分割時の共有リソース最適化
+
+1ページずつ PdfWriter に書き出すと、ページが参照するリソース辞書の中身
+（全ページ共通のフォント・画像など）がページごとに丸ごと複製される。
+ここでは各ページについて
+
+* コンテンツストリームで使われていないリソースを除去し
+* 非圧縮のストリーム（埋め込みフォント・画像・コンテンツ）を FlateDecode で可逆圧縮する
+
+圧縮はPDF（PdfReader）1個につき共有オブジェクトごとに1回だけ行い、
+以降のページでは圧縮済みのオブジェクトを再利用する。
+"""
+import hashlib
+import logging
+import re
+import zlib
+
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    EncodedStreamObject,
+    IndirectObject,
+    NameObject,
+    StreamObject,
+)
+
+from .logs import PER_PAGE
+
+logger = logging.getLogger(__name__)
+
+# 使われていなければ除去してよいリソースの種類
+PRUNABLE_CATEGORIES = ('/XObject', '/Font', '/ExtGState', '/Pattern', '/Shading', '/ColorSpace', '/Properties')
+# コンテンツストリーム中の名前トークン
+NAME_TOKEN = re.compile(rb"/([^\s/\[\]()<>{}%]*)")
+# これより小さいストリームは圧縮しても効果が薄い
+MIN_COMPRESS_SIZE = 256
+# 辿らないキー（ページツリーや注釈の親へ戻る参照）
+SKIP_KEYS = ('/Parent', '/P')
+
+
+def stream_size(obj):
+    return len(obj._data or b"") if isinstance(obj, StreamObject) else 0
+
+
+def page_content_data(page):
+    """ページのコンテンツストリーム（複数ある場合は連結）を展開して返す"""
+    contents = page.get('/Contents')
+    if contents is None:
+        return b""
+    contents = contents.get_object()
+    if isinstance(contents, ArrayObject):
+        return b"\n".join(part.get_object().get_data() for part in contents)
+    return contents.get_data()
+
+
+def page_fingerprint(page):
+    """ページの描画内容のフィンガープリント（SHA-256）
+
+    用紙サイズ・回転・コンテンツストリームと、参照する画像・フォーム（XObject）の元のデータから計算する。
+    オブジェクト番号や作成日時などには左右されないため、別のZIPで再送された同じ明細のページも一致する。
+    共有リソース最適化で圧縮する前に計算すること。
+    """
+    digest = hashlib.sha256()
+    digest.update(repr([float(value) for value in page.mediabox]).encode())
+    digest.update(str(page.get('/Rotate', 0)).encode())
+    digest.update(page_content_data(page))
+    resources = page.get('/Resources')
+    xobjects = resources.get_object().get('/XObject') if resources is not None else None
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode('latin-1'))
+            digest.update(hashlib.sha256(getattr(xobjects[name].get_object(), '_data', None) or b"").digest())
+    return digest.digest()
+
+
+class SharedResourceOptimizer:
+    """PDF1個（PdfReader）ごとの共有リソース最適化"""
+
+    def __init__(self, reader):
+        self.reset(reader)
+        self.bytes_saved = 0   # 推定削減バイト数（従来の分割結果との比較）
+        self.pruned_count = 0
+        self.compressed_count = 0
+
+    def reset(self, reader):
+        """同じPDFを読み直したリーダーに切り替える（集計値は引き継ぐ）"""
+        self.reader = reader
+        self.checked = set()   # 圧縮要否を確認済みのオブジェクト (generation, idnum)
+        self.savings = {}      # 圧縮したオブジェクト -> 削減バイト数
+
+    def optimize_page(self, page):
+        """ページを書き出す前に最適化し、そのページの推定削減バイト数を返す"""
+        saved = self.prune_unused(page) + self.compress_reachable(page)
+        self.bytes_saved += saved
+        return saved
+
+    def prune_unused(self, page):
+        """コンテンツストリームで参照されていないリソースを除去"""
+        resources = page.get('/Resources')
+        if resources is None:
+            return 0
+        resources = resources.get_object()
+
+        try:
+            used = {token.decode('latin-1') for token in NAME_TOKEN.findall(page_content_data(page))}
+        except Exception as e:
+            # 展開できないフィルターなどは安全側に倒して除去しない
+            logger.debug(f"コンテンツ解析不可のためリソース除去をスキップ: {e}", extra=PER_PAGE)
+            return 0
+
+        saved = 0
+        pruned = 0
+        new_resources = DictionaryObject()
+        for key, value in resources.items():
+            category = value.get_object() if key in PRUNABLE_CATEGORIES else None
+            if not isinstance(category, DictionaryObject):
+                new_resources[NameObject(key)] = value
+                continue
+
+            kept = DictionaryObject()
+            for name, ref in category.items():
+                # 名前にエスケープ（#xx）を含む場合は照合できないため残す
+                if name[1:] in used or '#' in name:
+                    kept[NameObject(name)] = ref
+                else:
+                    saved += self.estimate_size(ref)
+                    pruned += 1
+            new_resources[NameObject(key)] = kept
+
+        if pruned:
+            page[NameObject('/Resources')] = new_resources
+            self.pruned_count += pruned
+        return saved
+
+    def iter_reachable(self, root):
+        """root から辿れる間接オブジェクトを (参照, オブジェクト) で列挙"""
+        seen = set()
+        stack = [root]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, IndirectObject):
+                key = (item.generation, item.idnum)
+                if key in seen:
+                    continue
+                seen.add(key)
+                obj = item.get_object()
+                yield key, obj
+                item = obj
+            if isinstance(item, DictionaryObject):
+                stack.extend(value for key, value in item.items() if key not in SKIP_KEYS)
+            elif isinstance(item, ArrayObject):
+                stack.extend(item)
+
+    def estimate_size(self, ref):
+        """オブジェクトとそこから辿れるストリームのおおよそのバイト数"""
+        return sum(stream_size(obj) for _, obj in self.iter_reachable(ref))
+
+    def compress_reachable(self, page):
+        """ページから辿れる非圧縮ストリームを圧縮（共有オブジェクトは初回のみ圧縮して再利用）"""
+        saved = 0
+        roots = ArrayObject([value for key, value in page.items() if key in ('/Resources', '/Contents')])
+        for key, obj in self.iter_reachable(roots):
+            if key not in self.checked:
+                self.checked.add(key)
+                self.compress_object(key, obj)
+            saved += self.savings.get(key, 0)
+        return saved
+
+    def compress_object(self, key, obj):
+        """非圧縮ストリームを圧縮版に差し替える（PdfReader のキャッシュを置き換える）"""
+        if not isinstance(obj, StreamObject) or '/Filter' in obj:
+            return
+        original_size = stream_size(obj)
+        if original_size < MIN_COMPRESS_SIZE:
+            return
+
+        compressed = EncodedStreamObject()
+        for name, value in obj.items():
+            if name not in ('/Length', '/DecodeParms'):
+                compressed[NameObject(name)] = value
+        compressed[NameObject('/Filter')] = NameObject('/FlateDecode')
+        compressed._data = zlib.compress(obj._data, 9)
+        if len(compressed._data) >= original_size:
+            return
+
+        generation, idnum = key
+        self.reader.resolved_objects[key] = compressed
+        compressed.indirect_reference = IndirectObject(idnum, generation, self.reader)
+        self.savings[key] = original_size - len(compressed._data)
+        self.compressed_count += 1
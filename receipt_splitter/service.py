@@ -0,0 +1,742 @@
+"""サービスモード: 解凍・分割を HTTP API で受け付け、共有ジョブキューから複数のワーカーで処理する
+
+ZIPのアップロード、またはサービスのマシン上のZIP・フォルダのパスを投入すると、ZIP1個ごとにジョブとしてキューに入れる。
+サービス内のワーカースレッド、同じマシンの `worker --root` プロセス、別のホストの `worker --server` プロセスが
+キューからジョブを取り出して処理し、分割ページは API からページごと、またはアーカイブ1個として取得できる。
+外部のサービスは使わず、標準ライブラリの HTTP サーバーと SQLite だけで動作する。
+"""
+import hmac
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import zipfile
+from dataclasses import dataclass, fields, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path, PurePosixPath
+
+from .engine import DISCOVERY_BATCH, JobConfig, SplitterEngine, iter_collect_zip_files
+from .extraction import COPY_BUFSIZE
+from .jobqueue import (DEFAULT_LEASE, QUEUE_NAME, TASK_CANCELLED, TASK_DONE, TASK_FAILED, TASK_STATES, JobQueue,
+                       QueueTask)
+from .manifest import atomic_open
+from .metrics import PipelineMetrics
+from .paths import default_cache_dir
+from .sinks import SINK_FILES, SINK_TAR, SINK_ZIP
+from .strategies import SplitStrategy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_UPLOAD_MB = 1024
+POLL_INTERVAL = 1.0  # キューが空の間にジョブを確認する間隔（秒）
+HEARTBEAT_INTERVAL = 5.0  # リースの延長・中止要求の確認の間隔（秒、リースの 1/3 が短ければそちら）
+MB = 1024 * 1024
+
+# API から上書きできるジョブ設定（出力先・並列処理数などサービス側で決める項目は除く）
+TASK_OPTIONS = ('extract_option', 'overwrite', 'split_pdf', 'strategy', 'stream_pdfs', 'optimize_resources',
+                'compact_images', 'image_dpi', 'jpeg_quality', 'low_memory', 'page_window', 'dedup', 'output_sink',
+                'preflight', 'recursive', 'max_depth')
+
+ARCHIVE_TYPES = {SINK_ZIP: 'application/zip', SINK_TAR: 'application/x-tar'}
+JOB_PATH = re.compile(r'^/jobs/(\d+)(?:/([a-z]+)(?:/(.+))?)?$')
+
+
+def default_service_root():
+    """既定のサービスの作業フォルダ（キュー・アップロード・出力）"""
+    return default_cache_dir() / "service"
+
+
+@dataclass
+class ServiceConfig:
+    """サービスモードの設定"""
+    host: str = DEFAULT_HOST
+    port: int = DEFAULT_PORT
+    root: Path = None            # 作業フォルダ（None の場合は既定の場所）
+    workers: int = 1             # サービス内でジョブを処理するワーカーの数（0 は受け付けのみ）
+    token: str = ''              # 設定した場合は Authorization: Bearer <token> を要求する
+    lease: float = DEFAULT_LEASE
+    max_upload: int = DEFAULT_MAX_UPLOAD_MB * MB
+    allow_paths: bool = True     # サービスのマシン上のパスの投入を受け付ける
+
+    def __post_init__(self):
+        self.root = Path(self.root).expanduser() if self.root else default_service_root()
+        self.workers = max(0, self.workers)
+        self.lease = max(5.0, self.lease)
+        self.max_upload = max(MB, self.max_upload)
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """環境変数（.env）から設定を生成"""
+        config = cls(
+            host=os.getenv('SERVICE_HOST', DEFAULT_HOST),
+            port=int(os.getenv('SERVICE_PORT', str(DEFAULT_PORT))),
+            root=os.getenv('SERVICE_ROOT') or None,
+            workers=int(os.getenv('SERVICE_WORKERS', '1')),
+            token=os.getenv('SERVICE_TOKEN', ''),
+            lease=float(os.getenv('SERVICE_LEASE', str(DEFAULT_LEASE))),
+            max_upload=int(float(os.getenv('SERVICE_MAX_UPLOAD_MB', str(DEFAULT_MAX_UPLOAD_MB))) * MB),
+            allow_paths=os.getenv('SERVICE_ALLOW_PATHS', 'True').lower() == 'true',
+        )
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(config, key, value)
+        config.__post_init__()
+        return config
+
+    @property
+    def queue_path(self):
+        return self.root / QUEUE_NAME
+
+    @property
+    def uploads_dir(self):
+        return self.root / "uploads"
+
+    @property
+    def outputs_dir(self):
+        return self.root / "outputs"
+
+
+def task_options(options):
+    """API で指定されたジョブ設定の上書きを検証（未知の項目・不正な値は ValueError）"""
+    if options is None:
+        return {}
+    if not isinstance(options, dict) or not isinstance(options.get('strategy') or {}, dict):
+        raise ValueError("設定は JSON オブジェクトで指定してください")
+    unknown = set(options) - set(TASK_OPTIONS)
+    if unknown:
+        raise ValueError(f"指定できない設定です: {', '.join(sorted(unknown))}")
+    try:
+        task_config(JobConfig(), options)
+    except TypeError as e:
+        raise ValueError(f"設定の値が正しくありません: {e}")
+    return dict(options)
+
+
+def task_config(base_config, options, output_dir=None):
+    """ジョブの設定（サービスの設定にジョブごとの上書きを反映）"""
+    values = {key: value for key, value in options.items() if key != 'strategy'}
+    if options.get('strategy') is not None:
+        strategy = {key: value for key, value in options['strategy'].items()
+                    if key in {f.name for f in fields(SplitStrategy)} and key != 'text_cache'}
+        values['strategy'] = replace(base_config.strategy, **strategy)
+    # 再開・増分処理はキューで管理するため、ジョブ台帳・マニフェストは使わない
+    return replace(base_config, **values, output_dir=output_dir, incremental=False, ledger_path=None)
+
+
+def task_status(result):
+    """ZipResult の内容からジョブの終了状態を決める"""
+    if result.cancelled:
+        return TASK_CANCELLED
+    return TASK_FAILED if result.error or result.pdf_errors else TASK_DONE
+
+
+class LocalQueueClient:
+    """同じマシンのワーカー: キューのファイルを直接開き、ZIP・出力先もそのまま使う"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def claim(self, worker, lease):
+        return self.queue.claim(worker, lease)
+
+    def heartbeat(self, task, worker, lease):
+        return self.queue.heartbeat(task.id, worker, lease)
+
+    def finish(self, task, worker, status, result=None, error=None):
+        return self.queue.finish(task.id, worker, status, result, error)
+
+    def release(self, task, worker):
+        self.queue.release(task.id, worker)
+
+    def prepare(self, task, workdir):
+        """処理するZIPと出力先"""
+        return task.source, task.output_dir
+
+    def publish(self, task, worker, result):
+        """処理結果（出力はすでにサービスの出力先にある）"""
+        return result
+
+
+class RemoteQueueClient:
+    """別のホストのワーカー: HTTP API でジョブを取り出し、ZIPをダウンロードして処理し、アーカイブをアップロードする"""
+
+    def __init__(self, server, token='', timeout=60.0):
+        self.server = server.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, content_type='application/json', query=None):
+        url = f"{self.server}{path}"
+        if query:
+            url += '?' + urllib.parse.urlencode(query)
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(url, data=body, method=method)
+        if body is not None:
+            request.add_header('Content-Type', content_type)
+        if self.token:
+            request.add_header('Authorization', f"Bearer {self.token}")
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def call(self, method, path, body=None, **kwargs):
+        """JSON を返す API を呼ぶ（本文のない応答は None）"""
+        try:
+            with self.request(method, path, body, **kwargs) as response:
+                data = response.read()
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode('utf-8', 'replace')
+            try:
+                detail = json.loads(detail).get('error', detail)
+            except (ValueError, AttributeError):
+                pass
+            if e.code == 409:
+                raise LookupError(detail)
+            raise OSError(f"サービスのエラー（{e.code}）: {detail}")
+        return json.loads(data) if data else None
+
+    def claim(self, worker, lease):
+        data = self.call('POST', '/queue/claim', {'worker': worker, 'lease': lease})
+        return QueueTask.from_dict(data) if data else None
+
+    def heartbeat(self, task, worker, lease):
+        return self.call('POST', f'/jobs/{task.id}/heartbeat', {'worker': worker, 'lease': lease})['cancel']
+
+    def finish(self, task, worker, status, result=None, error=None):
+        data = self.call('POST', f'/jobs/{task.id}/finish',
+                         {'worker': worker, 'status': status, 'result': result, 'error': error})
+        return data['recorded']
+
+    def release(self, task, worker):
+        self.call('POST', f'/jobs/{task.id}/release', {'worker': worker})
+
+    def prepare(self, task, workdir):
+        """ZIPを作業フォルダにダウンロードする（出力も作業フォルダに書き込み、終了後にアップロードする）"""
+        source = Path(workdir) / task.source.name
+        with self.request('GET', f'/jobs/{task.id}/source') as response, open(source, 'wb') as f:
+            shutil.copyfileobj(response, f, COPY_BUFSIZE)
+        return source, Path(workdir) / "output"
+
+    def publish(self, task, worker, result):
+        """出力アーカイブをサービスにアップロードし、結果のパスをサービス側の保存先に書き換える"""
+        archive = result.get('output_archive')
+        if not archive or not Path(archive).exists():
+            return result
+        with open(archive, 'rb') as f:
+            data = self.call('PUT', f'/jobs/{task.id}/output', f.read(), content_type='application/octet-stream',
+                             query={'worker': worker, 'name': Path(archive).name})
+        stored = Path(data['path'])
+        # サブフォルダ・入れ子のZIPのページはアーカイブ内のパスのまま書き換える
+        return dict(result, extract_path=str(stored.parent), output_archive=str(stored),
+                    split_files=[str(stored / page_name(page, archive)) for page in result.get('split_files', [])])
+
+
+class QueueWorker:
+    """キューからジョブを1件ずつ取り出して SplitterEngine で処理するワーカー
+
+    処理中は HEARTBEAT_INTERVAL ごとにリースを延長し、中止が要求されていれば処理を中止する。
+    停止時は処理中のジョブをページの区切りで中止し、キューに戻して別のワーカーが続きを処理できるようにする。
+    """
+
+    def __init__(self, client, base_config, name=None, lease=DEFAULT_LEASE, poll_interval=POLL_INTERVAL,
+                 metrics=None, on_result=None, remote=False):
+        self.client = client
+        self.base_config = base_config
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.on_result = on_result
+        self.remote = remote
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.engine = None
+
+    def run_forever(self):
+        """停止されるまでジョブを取り出して処理する"""
+        logger.info(f"ワーカー開始: {self.name}")
+        while not self.stop_event.is_set():
+            try:
+                task = self.client.claim(self.name, self.lease)
+            except (OSError, ValueError) as e:
+                logger.error(f"ジョブの取り出しエラー: {e}")
+                task = None
+            if task is None:
+                self.stop_event.wait(self.poll_interval)
+                continue
+            self.process(task)
+        logger.info(f"ワーカー終了: {self.name}")
+
+    def process(self, task):
+        """ジョブ1件を処理して結果を記録"""
+        logger.info(f"ジョブ {task.id} 開始: {task.source.name}（ワーカー: {self.name}）")
+        with tempfile.TemporaryDirectory(prefix="receipt-splitter-") as workdir:
+            try:
+                source, output_dir = self.client.prepare(task, workdir)
+                config = task_config(self.base_config, task.options, output_dir)
+                if self.remote and config.output_sink == SINK_FILES:
+                    # 別のホストでは出力をアーカイブ1個にまとめてアップロードする
+                    config = replace(config, output_sink=SINK_ZIP)
+            except (OSError, ValueError, LookupError) as e:
+                self.record(task, TASK_FAILED, error=f"ジョブの準備エラー: {e}")
+                return
+
+            self.engine = SplitterEngine(config, metrics=self.metrics)
+            lost = threading.Event()
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self.keep_lease, args=(task, lost, done),
+                                         name=f"lease-{task.id}", daemon=True)
+            heartbeat.start()
+            try:
+                job_result = self.engine.run([source])
+            except Exception as e:
+                logger.error(f"ジョブ {task.id} 処理エラー: {e}")
+                job_result = None
+                error = str(e)
+            finally:
+                done.set()
+                heartbeat.join()
+                self.engine = None
+
+            if lost.is_set():
+                logger.warning(f"ジョブ {task.id} のリースを失ったため結果を記録しません")
+                return
+            if job_result is None:
+                self.record(task, TASK_FAILED, error=error)
+                return
+            if job_result.cancelled and self.stop_event.is_set():
+                # ワーカーの停止による中止 → 別のワーカーが処理し直せるようキューに戻す
+                try:
+                    self.client.release(task, self.name)
+                except (OSError, LookupError) as e:
+                    logger.error(f"ジョブ {task.id} をキューに戻せません: {e}")
+                return
+
+            zip_result = job_result.zip_results[0] if job_result.zip_results else None
+            if zip_result is None:
+                self.record(task, TASK_CANCELLED if job_result.cancelled else TASK_FAILED,
+                            error=None if job_result.cancelled else "処理結果がありません")
+                return
+            try:
+                result = self.client.publish(task, self.name, zip_result.to_dict())
+            except (OSError, LookupError) as e:
+                self.record(task, TASK_FAILED, zip_result.to_dict(), error=f"出力のアップロードエラー: {e}")
+                return
+            self.record(task, task_status(zip_result), result, zip_result.error)
+            if self.on_result is not None:
+                self.on_result(task, result)
+
+    def record(self, task, status, result=None, error=None):
+        try:
+            if not self.client.finish(task, self.name, status, result, error):
+                logger.warning(f"ジョブ {task.id} のリースを失ったため結果を記録しません")
+                return
+        except (OSError, LookupError) as e:
+            logger.error(f"ジョブ {task.id} の結果の記録エラー: {e}")
+            return
+        log = logger.info if status == TASK_DONE else logger.warning
+        log(f"ジョブ {task.id} 終了: {status}" + (f"（{error}）" if error else ""))
+
+    def keep_lease(self, task, lost, done):
+        """処理中のリースを延長し、中止の要求・リースの喪失で処理を中止する"""
+        while not done.wait(min(HEARTBEAT_INTERVAL, self.lease / 3)):
+            try:
+                cancel = self.client.heartbeat(task, self.name, self.lease)
+            except LookupError:
+                lost.set()
+                cancel = True
+            except OSError as e:
+                # 一時的な通信エラーは次の延長で再試行する（リースが切れれば別のワーカーが取り直す）
+                logger.warning(f"ジョブ {task.id} のリース延長エラー: {e}")
+                continue
+            if cancel and self.engine is not None:
+                logger.info(f"ジョブ {task.id} を中止します")
+                self.engine.cancel()
+
+    def start(self):
+        """ワーカースレッドを起動"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run_forever, name=f"queue-worker-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """ワーカーを停止（処理中のジョブは中止してキューに戻す）"""
+        self.stop_event.set()
+        engine = self.engine
+        if engine is not None:
+            engine.cancel()
+        if wait and self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP API の要求処理（要求ごとのスレッドで実行）"""
+    server_version = "receipt-splitter"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.debug(f"HTTP {self.address_string()}: {format % args}")
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if not self.authorized():
+            return self.send_json(401, {'error': "認証が必要です"})
+        try:
+            handler, args = self.route(method, url.path)
+            if handler is None:
+                return self.send_json(404, {'error': f"見つかりません: {method} {url.path}"})
+            handler(*args)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except LookupError as e:
+            self.send_json(409, {'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.error(f"API エラー: {method} {url.path}: {e}")
+            self.send_json(500, {'error': str(e)})
+
+    def route(self, method, path):
+        if path == '/health' and method == 'GET':
+            return self.get_health, ()
+        if path == '/jobs':
+            return {'GET': self.list_jobs, 'POST': self.submit_jobs}.get(method), ()
+        if path == '/queue/claim' and method == 'POST':
+            return self.claim_job, ()
+        match = JOB_PATH.match(path)
+        if not match:
+            return None, ()
+        task_id, action, name = int(match.group(1)), match.group(2), match.group(3)
+        routes = {
+            ('GET', None): self.get_job,
+            ('DELETE', None): self.cancel_job,
+            ('GET', 'pages'): self.get_pages,
+            ('GET', 'archive'): self.get_archive,
+            ('GET', 'source'): self.get_source,
+            ('POST', 'heartbeat'): self.heartbeat_job,
+            ('POST', 'finish'): self.finish_job,
+            ('POST', 'release'): self.release_job,
+            ('PUT', 'output'): self.put_output,
+        }
+        handler = routes.get((method, action))
+        if handler is None:
+            return None, ()
+        task = self.service.queue.get(task_id)
+        if task is None:
+            return self.not_found, (f"ジョブがありません: {task_id}",)
+        if action == 'pages':
+            return handler, (task, urllib.parse.unquote(name) if name else None)
+        return (handler, (task,)) if name is None else (None, ())
+
+    def authorized(self):
+        token = self.service.config.token
+        if not token:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}")
+
+    # --- 応答 ---
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, path, content_type, name=None):
+        size = path.stat().st_size
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        self.send_header('Content-Disposition', content_disposition(name or path.name))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, COPY_BUFSIZE)
+
+    def not_found(self, message):
+        self.send_json(404, {'error': message})
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MB:
+            raise ValueError("要求が大きすぎます")
+        try:
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise ValueError("JSON の形式が正しくありません")
+        if not isinstance(data, dict):
+            raise ValueError("JSON オブジェクトを指定してください")
+        return data
+
+    # --- ジョブの投入・参照 ---
+
+    def get_health(self):
+        self.send_json(200, {'status': 'ok', 'jobs': self.service.queue.counts(),
+                             'workers': len(self.service.workers)})
+
+    def list_jobs(self):
+        status = self.query.get('status')
+        if status and status not in TASK_STATES:
+            raise ValueError(f"不明な状態: {status}")
+        tasks = self.service.queue.list_tasks(status, self.query.get('batch'), int(self.query.get('limit', 100)))
+        self.send_json(200, {'jobs': [task.to_dict() for task in tasks]})
+
+    def submit_jobs(self):
+        """ジョブの投入（JSON でパスを指定、または ZIP ファイルをそのまま送信）"""
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+        if content_type == 'application/json':
+            data = self.read_json()
+            if 'path' not in data:
+                raise ValueError("path を指定してください")
+            tasks = self.service.submit_path(data['path'], data.get('options'))
+        else:
+            options = json.loads(self.query['options']) if self.query.get('options') else None
+            tasks = self.service.submit_upload(self.rfile, int(self.headers.get('Content-Length') or 0),
+                                               self.query.get('name', 'upload.zip'), options)
+        self.send_json(201, {'batch': tasks[0].batch, 'jobs': [task.to_dict() for task in tasks]})
+
+    def get_job(self, task):
+        self.send_json(200, task.to_dict())
+
+    def cancel_job(self, task):
+        self.send_json(200, self.service.queue.cancel(task.id).to_dict())
+
+    def get_pages(self, task, name):
+        """分割ページの一覧、または name のページ"""
+        pages = self.service.output_pages(task)
+        if name is None:
+            return self.send_json(200, {'id': task.id, 'status': task.status, 'pages': sorted(pages)})
+        if name not in pages:
+            return self.not_found(f"ページがありません: {name}")
+        path = pages[name]
+        archive = task.result.get('output_archive') if task.result else None
+        if not archive:
+            return self.send_file(path, 'application/pdf')
+        # アーカイブ内のページは取り出して返す
+        data = read_archive_member(Path(archive), name)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Content-Disposition', content_disposition(PurePosixPath(name).name))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def get_archive(self, task):
+        """分割ページをアーカイブ1個で返す（アーカイブ出力ならそのファイル、ファイル出力なら ZIP にまとめながら送る）"""
+        pages = self.service.output_pages(task)
+        archive = task.result.get('output_archive') if task.result else None
+        if archive and Path(archive).exists():
+            sink = SINK_TAR if archive.endswith('.tar') else SINK_ZIP
+            return self.send_file(Path(archive), ARCHIVE_TYPES[sink])
+        # 長さが決まらないため接続の終了で本文の終わりを示す
+        self.send_response(200)
+        self.send_header('Content-Type', ARCHIVE_TYPES[SINK_ZIP])
+        self.send_header('Content-Disposition', content_disposition(f"{task.source.stem}_pages.zip"))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        with zipfile.ZipFile(self.wfile, 'w', zipfile.ZIP_STORED) as bundle:
+            for name in sorted(pages):
+                bundle.write(pages[name], name)
+
+    # --- ワーカー用 ---
+
+    def claim_job(self):
+        data = self.read_json()
+        task = self.service.queue.claim(str(data.get('worker') or self.client_address[0]),
+                                        float(data.get('lease') or self.service.config.lease))
+        if task is None:
+            return self.send_json(200, None)
+        self.send_json(200, task.to_dict())
+
+    def heartbeat_job(self, task):
+        data = self.read_json()
+        cancel = self.service.queue.heartbeat(task.id, data.get('worker'),
+                                              float(data.get('lease') or self.service.config.lease))
+        self.send_json(200, {'cancel': cancel})
+
+    def finish_job(self, task):
+        data = self.read_json()
+        recorded = self.service.queue.finish(task.id, data.get('worker'), data.get('status'),
+                                             data.get('result'), data.get('error'))
+        self.send_json(200, {'recorded': recorded})
+
+    def release_job(self, task):
+        data = self.read_json()
+        self.service.queue.release(task.id, data.get('worker'))
+        self.send_json(200, {'released': True})
+
+    def get_source(self, task):
+        if not task.source.is_file():
+            return self.not_found(f"ZIPファイルがありません: {task.source.name}")
+        self.send_file(task.source, 'application/zip')
+
+    def put_output(self, task):
+        """別のホストのワーカーが作った出力アーカイブを受け取り、ジョブの出力先に保存する"""
+        if task.worker != self.query.get('worker'):
+            raise LookupError(f"ジョブ {task.id} のリースがありません")
+        name = Path(self.query.get('name', '')).name
+        if not name.endswith(('.zip', '.tar')):
+            raise ValueError(f"アーカイブのファイル名ではありません: {name}")
+        path = task.output_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        receive_body(self.rfile, int(self.headers.get('Content-Length') or 0), path, self.service.config.max_upload)
+        self.send_json(200, {'path': str(path)})
+
+
+def page_name(page, base):
+    """分割ページの名前（解凍先・アーカイブからの相対パス、区切りは「/」）"""
+    path = Path(page)
+    try:
+        return path.relative_to(base).as_posix()
+    except ValueError:
+        return path.name
+
+
+def content_disposition(name):
+    return f"attachment; filename*=UTF-8''{urllib.parse.quote(name)}"
+
+
+def receive_body(stream, length, path, limit):
+    """要求の本文を path に書き込む（一時ファイル経由、上限を超える場合は ValueError）"""
+    if length <= 0:
+        raise ValueError("本文がありません（Content-Length を指定してください）")
+    if length > limit:
+        raise ValueError(f"サイズの上限（{limit // MB}MB）を超えています")
+    with atomic_open(path) as f:
+        remaining = length
+        while remaining:
+            chunk = stream.read(min(COPY_BUFSIZE, remaining))
+            if not chunk:
+                raise ValueError("本文が途中で終わりました")
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def read_archive_member(archive, name):
+    """分割ページのアーカイブからページ1個を読み込む"""
+    if archive.suffix == '.tar':
+        with tarfile.open(archive, 'r:') as bundle:
+            return bundle.extractfile(name).read()
+    with zipfile.ZipFile(archive, 'r') as bundle:
+        return bundle.read(name)
+
+
+class SplitterService:
+    """HTTP API・ジョブキュー・サービス内のワーカーをまとめたサービス"""
+
+    def __init__(self, config, base_config=None, metrics=None):
+        self.config = config
+        self.base_config = base_config if base_config is not None else JobConfig.from_env()
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.queue = JobQueue(config.queue_path)
+        self.workers = [QueueWorker(LocalQueueClient(self.queue), self.base_config,
+                                    name=f"{socket.gethostname()}-{os.getpid()}-{i + 1}",
+                                    lease=config.lease, metrics=self.metrics)
+                        for i in range(config.workers)]
+        self.httpd = ThreadingHTTPServer((config.host, config.port), ServiceHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.service = self
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit_path(self, path, options=None):
+        """サービスのマシン上のZIP・フォルダ・globパターンを投入"""
+        if not self.config.allow_paths:
+            raise ValueError("パスの投入は無効です（SERVICE_ALLOW_PATHS）")
+        options = task_options(options)
+        config = task_config(self.base_config, options)
+        batch = uuid.uuid4().hex[:12]
+        tasks = []
+        # サブフォルダを探索する場合も、見つかった分から投入してワーカーが処理を始められるようにする
+        zip_files = iter_collect_zip_files([str(path)], config.recursive, config.max_depth)
+        while found := list(itertools.islice(zip_files, DISCOVERY_BATCH)):
+            tasks.extend(self.queue.submit(found, options, batch=batch, output_root=self.config.outputs_dir))
+        if not tasks:
+            raise ValueError(f"ZIPファイルが見つかりません: {path}")
+        logger.info(f"ジョブ投入: {path}（{len(tasks)}件）")
+        return tasks
+
+    def submit_upload(self, stream, length, name, options=None):
+        """送信されたZIPを保存して投入"""
+        options = task_options(options)
+        name = Path(name).name
+        if not name.lower().endswith('.zip'):
+            raise ValueError(f"ZIPファイル名を指定してください: {name}")
+        batch = uuid.uuid4().hex[:12]
+        path = self.config.uploads_dir / batch / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        receive_body(stream, length, path, self.config.max_upload)
+        if not zipfile.is_zipfile(path):
+            shutil.rmtree(path.parent, ignore_errors=True)
+            raise ValueError(f"ZIPファイルではありません: {name}")
+        tasks = self.queue.submit([path], options, batch=batch, output_root=self.config.outputs_dir)
+        logger.info(f"ジョブ投入: {name}（アップロード {length / MB:.1f}MB）")
+        return tasks
+
+    def output_pages(self, task):
+        """終了したジョブの分割ページ（解凍先・アーカイブからの相対パス → パス）
+
+        サブフォルダ・入れ子のZIPのページは同じ名前でも別のページとして扱えるよう、相対パスをページ名とする。
+        """
+        if not task.finished:
+            raise LookupError(f"ジョブ {task.id} はまだ終了していません（{task.status}）")
+        if not task.result:
+            return {}
+        base = task.result.get('output_archive') or task.result.get('extract_path') or ''
+        return {page_name(page, base): Path(page) for page in task.result.get('split_files', [])}
+
+    def serve_forever(self):
+        """停止されるまで要求を受け付ける"""
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"サービス開始: {self.address}（ワーカー: {len(self.workers)}, 作業フォルダ: {self.config.root}）")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """serve_forever() を終了させる（別のスレッド・シグナルハンドラーから呼ぶ）"""
+        threading.Thread(target=self.httpd.shutdown, daemon=True).start()
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop_event.set()
+        for worker in self.workers:
+            worker.stop()
+        self.httpd.server_close()
+        self.queue.close()
+        logger.info("サービス終了")
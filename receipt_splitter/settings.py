@@ -0,0 +1,149 @@
+"""画面の設定の保存（.env をメモリ上で更新し、まとめて一時ファイル経由で書き込む）"""
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+from .manifest import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+SAVE_DELAY = 1.0  # 最後の変更からファイルに書き込むまでの待ち時間（秒）
+
+HEADER = "# Transfer Receipt Splitter 設定ファイル"
+ENV_LINE = re.compile(r'^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_.]*)\s*=\s*(.*)$')
+NEEDS_QUOTE = re.compile(r"""^\s|\s$|\s#|["'\n\r]""")
+
+
+def parse_value(raw):
+    """.env の値を取り出す（引用符を外し、引用符のない値の行末コメントを除く）"""
+    raw = raw.strip()
+    if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in "'\"":
+        return re.sub(r"\\([\\'\"])", r"\1", raw[1:-1])
+    return re.split(r'\s+#', raw, maxsplit=1)[0]
+
+
+def format_value(value):
+    """.env に書き込む値（python-dotenv で元の値に戻る形式。Windows のパスは引用符なしのまま書く）"""
+    value = str(value)
+    if not NEEDS_QUOTE.search(value):
+        return value
+    escaped = value.replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+class SettingsStore:
+    """.env に保存する設定
+
+    set() / update() はメモリ上の値を更新してタイマーを掛け直すだけで、ファイルは読み書きしない。
+    最後の変更から delay 秒たつと別スレッドで .env を読み直し、変更したキーの行だけを置き換えて
+    一時ファイル経由で書き込む。コメント・キーの順番・API キーなど、この画面が扱わないキーはそのまま残す。
+    ファイルは最初に値を参照したとき（get）か書き込むときまで読まない。終了時は close() で書き残しを反映する。
+    """
+
+    def __init__(self, path='.env', delay=SAVE_DELAY):
+        self.path = Path(path)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.values = None  # ファイルの内容（最初に参照したときに読み込む）
+        self.pending = {}   # まだ書き込んでいない変更
+        self.timer = None
+
+    def load(self):
+        """.env のキーと値を読み込む（存在しない場合は空）"""
+        values = {}
+        for line in self.read_lines():
+            match = ENV_LINE.match(line)
+            if match:
+                values[match.group(1)] = parse_value(match.group(2))
+        return values
+
+    def read_lines(self):
+        try:
+            return self.path.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            return []
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.pending:
+                return self.pending[key]
+            if self.values is None:
+                self.values = self.load()
+            return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, settings):
+        """設定を変更し、delay 秒後の書き込みを予約（続けて変更された場合はまとめて1回書き込む）"""
+        with self.lock:
+            self.pending.update({key: str(value) for key, value in settings.items()})
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """未保存の変更を .env に書き込む"""
+        with self.flush_lock:
+            with self.lock:
+                changes, self.pending = self.pending, {}
+                self.timer = None
+            if not changes:
+                return
+            try:
+                self.write(changes)
+            except OSError as e:
+                logger.error(f"設定保存エラー: {e}")
+                with self.lock:
+                    # 次の変更・終了時にもう一度書き込む
+                    self.pending = {**changes, **self.pending}
+
+    def write(self, changes):
+        lines = self.read_lines()
+        current = {}
+        found = set()
+        changed = False
+        for i, line in enumerate(lines):
+            match = ENV_LINE.match(line)
+            if not match:
+                continue
+            key = match.group(1)
+            current[key] = parse_value(match.group(2))
+            if key in changes:
+                # 同じキーが複数行ある場合はすべて置き換える
+                changed = changed or current[key] != changes[key]
+                lines[i] = f"{key}={format_value(changes[key])}"
+                current[key] = changes[key]
+                found.add(key)
+
+        remaining = {key: value for key, value in changes.items() if key not in found}
+        if remaining:
+            if not lines:
+                lines = [HEADER, ""]
+            lines.extend(f"{key}={format_value(value)}" for key, value in remaining.items())
+            current.update(remaining)
+        elif not changed:
+            # 値が変わらない場合は書き込まない
+            with self.lock:
+                self.values = current
+            return
+
+        mode = self.path.stat().st_mode if self.path.exists() else None
+        atomic_write_text(self.path, "\n".join(lines) + "\n")
+        if mode is not None:
+            os.chmod(self.path, mode)
+        with self.lock:
+            self.values = current
+        logger.debug(f"設定を保存: {', '.join(changes)}")
+
+    def close(self):
+        """予約中の書き込みを取り消し、未保存の変更をすぐに書き込む"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+        self.flush()
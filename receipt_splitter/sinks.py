@@ -0,0 +1,198 @@
+"""分割ページの出力先（ページごとのファイル、または元のZIPごとに1個のZIP・tarアーカイブ）
+
+アーカイブ出力ではページを分割した順にアーカイブの末尾へ追記し、一時ファイルを作らない。
+ページ数が多くても、出力はファイル1個への連続した書き込みになる。
+（プロセスプールのワーカーだけは、ページを一時ファイルに書き込んで親プロセスに渡す）
+"""
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+from .manifest import atomic_open
+
+# 分割ページの出力先
+SINK_FILES = 'files'  # ページごとにPDFファイルを書き込む
+SINK_ZIP = 'zip'      # 元のZIPごとに1個のZIPアーカイブへ追記
+SINK_TAR = 'tar'      # 元のZIPごとに1個の tar アーカイブへ追記
+SINK_MODES = (SINK_FILES, SINK_ZIP, SINK_TAR)
+
+ARCHIVE_SUFFIXES = {SINK_ZIP: '_pages.zip', SINK_TAR: '_pages.tar'}
+
+
+def archive_path(folder, stem, sink):
+    """元のZIP（ファイル名の stem）の分割ページを書き込むアーカイブ"""
+    return Path(folder) / f"{stem}{ARCHIVE_SUFFIXES[sink]}"
+
+
+def is_page_archive(name):
+    """分割ページのZIPアーカイブか（入力のZIPとして扱わない）"""
+    return name.lower().endswith(ARCHIVE_SUFFIXES[SINK_ZIP])
+
+
+def archive_names(path, sink):
+    """アーカイブ内のメンバー名の一覧（存在しない・書き込み途中で終了して読めない場合は None）"""
+    try:
+        if sink == SINK_ZIP:
+            with zipfile.ZipFile(path, 'r') as archive:
+                return set(archive.namelist())
+        with tarfile.open(path, 'r:') as archive:
+            return set(archive.getnames())
+    except (OSError, zipfile.BadZipFile, tarfile.TarError, EOFError):
+        return None
+
+
+class FileSink:
+    """ページごとに一時ファイル経由でPDFファイルを書き込む出力先"""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+
+    def path(self, name):
+        """ページの出力先のパス（結果・ジョブ台帳に記録する）"""
+        return self.folder / name
+
+    def write(self, name, data):
+        path = self.path(name)
+        if '/' in name:
+            # サブフォルダ・入れ子のアーカイブのPDFのページは元のフォルダ構成で出力する
+            path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_open(path) as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class SpoolSink:
+    """プロセスプールのワーカー用: ページを一時ファイルに書き込み、親プロセスでアーカイブに追記する
+
+    ページはメモリに溜めずに一時ファイルの末尾へ順に書き込み、親プロセスには一時ファイルのパスと
+    (メンバー名, バイト数) の一覧だけを返す（read_spool で読み出して削除する）。
+    """
+
+    def __init__(self, path):
+        self.archive = Path(path)
+        self.spool = None  # 一時ファイルのパス（最初のページを書き込むときに作る）
+        self.pages = []  # (メンバー名, バイト数)
+        self.handle = None
+
+    def path(self, name):
+        return self.archive / name
+
+    def write(self, name, data):
+        if self.handle is None:
+            fd, spool = tempfile.mkstemp(prefix=f".{self.archive.name}.", suffix='.spool')
+            self.spool = spool
+            self.handle = os.fdopen(fd, 'wb')
+        self.handle.write(data)
+        self.pages.append((name, len(data)))
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def discard(self):
+        """書き込んだページを破棄して一時ファイルを削除（分割に失敗した場合）"""
+        self.close()
+        remove_spool(self.spool)
+        self.spool = None
+        self.pages = []
+
+
+def read_spool(spool, pages):
+    """SpoolSink の一時ファイルからページを (メンバー名, バイト列) で1ページずつ読み出し、最後に削除"""
+    try:
+        with open(spool, 'rb') as f:
+            for name, size in pages:
+                yield name, f.read(size)
+    finally:
+        remove_spool(spool)
+
+
+def remove_spool(spool):
+    if spool is None:
+        return
+    try:
+        os.unlink(spool)
+    except FileNotFoundError:
+        pass
+
+
+class ArchiveSink:
+    """元のZIP1個分の分割ページを書き込むアーカイブ
+
+    複数のスレッドから write() できる（書き込みはロックで1件ずつ行う）。
+    append=True なら既存のアーカイブの末尾に追記し、False なら作り直す。
+    ページのパスは「アーカイブのパス / メンバー名」として記録する。
+    """
+
+    def __init__(self, path, append=False):
+        self.archive = Path(path)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.handle = self.open(append)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self, append):
+        raise NotImplementedError
+
+    def add(self, name, data):
+        raise NotImplementedError
+
+    def path(self, name):
+        return self.archive / name
+
+    def write(self, name, data):
+        with self.lock:
+            if self.handle is None:
+                raise ValueError(f"アーカイブは閉じられています: {self.archive.name}")
+            self.add(name, data)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.handle is not None:
+                handle, self.handle = self.handle, None
+                handle.close()
+
+
+class ZipSink(ArchiveSink):
+    """分割ページのZIPアーカイブ（PDFは圧縮済みのストリームが多いため無圧縮で格納）"""
+
+    def open(self, append):
+        return zipfile.ZipFile(self.archive, 'a' if append else 'w', zipfile.ZIP_STORED)
+
+    def add(self, name, data):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        self.handle.writestr(info, data)
+
+
+class TarSink(ArchiveSink):
+    """分割ページの tar アーカイブ（無圧縮）"""
+
+    def open(self, append):
+        return tarfile.open(self.archive, 'a' if append else 'w')
+
+    def add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self.handle.addfile(info, BytesIO(data))
+
+
+def open_archive_sink(path, sink, append=False):
+    """設定（zip / tar）に応じたアーカイブの出力先を開く"""
+    return (ZipSink if sink == SINK_ZIP else TarSink)(path, append)
@@ -0,0 +1,150 @@
+"""分割方法（1ページずつ・Nページごと・ページ範囲・ページのテキストから明細の区切りを検出）"""
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from .rename import TRANSACTION_PATTERN
+
+# 分割方法
+STRATEGY_PAGE = 'page'        # 1ページずつ
+STRATEGY_FIXED = 'fixed'      # pages_per_file ページごと
+STRATEGY_RANGES = 'ranges'    # 指定したページ範囲ごと（範囲外のページは1ページずつ）
+STRATEGY_PATTERN = 'pattern'  # ページのテキストが pattern に一致したところで区切る
+STRATEGY_MODES = (STRATEGY_PAGE, STRATEGY_FIXED, STRATEGY_RANGES, STRATEGY_PATTERN)
+
+# 既定の区切り: 取引番号・受付番号が変わったページから新しい明細とする
+DEFAULT_BOUNDARY_PATTERN = TRANSACTION_PATTERN.pattern
+
+
+def parse_ranges(text):
+    """「1-2,3,5-」形式のページ範囲を 0 始まりの (開始, 終了) の一覧に変換（終了は含まない、None は最後まで）"""
+    ranges = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r'(\d+)\s*(?:-\s*(\d*))?', part)
+        if not match or int(match.group(1)) < 1:
+            raise ValueError(f"ページ範囲の形式が正しくありません: {part}")
+        start = int(match.group(1)) - 1
+        if match.group(2) is None:
+            end = start + 1
+        elif match.group(2) == '':
+            end = None
+        else:
+            end = int(match.group(2))
+            if end <= start:
+                raise ValueError(f"ページ範囲の終わりが始まりより前です: {part}")
+        ranges.append((start, end))
+    ranges.sort(key=lambda item: item[0])
+    for (_, previous_end), (start, _) in zip(ranges, ranges[1:]):
+        if previous_end is None or start < previous_end:
+            raise ValueError(f"ページ範囲が重なっています: {text}")
+    return ranges
+
+
+@dataclass
+class SplitStrategy:
+    """PDFを出力ファイルに分ける方法"""
+    mode: str = STRATEGY_PAGE
+    pages_per_file: int = 1  # fixed: 1ファイルあたりのページ数
+    ranges: str = ''         # ranges: 「1-2,3,5-」形式（1 始まり、「5-」は最後まで）
+    pattern: str = DEFAULT_BOUNDARY_PATTERN  # pattern: 区切りとみなすテキストの正規表現（大文字・小文字は区別しない）
+    text_cache: Optional[Path] = None  # ページのテキストのキャッシュ（None の場合は既定の場所）
+
+    def __post_init__(self):
+        if self.mode not in STRATEGY_MODES:
+            raise ValueError(f"不明な分割方法: {self.mode}")
+        self.pages_per_file = max(1, self.pages_per_file)
+        if self.mode == STRATEGY_RANGES:
+            if not parse_ranges(self.ranges):
+                raise ValueError("ページ範囲を指定してください")
+        if self.mode == STRATEGY_PATTERN:
+            try:
+                re.compile(self.pattern)
+            except re.error as e:
+                raise ValueError(f"区切りの正規表現が正しくありません: {e}")
+
+    @classmethod
+    def from_env(cls):
+        """環境変数（.env）から設定を生成"""
+        text_cache = os.getenv('TEXT_CACHE_PATH')
+        return cls(
+            mode=os.getenv('SPLIT_STRATEGY', STRATEGY_PAGE).lower(),
+            pages_per_file=int(os.getenv('SPLIT_PAGES') or 1),
+            ranges=os.getenv('SPLIT_RANGES', ''),
+            pattern=os.getenv('SPLIT_PATTERN') or DEFAULT_BOUNDARY_PATTERN,
+            text_cache=Path(text_cache).expanduser() if text_cache else None,
+        )
+
+    @property
+    def needs_text(self):
+        """区切りの検出にページのテキストが必要か"""
+        return self.mode == STRATEGY_PATTERN
+
+    def describe(self):
+        """出力内容に影響する設定の要約（マニフェストの照合に使う）"""
+        if self.mode == STRATEGY_FIXED:
+            return f"{self.mode}:{self.pages_per_file}"
+        if self.mode == STRATEGY_RANGES:
+            return f"{self.mode}:{self.ranges}"
+        if self.mode == STRATEGY_PATTERN:
+            return f"{self.mode}:{self.pattern}"
+        return self.mode
+
+    def groups(self, total_pages, page_texts: Optional[Callable[[], List[str]]] = None) -> List[Tuple[int, int]]:
+        """ページを出力ファイルごとの (開始, 終了) に分ける（0 始まり、終了は含まない）
+
+        page_texts は全ページのテキストを返す関数で、pattern の場合だけ呼ぶ。
+        """
+        if self.mode == STRATEGY_FIXED:
+            size = self.pages_per_file
+            return [(start, min(start + size, total_pages)) for start in range(0, total_pages, size)]
+        if self.mode == STRATEGY_RANGES:
+            return self.range_groups(total_pages)
+        if self.mode == STRATEGY_PATTERN:
+            return self.pattern_groups(page_texts() if total_pages else [])
+        return [(page, page + 1) for page in range(total_pages)]
+
+    def range_groups(self, total_pages):
+        groups = []
+        position = 0
+        for start, end in parse_ranges(self.ranges):
+            if start >= total_pages:
+                break
+            end = total_pages if end is None else min(end, total_pages)
+            # 範囲に含まれないページは1ページずつ出力する（ページを失わない）
+            groups.extend((page, page + 1) for page in range(position, start))
+            groups.append((start, end))
+            position = end
+        groups.extend((page, page + 1) for page in range(position, total_pages))
+        return groups
+
+    def pattern_groups(self, texts):
+        """一致したページから新しい明細とする
+
+        正規表現にグループがある場合は、1番目のグループの値（取引番号など）が変わったページだけを区切りとし、
+        同じ番号が続くページや一致しないページは前の明細に含める。最初の区切りより前のページ（表紙など）は1個にまとめる。
+        """
+        regex = re.compile(self.pattern, re.IGNORECASE)
+        boundaries = []
+        current = None
+        for page, text in enumerate(texts):
+            match = regex.search(text or "")
+            if match is None:
+                continue
+            key = match.group(1) if regex.groups else None
+            if key is None or key != current or not boundaries:
+                boundaries.append(page)
+            current = key
+        starts = sorted({0, *boundaries})
+        return [(start, end) for start, end in zip(starts, starts[1:] + [len(texts)])]
+
+
+def output_name(stem, start, end):
+    """出力ファイル名（1ページなら {stem}_page_NNN.pdf、複数ページなら {stem}_page_NNN-MMM.pdf）"""
+    if end - start == 1:
+        return f"{stem}_page_{start + 1:03d}.pdf"
+    return f"{stem}_page_{start + 1:03d}-{end:03d}.pdf"
@@ -0,0 +1,179 @@
+"""フォルダ監視モード（ダウンロード完了したZIPを自動で解凍・分割）"""
+import logging
+import os
+import queue
+import threading
+import time
+import zipfile
+from dataclasses import replace
+from pathlib import Path
+
+from .engine import SplitterEngine
+from .metrics import PipelineMetrics
+from .sinks import is_page_archive
+
+logger = logging.getLogger(__name__)
+
+# ダウンロード途中のファイルに付く拡張子（ブラウザ・ダウンローダー別）
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.partial', '.download', '.tmp')
+
+DEFAULT_INTERVAL = 2.0  # フォルダ確認間隔（秒）
+DEFAULT_SETTLE = 3.0    # サイズ・更新日時がこの秒数変化しなければ書き込み完了とみなす
+DEFAULT_QUEUE_SIZE = 100
+
+
+def is_candidate(name):
+    """監視対象のZIPファイル名か（一時ファイル・隠しファイルは除外）"""
+    lower = name.lower()
+    if lower.startswith(('.', '~$')) or lower.endswith(PARTIAL_SUFFIXES):
+        return False
+    return lower.endswith('.zip') and not is_page_archive(lower)
+
+
+class FolderWatcher:
+    """フォルダをポーリングし、書き込みが完了したZIPを処理キューへ投入する
+
+    キューは上限付きで、満杯の間は新しいZIPを次回のポーリングまで保留する。
+    jobs 個のワーカースレッドがキューからZIPを取り出して SplitterEngine で処理する。
+    解凍先が同じZIP（選択フォルダ内に直接解凍する場合など）は、解凍先ごとのロックで1個ずつ処理する。
+    処理済みかどうかはマニフェスト（増分処理）で判定するため、再起動しても二重処理しない。
+    """
+
+    def __init__(self, folder, config, jobs=1, queue_size=DEFAULT_QUEUE_SIZE,
+                 interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE, on_result=None, metrics=None):
+        self.folder = Path(folder)
+        self.config = replace(config, incremental=True)
+        self.jobs = max(1, jobs)
+        self.interval = interval
+        self.settle = settle
+        self.on_result = on_result
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.work_queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stop_event = threading.Event()
+        self.workers = []
+        # パス -> (サイズ, 更新日時, 最初にその状態を確認した時刻)
+        self.pending = {}
+        # キュー投入済み・処理済みのパス -> (サイズ, 更新日時)
+        self.handled = {}
+        # 解凍先フォルダ -> ロック（同じフォルダへの同時解凍を防ぐ）
+        self.extract_locks = {}
+        self.extract_locks_lock = threading.Lock()
+
+    def scan(self):
+        """フォルダ直下のZIPファイルの (パス, サイズ, 更新日時) を列挙"""
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not is_candidate(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield Path(entry.path), stat.st_size, stat.st_mtime_ns
+
+    def poll_once(self, now=None):
+        """1回分のフォルダ確認を行い、キューに投入したZIPの一覧を返す"""
+        now = time.monotonic() if now is None else now
+        queued = []
+        seen = set()
+
+        try:
+            entries = list(self.scan())
+        except OSError as e:
+            logger.error(f"フォルダ監視エラー: {self.folder}: {e}")
+            return queued
+
+        for path, size, mtime_ns in entries:
+            seen.add(path)
+            signature = (size, mtime_ns)
+            if self.handled.get(path) == signature:
+                continue
+
+            previous = self.pending.get(path)
+            if previous is None or previous[:2] != signature:
+                # 新規または書き込み中 → 安定するまで待つ
+                self.pending[path] = (size, mtime_ns, now)
+                continue
+            if now - previous[2] < self.settle:
+                continue
+
+            # 中央ディレクトリが読めなければまだ書き込み途中
+            if not zipfile.is_zipfile(path):
+                self.pending[path] = (size, mtime_ns, now)
+                continue
+
+            try:
+                self.work_queue.put_nowait(path)
+            except queue.Full:
+                logger.debug(f"処理キューが満杯のため保留: {path.name}")
+                continue
+
+            del self.pending[path]
+            self.handled[path] = signature
+            queued.append(path)
+            self.metrics.observe_queue('watch', self.work_queue.qsize())
+            logger.info(f"ZIP検出: {path.name}（待ち: {self.work_queue.qsize()}件）")
+
+        # 削除・移動されたファイルの状態を破棄
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
+        for path in list(self.handled):
+            if path not in seen:
+                del self.handled[path]
+
+        return queued
+
+    def extract_lock(self, engine, zip_file):
+        """ZIPの解凍先フォルダのロック"""
+        extract_path = os.path.normcase(os.path.abspath(engine.resolve_extract_path(zip_file)))
+        with self.extract_locks_lock:
+            return self.extract_locks.setdefault(extract_path, threading.Lock())
+
+    def worker_loop(self):
+        """キューからZIPを取り出して処理"""
+        while not self.stop_event.is_set():
+            try:
+                zip_file = self.work_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                engine = SplitterEngine(self.config, metrics=self.metrics)
+                with self.extract_lock(engine, zip_file):
+                    result = engine.run([zip_file])
+                if self.on_result is not None:
+                    self.on_result(result)
+            except Exception as e:
+                logger.error(f"監視モード処理エラー: {zip_file.name}: {e}")
+            finally:
+                self.work_queue.task_done()
+
+    def start(self):
+        """ワーカースレッドを起動"""
+        self.stop_event.clear()
+        for i in range(self.jobs):
+            worker = threading.Thread(target=self.worker_loop, name=f"watch-worker-{i+1}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, wait=True):
+        """監視を停止（wait=True なら処理中のZIPの完了を待つ）"""
+        self.stop_event.set()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+        self.workers = []
+
+    def run_forever(self):
+        """停止されるまでフォルダを監視し続ける"""
+        logger.info(f"フォルダ監視開始: {self.folder}（並列ジョブ数: {self.jobs}）")
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                self.poll_once()
+                self.stop_event.wait(self.interval)
+        finally:
+            self.stop()
+            logger.info("フォルダ監視終了")
@@ -0,0 +1,59 @@
+"""テスト共通のフィクスチャ（合成コーパスは bench の生成処理で作る）"""
+import zipfile
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfReader
+
+from receipt_splitter.bench import build_pdf
+from receipt_splitter.engine import PARALLEL_SERIAL, JobConfig
+
+
+def write_zip(path, members):
+    """members（メンバー名 -> バイト列）のZIPファイルを作成"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+
+def failures(result):
+    """処理結果のZIP・PDFのエラーの一覧"""
+    return result.errors + [error for zip_result in result.zip_results for error in zip_result.pdf_errors]
+
+
+def relative_pages(result, root):
+    """処理結果の分割ページの root からの相対パス（区切りは「/」）"""
+    return sorted(Path(page).relative_to(root).as_posix()
+                  for zip_result in result.zip_results for page in zip_result.split_files)
+
+
+def page_outputs(result, root):
+    """処理結果の分割ページごとの {root からの相対パス: ページ数}"""
+    return {page: len(PdfReader(str(Path(root) / page)).pages) for page in relative_pages(result, root)}
+
+
+@pytest.fixture
+def make_zip(tmp_path):
+    """PDF（メンバー名 -> ページ数）と、それ以外のメンバー（メンバー名 -> バイト列）からZIPを作るファクトリ"""
+    def make(name, pdfs, others=None, seed=0):
+        members = {member: build_pdf(pages, label=member, seed=seed + i)
+                   for i, (member, pages) in enumerate(pdfs.items())}
+        members.update(others or {})
+        return write_zip(tmp_path / "in" / name, members)
+    return make
+
+
+@pytest.fixture
+def job_config(tmp_path):
+    """キャッシュ・索引・台帳をすべて tmp_path に置く逐次実行の設定（上書きする項目を指定）"""
+    base = JobConfig(output_dir=tmp_path / "out", parallelism=PARALLEL_SERIAL, max_workers=2,
+                     dedup_index=tmp_path / "pages.sqlite3")
+    base = replace(base, strategy=replace(base.strategy, text_cache=tmp_path / "text.sqlite3"))
+
+    def make(**changes):
+        return replace(base, **changes)
+    return make
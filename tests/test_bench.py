@@ -0,0 +1,28 @@
+"""ベンチマークのコーパス生成と計測"""
+import zipfile
+
+from receipt_splitter.bench import PROFILES, generate_corpus, measure
+from receipt_splitter.engine import EXTRACT_DIRECT
+
+
+def test_generate_corpus_follows_profile(tmp_path):
+    zip_files = generate_corpus(tmp_path, 'nested', scale=0.2)
+    params = PROFILES['nested']
+    assert len(zip_files) == 2
+    with zipfile.ZipFile(zip_files[0]) as zf:
+        names = zf.namelist()
+    assert sum(name.endswith('.pdf') and '/' not in name for name in names) == params['pdfs_per_zip']
+    assert 'inner_0.zip' in names and 'meisai.csv' in names
+
+
+def test_overwrite_off_case_runs_over_existing_output(tmp_path, job_config):
+    corpus = tmp_path / "corpus"
+    generate_corpus(corpus, 'collisions', scale=0.1)
+    config = job_config(output_dir=None, extract_option=EXTRACT_DIRECT, overwrite=False)
+
+    cold = measure(config, corpus, tmp_path)
+    warm = measure(config, corpus, tmp_path, warm=True)
+    assert cold['errors'] == [] and warm['errors'] == []
+    assert cold['pages'] == warm['pages'] == 2 * 2 * 2
+    # 2回目の実行では、解凍先にある同名のメンバーを書き込まずにスキップする
+    assert warm['members_skipped'] > cold['members_skipped']
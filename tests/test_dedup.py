@@ -0,0 +1,77 @@
+"""重複ページの検出（skip: 出力しない / link: 既存ページへのハードリンク）"""
+from pathlib import Path
+
+import pytest
+
+from receipt_splitter.bench import build_pdf
+from receipt_splitter.dedup import DEDUP_LINK, DEDUP_REPORT, DEDUP_SKIP, PageIndex
+from receipt_splitter.engine import SplitterEngine
+from receipt_splitter.ledger import path_key
+from receipt_splitter.rename import RenameConfig
+
+from conftest import failures, write_zip
+
+
+@pytest.fixture
+def duplicated_zips(tmp_path):
+    """同じ明細（2ページ）を別名で含むZIPと、別の明細だけのZIP"""
+    statement = build_pdf(2, "statement", seed=1)
+    first = write_zip(tmp_path / "in" / "first.zip", {"statement.pdf": statement})
+    second = write_zip(tmp_path / "in" / "second.zip", {"copy.pdf": statement,
+                                                         "other.pdf": build_pdf(1, "other", seed=2)})
+    return first, second
+
+
+def test_dedup_skip_drops_pages_seen_in_earlier_runs(tmp_path, duplicated_zips, job_config):
+    first, second = duplicated_zips
+    config = job_config(dedup=DEDUP_SKIP)
+    assert failures(SplitterEngine(config).run([first])) == []
+
+    result = SplitterEngine(config).run([second])
+    assert failures(result) == []
+    zip_result = result.zip_results[0]
+    assert [page.name for page in zip_result.split_files] == ['other_page_001.pdf']
+    assert sorted((duplicate['action'], duplicate['match']) for duplicate in zip_result.duplicates) == [
+        (DEDUP_SKIP, 'exact'), (DEDUP_SKIP, 'exact')]
+    out = tmp_path / "out" / "second"
+    assert sorted(page.name for page in out.glob("*.pdf")) == ['other_page_001.pdf']
+
+    with PageIndex(tmp_path / "pages.sqlite3") as index:
+        assert index.page_count() == 3
+        assert len(index.duplicates(index.runs()[0]['run_id'])) == 2
+
+
+def test_dedup_link_points_duplicates_at_first_page(tmp_path, duplicated_zips, job_config):
+    first, second = duplicated_zips
+    config = job_config(dedup=DEDUP_LINK)
+    result = SplitterEngine(config).run([first, second])
+    assert failures(result) == []
+    assert [len(zip_result.duplicates) for zip_result in result.zip_results] == [0, 2]
+
+    original = tmp_path / "out" / "first" / "statement_page_001.pdf"
+    linked = tmp_path / "out" / "second" / "copy_page_001.pdf"
+    assert linked.samefile(original)
+    assert original.stat().st_nlink == 2
+    assert (tmp_path / "out" / "second" / "other_page_001.pdf").stat().st_nlink == 1
+    assert linked in result.zip_results[1].split_files
+
+
+def test_dedup_finds_pages_renamed_by_ocr_rename(tmp_path, duplicated_zips, job_config):
+    first, second = duplicated_zips
+    rename = RenameConfig(ocr_backend='stub', naming_backend='stub', rate_limit=0, cache_dir=tmp_path / "rename")
+    config = job_config(dedup=DEDUP_REPORT, ocr_rename=True, rename=rename)
+
+    result = SplitterEngine(config).run([first])
+    assert failures(result) == []
+    renamed = result.zip_results[0].split_files
+    assert [page.name for page in renamed] != ['statement_page_001.pdf', 'statement_page_002.pdf']
+    with PageIndex(tmp_path / "pages.sqlite3") as index:
+        assert sorted(row[0] for row in index.conn.execute("SELECT path FROM pages")) == sorted(
+            path_key(page) for page in renamed)
+
+    # 次の実行でも、リネーム後のページと重複したページを検出する
+    result = SplitterEngine(config).run([second])
+    assert failures(result) == []
+    duplicates = result.zip_results[0].duplicates
+    assert sorted(duplicate['original'] for duplicate in duplicates) == sorted(path_key(page) for page in renamed)
+    assert all(Path(duplicate['path']).exists() for duplicate in duplicates)
@@ -0,0 +1,27 @@
+"""SplitterEngine: ZIPの解凍とPDFの分割"""
+from receipt_splitter.engine import EXTRACT_DIRECT, SplitterEngine
+
+from conftest import failures, page_outputs
+
+
+def test_run_extracts_zip_and_splits_pdfs(tmp_path, make_zip, job_config):
+    zip_file = make_zip("receipts.zip", {"a.pdf": 2, "b.pdf": 1}, {"meisai.csv": b"zip,0\n"})
+    result = SplitterEngine(job_config()).run([zip_file])
+
+    assert failures(result) == []
+    out = tmp_path / "out" / "receipts"
+    assert result.zip_results[0].extract_path == out
+    assert page_outputs(result, out) == {'a_page_001.pdf': 1, 'a_page_002.pdf': 1, 'b_page_001.pdf': 1}
+    # 分割した元のPDFは残さず、それ以外のメンバーは解凍する
+    assert sorted(path.name for path in out.iterdir()) == [
+        'a_page_001.pdf', 'a_page_002.pdf', 'b_page_001.pdf', 'meisai.csv']
+
+
+def test_direct_extraction_and_no_split(tmp_path, make_zip, job_config):
+    first = make_zip("first.zip", {"a.pdf": 2})
+    second = make_zip("second.zip", {"b.pdf": 1})
+    result = SplitterEngine(job_config(extract_option=EXTRACT_DIRECT, split_pdf=False)).run([first, second])
+
+    assert failures(result) == []
+    assert result.split_count == 0
+    assert sorted(path.name for path in (tmp_path / "out").iterdir() if path.suffix == '.pdf') == ['a.pdf', 'b.pdf']
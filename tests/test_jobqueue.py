@@ -0,0 +1,58 @@
+"""共有ジョブキューのリース"""
+import pytest
+
+from receipt_splitter.jobqueue import MAX_ATTEMPTS, TASK_DONE, TASK_FAILED, TASK_QUEUED, TASK_RUNNING, JobQueue
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    with JobQueue(tmp_path / "queue.sqlite3") as queue:
+        yield queue
+
+
+def test_claim_in_submission_order(tmp_path, job_queue):
+    tasks = job_queue.submit([tmp_path / "a.zip", tmp_path / "b.zip"], batch="x", output_root=tmp_path / "out")
+    assert [task.status for task in tasks] == [TASK_QUEUED, TASK_QUEUED]
+    assert tasks[0].output_dir == tmp_path / "out" / str(tasks[0].id)
+
+    claimed = job_queue.claim("w1")
+    assert (claimed.id, claimed.status, claimed.worker, claimed.attempts) == (tasks[0].id, TASK_RUNNING, "w1", 1)
+    assert job_queue.claim("w2").id == tasks[1].id
+    assert job_queue.claim("w3") is None
+
+    assert job_queue.finish(claimed.id, "w1", TASK_DONE, result={'success': True})
+    assert job_queue.get(claimed.id).result == {'success': True}
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path, job_queue):
+    (task,) = job_queue.submit([tmp_path / "a.zip"])
+    job_queue.claim("w1", lease=-1)  # すぐに期限切れになるリース
+
+    reclaimed = job_queue.claim("w2")
+    assert (reclaimed.id, reclaimed.worker, reclaimed.attempts) == (task.id, "w2", 2)
+    # リースを失ったワーカーは延長・結果の記録ができない
+    with pytest.raises(LookupError):
+        job_queue.heartbeat(task.id, "w1")
+    assert not job_queue.finish(task.id, "w1", TASK_DONE)
+    assert job_queue.heartbeat(task.id, "w2") is False
+    assert job_queue.finish(task.id, "w2", TASK_DONE)
+
+
+def test_task_fails_after_max_attempts(tmp_path, job_queue):
+    (task,) = job_queue.submit([tmp_path / "a.zip"])
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        claimed = job_queue.claim(f"w{attempt}", lease=-1)
+        assert claimed.attempts == attempt
+
+    assert job_queue.claim("w-last") is None
+    failed = job_queue.get(task.id)
+    assert failed.status == TASK_FAILED
+    assert failed.worker is None and failed.error
+
+
+def test_release_does_not_count_as_attempt(tmp_path, job_queue):
+    (task,) = job_queue.submit([tmp_path / "a.zip"])
+    job_queue.claim("w1")
+    job_queue.release(task.id, "w1")
+    released = job_queue.get(task.id)
+    assert (released.status, released.attempts) == (TASK_QUEUED, 0)
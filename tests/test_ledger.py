@@ -0,0 +1,66 @@
+"""ジョブ台帳による中断したジョブの再開"""
+import sqlite3
+
+from PyPDF2 import PdfReader
+
+from receipt_splitter.engine import SplitterEngine
+from receipt_splitter.ledger import JobLedger
+
+from conftest import failures, relative_pages
+
+
+def test_resume_splits_only_unfinished_pdfs(tmp_path, make_zip, job_config):
+    zip_file = make_zip("job.zip", {"done.pdf": 2, "todo.pdf": 3})
+    ledger_path = tmp_path / "jobs.sqlite3"
+    config = job_config(ledger_path=ledger_path)
+    result = SplitterEngine(config).run([zip_file])
+    job_id = result.job_id
+    extract_path = tmp_path / "out" / "job"
+
+    # todo.pdf の分割中に終了した状態にする（分割済みのページは目印を書き込み、作り直されないことを確認する）
+    with sqlite3.connect(ledger_path) as conn:
+        conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (job_id,))
+        conn.execute("UPDATE zips SET status = 'extracted' WHERE job_id = ?", (job_id,))
+        conn.execute("UPDATE pdfs SET status = 'pending', pages = NULL WHERE job_id = ? AND member = ?",
+                     (job_id, "todo.pdf"))
+    for page in extract_path.glob("todo_page_*.pdf"):
+        page.unlink()
+    (extract_path / "todo_page_001.pdf").write_bytes(b"partial")
+    (extract_path / ".todo_page_002.pdf.tmp").write_bytes(b"partial")
+    marker = extract_path / "done_page_001.pdf"
+    marker.write_bytes(b"kept")
+
+    with JobLedger(ledger_path) as ledger:
+        assert ledger.latest_unfinished().id == job_id
+        points = ledger.resume_plan(job_id)
+    assert [point.pending for point in points] == [["todo.pdf"]]
+
+    result = SplitterEngine(config).resume(job_id)
+    assert failures(result) == []
+    assert relative_pages(result, extract_path) == [
+        'done_page_001.pdf', 'done_page_002.pdf', 'todo_page_001.pdf', 'todo_page_002.pdf', 'todo_page_003.pdf']
+    assert marker.read_bytes() == b"kept"
+    assert len(PdfReader(str(extract_path / "todo_page_001.pdf")).pages) == 1
+    assert not (extract_path / "todo.pdf").exists()
+    assert not list(extract_path.glob(".*.tmp"))
+    with JobLedger(ledger_path) as ledger:
+        assert ledger.get_job(job_id).status == 'completed'
+        assert ledger.latest_unfinished() is None
+
+
+def test_resume_cleans_partial_pages_in_subfolders(tmp_path, make_zip, job_config):
+    zip_file = make_zip("job.zip", {"sub/a.pdf": 2})
+    ledger_path = tmp_path / "jobs.sqlite3"
+    config = job_config(ledger_path=ledger_path, recursive=True)
+    job_id = SplitterEngine(config).run([zip_file]).job_id
+    folder = tmp_path / "out" / "job" / "sub"
+
+    with sqlite3.connect(ledger_path) as conn:
+        conn.execute("UPDATE zips SET status = 'extracted' WHERE job_id = ?", (job_id,))
+        conn.execute("UPDATE pdfs SET status = 'pending', pages = NULL WHERE job_id = ?", (job_id,))
+    (folder / "a_page_002.pdf").unlink()
+    (folder / ".a_page_002.pdf.x1y2.tmp").write_bytes(b"partial")
+
+    result = SplitterEngine(config).resume(job_id)
+    assert failures(result) == []
+    assert sorted(path.name for path in folder.iterdir()) == ['a_page_001.pdf', 'a_page_002.pdf']
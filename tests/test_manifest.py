@@ -0,0 +1,33 @@
+"""マニフェストによる増分処理"""
+from receipt_splitter.engine import SplitterEngine
+
+from conftest import failures
+
+
+def test_incremental_skips_unchanged_and_reprocesses_changed(tmp_path, make_zip, job_config):
+    first = make_zip("a.zip", {"a.pdf": 2})
+    second = make_zip("b.zip", {"b.pdf": 1})
+    config = job_config(incremental=True)
+
+    result = SplitterEngine(config).run([first, second])
+    assert failures(result) == []
+    assert [zip_result.skipped for zip_result in result.zip_results] == [False, False]
+    assert result.split_count == 3
+
+    result = SplitterEngine(config).run([first, second])
+    assert [zip_result.skipped for zip_result in result.zip_results] == [True, True]
+
+    make_zip("b.zip", {"b.pdf": 3}, seed=10)
+    result = SplitterEngine(config).run([first, second])
+    skipped = {zip_result.zip_file.name: zip_result.skipped for zip_result in result.zip_results}
+    assert skipped == {'a.zip': True, 'b.zip': False}
+    assert sorted(page.name for page in (tmp_path / "out" / "b").glob("*.pdf")) == [
+        'b_page_001.pdf', 'b_page_002.pdf', 'b_page_003.pdf']
+
+
+def test_incremental_reprocesses_when_output_options_change(make_zip, job_config):
+    zip_file = make_zip("a.zip", {"a.pdf": 2})
+    SplitterEngine(job_config(incremental=True)).run([zip_file])
+
+    result = SplitterEngine(job_config(incremental=True, split_pdf=False)).run([zip_file])
+    assert [zip_result.skipped for zip_result in result.zip_results] == [False]
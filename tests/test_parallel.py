@@ -0,0 +1,22 @@
+"""プロセスプール・スレッドプールでの並列処理"""
+import pytest
+
+from receipt_splitter.bench import generate_corpus
+from receipt_splitter.engine import PARALLEL_MODES, PARALLEL_SERIAL, SplitterEngine
+
+from conftest import failures, page_outputs
+
+
+@pytest.mark.parametrize('mode', [mode for mode in PARALLEL_MODES if mode != PARALLEL_SERIAL])
+def test_parallel_modes_write_same_pages_as_serial(tmp_path, job_config, mode):
+    corpus = generate_corpus(tmp_path / "corpus", 'collisions', scale=0.2)
+    outputs = {}
+    for parallelism in (PARALLEL_SERIAL, mode):
+        root = tmp_path / parallelism
+        result = SplitterEngine(job_config(output_dir=root, parallelism=parallelism, max_workers=3)).run(corpus)
+        assert failures(result) == []
+        assert [zip_result.zip_file for zip_result in result.zip_results] == corpus
+        outputs[parallelism] = page_outputs(result, root)
+
+    assert len(outputs[mode]) == len(corpus) * 2 * 2
+    assert outputs[mode] == outputs[PARALLEL_SERIAL]
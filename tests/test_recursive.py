@@ -0,0 +1,59 @@
+"""サブフォルダ・入れ子のZIPのPDFの分割"""
+import io
+import zipfile
+
+import pytest
+
+from receipt_splitter.bench import build_pdf, generate_corpus
+from receipt_splitter.engine import PARALLEL_MODES, PARALLEL_SERIAL, SplitterEngine
+from receipt_splitter.sinks import SINK_ZIP
+
+from conftest import failures, page_outputs, write_zip
+
+
+def nested_zip(members):
+    """入れ子のZIP（メモリ上）のバイト列"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('stream_pdfs', [False, True])
+def test_parallel_modes_split_nested_pdfs_alike(tmp_path, job_config, stream_pdfs):
+    corpus = generate_corpus(tmp_path / "corpus", 'nested', scale=0.2)
+    outputs = {}
+    for mode in PARALLEL_MODES:
+        root = tmp_path / mode
+        config = job_config(output_dir=root, parallelism=mode, recursive=True, stream_pdfs=stream_pdfs)
+        result = SplitterEngine(config).run(corpus)
+        assert failures(result) == []
+        outputs[mode] = page_outputs(result, root)
+
+    serial = outputs[PARALLEL_SERIAL]
+    assert serial['nested_0000/2025/00/detail/statement_0_page_003.pdf'] == 1
+    assert serial['nested_0000/inner_0/inner_0_page_001.pdf'] == 1
+    for mode, output in outputs.items():
+        assert output == serial, mode
+
+
+def test_nested_pdfs_are_ignored_without_recursive(tmp_path, job_config):
+    zip_file = write_zip(tmp_path / "in" / "n.zip", {"a.pdf": build_pdf(1, "a"), "sub/b.pdf": build_pdf(1, "b")})
+    result = SplitterEngine(job_config()).run([zip_file])
+    assert failures(result) == []
+    assert page_outputs(result, tmp_path / "out" / "n") == {'a_page_001.pdf': 1}
+    assert (tmp_path / "out" / "n" / "sub" / "b.pdf").exists()
+
+
+def test_archive_sink_keeps_nested_paths(tmp_path, job_config):
+    zip_file = write_zip(tmp_path / "in" / "batch.zip", {
+        "a.pdf": build_pdf(1, "a"),
+        "sub/b.pdf": build_pdf(1, "b"),
+        "inner.zip": nested_zip({"d/c.pdf": build_pdf(2, "c")}),
+    })
+    result = SplitterEngine(job_config(output_sink=SINK_ZIP, recursive=True)).run([zip_file])
+    assert failures(result) == []
+    with zipfile.ZipFile(result.zip_results[0].output_archive) as zf:
+        assert sorted(zf.namelist()) == [
+            'a_page_001.pdf', 'inner/d/c_page_001.pdf', 'inner/d/c_page_002.pdf', 'sub/b_page_001.pdf']
@@ -0,0 +1,51 @@
+"""画面の設定の保存（.env の扱わないキー・コメントを残す）"""
+from receipt_splitter.settings import SettingsStore
+
+
+def test_flush_preserves_unmanaged_keys_and_comments(tmp_path):
+    env = tmp_path / ".env"
+    env.write_text("# API キー\n"
+                   "OPENAI_API_KEY=sk-test  # コメント\n"
+                   "export GOOGLE_APPLICATION_CREDENTIALS='/keys/vision key.json'\n"
+                   "SPLIT_PDF=True\n"
+                   "\n"
+                   "EXTRACT_OPTION=1\n", encoding='utf-8')
+    store = SettingsStore(env, delay=60)
+    store.update({'SPLIT_PDF': False, 'LAST_FOLDER': r"C:\Users\me\Downloads", 'EXTRACT_OPTION': 2})
+    # 書き込みは予約されるだけで、値はすぐに参照できる
+    assert env.read_text(encoding='utf-8').count("SPLIT_PDF=True") == 1
+    assert store.get('SPLIT_PDF') == 'False'
+    store.close()
+
+    assert env.read_text(encoding='utf-8').splitlines() == [
+        "# API キー",
+        "OPENAI_API_KEY=sk-test  # コメント",
+        "export GOOGLE_APPLICATION_CREDENTIALS='/keys/vision key.json'",
+        "SPLIT_PDF=False",
+        "",
+        "EXTRACT_OPTION=2",
+        r"LAST_FOLDER=C:\Users\me\Downloads",
+    ]
+    reloaded = SettingsStore(env)
+    assert reloaded.get('OPENAI_API_KEY') == 'sk-test'
+    assert reloaded.get('GOOGLE_APPLICATION_CREDENTIALS') == '/keys/vision key.json'
+    assert reloaded.get('LAST_FOLDER') == r"C:\Users\me\Downloads"
+
+
+def test_quoted_values_round_trip(tmp_path):
+    env = tmp_path / ".env"
+    store = SettingsStore(env, delay=60)
+    store.set('LAST_FOLDER', "/data/it's here ")
+    store.close()
+    assert env.read_text(encoding='utf-8').splitlines()[0].startswith("#")
+    assert SettingsStore(env).get('LAST_FOLDER') == "/data/it's here "
+
+
+def test_unchanged_values_do_not_rewrite_file(tmp_path):
+    env = tmp_path / ".env"
+    env.write_text("SPLIT_PDF=True\n", encoding='utf-8')
+    mtime = env.stat().st_mtime_ns
+    store = SettingsStore(env, delay=60)
+    store.set('SPLIT_PDF', True)
+    store.close()
+    assert env.stat().st_mtime_ns == mtime
@@ -0,0 +1,65 @@
+"""分割ページのアーカイブ出力（ZIP・tar）"""
+import tarfile
+import tempfile
+import zipfile
+
+import pytest
+
+from receipt_splitter.engine import PARALLEL_MODES, PARALLEL_PROCESS, SplitterEngine
+from receipt_splitter.ledger import path_key
+from receipt_splitter.sinks import SINK_TAR, SINK_ZIP, SpoolSink, read_spool
+
+from conftest import failures
+
+
+def archive_members(archive, sink):
+    """アーカイブの {メンバー名: バイト列}"""
+    if sink == SINK_ZIP:
+        with zipfile.ZipFile(archive) as zf:
+            return {name: zf.read(name) for name in zf.namelist()}
+    with tarfile.open(archive) as tf:
+        return {member.name: tf.extractfile(member).read() for member in tf.getmembers()}
+
+
+@pytest.mark.parametrize('mode', PARALLEL_MODES)
+@pytest.mark.parametrize('sink', [SINK_ZIP, SINK_TAR])
+def test_archive_sink_contents(tmp_path, make_zip, job_config, sink, mode):
+    zip_file = make_zip("batch.zip", {"a.pdf": 2, "b.pdf": 1}, {"meisai.csv": b"zip,0\n"})
+    result = SplitterEngine(job_config(output_sink=sink, parallelism=mode)).run([zip_file])
+    assert failures(result) == []
+
+    out = tmp_path / "out" / "batch"
+    zip_result = result.zip_results[0]
+    archive = zip_result.output_archive
+    assert archive.parent == out
+    members = archive_members(archive, sink)
+    assert sorted(members) == ['a_page_001.pdf', 'a_page_002.pdf', 'b_page_001.pdf']
+    assert all(data.startswith(b"%PDF") for data in members.values())
+    # 分割ページはアーカイブにだけ書き込み、元のPDF以外のメンバーは解凍する
+    assert sorted(path.name for path in out.iterdir()) == sorted([archive.name, 'meisai.csv'])
+    assert sorted(path_key(page) for page in zip_result.split_files) == sorted(
+        path_key(archive / name) for name in members)
+
+
+def test_spool_sink_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    sink = SpoolSink(tmp_path / "batch.zip")
+    sink.write("a_page_001.pdf", b"%PDF-1")
+    sink.write("a_page_002.pdf", b"%PDF-22")
+    sink.close()
+    assert list(read_spool(sink.spool, sink.pages)) == [("a_page_001.pdf", b"%PDF-1"), ("a_page_002.pdf", b"%PDF-22")]
+    # 読み出した一時ファイルは削除する
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_process_workers_spool_pages_to_disk(tmp_path, make_zip, job_config, monkeypatch):
+    # ワーカーはページを一時ファイルで返し、親プロセスが追記した後に残さない
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setenv('TMPDIR', str(spool_dir))
+    monkeypatch.setattr(tempfile, 'tempdir', str(spool_dir))
+    zip_file = make_zip("batch.zip", {"a.pdf": 3, "b.pdf": 2})
+    result = SplitterEngine(job_config(output_sink=SINK_ZIP, parallelism=PARALLEL_PROCESS)).run([zip_file])
+    assert failures(result) == []
+    assert len(archive_members(result.zip_results[0].output_archive, SINK_ZIP)) == 5
+    assert list(spool_dir.glob("*.spool")) == []
@@ -0,0 +1,68 @@
+"""分割方法ごとのページのまとめ方"""
+import pytest
+from PyPDF2 import PdfReader
+
+from receipt_splitter.engine import SplitterEngine
+from receipt_splitter.strategies import (STRATEGY_FIXED, STRATEGY_PAGE, STRATEGY_PATTERN, STRATEGY_RANGES,
+                                         SplitStrategy, output_name, parse_ranges)
+
+from conftest import failures
+
+
+def test_page_groups():
+    assert SplitStrategy().groups(3) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_fixed_groups():
+    assert SplitStrategy(STRATEGY_FIXED, pages_per_file=2).groups(5) == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_range_groups_keep_pages_outside_ranges():
+    strategy = SplitStrategy(STRATEGY_RANGES, ranges="2-3,5-")
+    assert strategy.groups(7) == [(0, 1), (1, 3), (3, 4), (4, 7)]
+    # PDFより後ろの範囲は無視する
+    assert strategy.groups(2) == [(0, 1), (1, 2)]
+
+
+@pytest.mark.parametrize('text', ["3-2", "0", "1-3,2", "a"])
+def test_parse_ranges_rejects_invalid(text):
+    with pytest.raises(ValueError):
+        parse_ranges(text)
+
+
+def test_pattern_groups_start_on_new_transaction():
+    texts = ["cover", "Transaction No. 100 page 1", "Transaction No. 100 page 2", "notes",
+             "取引番号: 200", "Transaction No. 300"]
+    assert SplitStrategy(STRATEGY_PATTERN).groups(len(texts), lambda: texts) == [(0, 1), (1, 4), (4, 5), (5, 6)]
+
+
+def test_pattern_without_group_splits_on_every_match():
+    texts = ["HEADER a", "b", "header c"]
+    assert SplitStrategy(STRATEGY_PATTERN, pattern="header").groups(3, lambda: texts) == [(0, 2), (2, 3)]
+
+
+def test_output_name():
+    assert output_name("a", 0, 1) == "a_page_001.pdf"
+    assert output_name("a", 2, 5) == "a_page_003-005.pdf"
+
+
+@pytest.mark.parametrize('strategy, expected', [
+    (dict(mode=STRATEGY_PAGE), {'r_page_001.pdf': 1, 'r_page_002.pdf': 1, 'r_page_003.pdf': 1,
+                                'r_page_004.pdf': 1, 'r_page_005.pdf': 1}),
+    (dict(mode=STRATEGY_FIXED, pages_per_file=2), {'r_page_001-002.pdf': 2, 'r_page_003-004.pdf': 2,
+                                                   'r_page_005.pdf': 1}),
+    (dict(mode=STRATEGY_RANGES, ranges="2-4"), {'r_page_001.pdf': 1, 'r_page_002-004.pdf': 3, 'r_page_005.pdf': 1}),
+    # 合成PDFの取引番号（NNNNNN-ページ番号）は既定の区切りではページごとに変わる
+    (dict(mode=STRATEGY_PATTERN), {'r_page_001.pdf': 1, 'r_page_002.pdf': 1, 'r_page_003.pdf': 1,
+                                   'r_page_004.pdf': 1, 'r_page_005.pdf': 1}),
+    (dict(mode=STRATEGY_PATTERN, pattern=r"Transaction No\. (\d{6})-"), {'r_page_001-005.pdf': 5}),
+    (dict(mode=STRATEGY_PATTERN, pattern=r"page [24]/"), {'r_page_001.pdf': 1, 'r_page_002-003.pdf': 2,
+                                                         'r_page_004-005.pdf': 2}),
+])
+def test_strategy_output_files(tmp_path, make_zip, job_config, strategy, expected):
+    zip_file = make_zip("r.zip", {"r.pdf": 5})
+    config = job_config(strategy=SplitStrategy(**strategy, text_cache=tmp_path / "text.sqlite3"))
+    result = SplitterEngine(config).run([zip_file])
+    assert failures(result) == []
+    pages = result.zip_results[0].split_files
+    assert {page.name: len(PdfReader(str(page)).pages) for page in pages} == expected
@@ -0,0 +1,23 @@
+"""ZIPから直接のPDF分割（ディスクに解凍しない）"""
+import pytest
+
+from receipt_splitter.engine import PARALLEL_MODES, SplitterEngine
+
+from conftest import failures, page_outputs
+
+
+@pytest.mark.parametrize('mode', PARALLEL_MODES)
+def test_streaming_matches_extracted_split(tmp_path, make_zip, job_config, mode):
+    zip_file = make_zip("s.zip", {"a.pdf": 3, "b.pdf": 2}, {"meisai.csv": b"zip,0\n"})
+    outputs = {}
+    for stream_pdfs in (False, True):
+        root = tmp_path / f"stream_{stream_pdfs}"
+        config = job_config(output_dir=root, parallelism=mode, stream_pdfs=stream_pdfs, spill_threshold=1024)
+        result = SplitterEngine(config).run([zip_file])
+        assert failures(result) == []
+        outputs[stream_pdfs] = page_outputs(result, root)
+        assert (root / "s" / "meisai.csv").exists()
+        assert not (root / "s" / "a.pdf").exists()
+
+    assert len(outputs[True]) == 5
+    assert outputs[True] == outputs[False]
@@ -1,23 +1,28 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-import zipfile
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+    TK_AVAILABLE = True
+except ImportError:
+    TK_AVAILABLE = False
 import os
 import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-import base64
-import json
 import logging
-from datetime import datetime
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+import multiprocessing
 import sys
-try:
-    from PyPDF2 import PdfReader, PdfWriter
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+
+from receipt_splitter import PDF_AVAILABLE, JobConfig, ProgressChannel, SplitterEngine, iter_zip_files
+from receipt_splitter.logs import LogConfig, configure_logging
+from receipt_splitter.progress import format_duration
+from receipt_splitter.settings import SettingsStore
+
+# フォルダ検索結果を一覧に反映する間隔（件数・秒）
+SCAN_BATCH_SIZE = 200
+SCAN_BATCH_INTERVAL = 0.1
+# 解凍中に進捗表示を更新する間隔（ミリ秒）
+PROGRESS_INTERVAL_MS = 100
 
 class ZipExtractorGUI:
     def __init__(self, root):
@@ -26,11 +31,13 @@ class ZipExtractorGUI:
         self.root.geometry("600x500")
         self.root.resizable(True, True)
         
+        # .envファイルを読み込み（ログ設定も .env から読むため先に読み込む）
+        load_dotenv()
+        
         # ログの設定
         self.setup_logging()
-        
-        # .envファイルを読み込み
-        load_dotenv()
+        # 設定の保存先（変更はまとめて別スレッドで書き込む）
+        self.settings = SettingsStore(Path('.env'))
         
         # デフォルトフォルダの設定
         self.default_folder = self.get_default_folder()
@@ -42,9 +49,21 @@ class ZipExtractorGUI:
         self.extract_option = tk.IntVar(value=int(os.getenv('EXTRACT_OPTION', '1')))
         self.overwrite_var = tk.BooleanVar(value=os.getenv('OVERWRITE_FILES', 'True').lower() == 'true')
         self.split_pdf_var = tk.BooleanVar(value=os.getenv('SPLIT_PDF', 'True').lower() == 'true')
-        
-        # パフォーマンス設定
-        self.max_workers = min(4, os.cpu_count() or 4)  # 並列処理数制限
+        self.compact_images_var = tk.BooleanVar(value=os.getenv('COMPACT_IMAGES', 'False').lower() == 'true')
+        self.incremental_var = tk.BooleanVar(value=os.getenv('INCREMENTAL', 'False').lower() == 'true')
+        self.ocr_rename_var = tk.BooleanVar(value=os.getenv('OCR_RENAME', 'False').lower() == 'true')
+        
+        # フォルダ検索の状態（検索はバックグラウンドで行い、フォルダが変わったら中断する）
+        self.zip_files = []
+        self.zip_rows = {}  # ZIPファイル → 一覧の行番号
+        self.scan_cancel = None
+        self.scan_folder = None
+        # 事前検査の状態（検索が終わったらバックグラウンドで検査し、結果を一覧に表示する）
+        self.preflight_engine = None
+        self.preflight_results = {}
+        # 解凍中の進捗チャネルと処理エンジン（解凍していない間は None）
+        self.progress_channel = None
+        self.engine = None
         
         # GUI要素の作成
         self.create_widgets()
@@ -59,8 +78,9 @@ class ZipExtractorGUI:
         elif self.default_folder:
             self.folder_path.set(str(self.default_folder))
         
+        # ウィンドウを表示してから検索を開始（フォルダの大きさで起動が遅れないように）
         if self.folder_path.get():
-            self.scan_zip_files()
+            self.root.after_idle(self.scan_zip_files)
         
         # 設定変更時のコールバック設定
         self.setup_setting_callbacks()
@@ -68,26 +88,15 @@ class ZipExtractorGUI:
     def setup_logging(self):
         """ログ設定を初期化"""
         try:
-            # 実行中のPythonファイルと同じディレクトリにログファイルを作成
+            # 実行中のPythonファイルと同じディレクトリにログファイルを作成（LOG_FILE で変更可能）
             script_dir = Path(__file__).parent if '__file__' in globals() else Path.cwd()
-            log_file = script_dir / "transfer-receipt-splitter.log"
+            log_config = LogConfig.from_env(rollover=True)
+            if log_config.log_file is None:
+                log_config.log_file = script_dir / "transfer-receipt-splitter.log"
+            log_file = log_config.log_file
             
-            # 前回のログファイルを削除
-            if log_file.exists():
-                try:
-                    log_file.unlink()
-                except Exception as e:
-                    print(f"ログファイル削除エラー: {e}")
-            
-            # ログ設定
-            logging.basicConfig(
-                level=logging.INFO,
-                format='%(asctime)s - %(levelname)s - %(message)s',
-                handlers=[
-                    logging.FileHandler(log_file, encoding='utf-8', mode='w'),
-                    logging.StreamHandler()  # コンソールにも出力
-                ]
-            )
+            # 前回までのログはローテーションして残し、書き込みは別スレッドで行う
+            configure_logging(log_config)
             
             self.logger = logging.getLogger(__name__)
             self.logger.info("=" * 50)
@@ -140,15 +149,15 @@ class ZipExtractorGUI:
         self.logger.info(f"ウィンドウサイズ: {window_width}x{window_height}")
         self.logger.info(f"画面サイズ: {screen_width}x{screen_height}")
         self.logger.info(f"配置位置: {x}, {y}")
-        print(f"ウィンドウサイズ: {window_width}x{window_height}")
-        print(f"画面サイズ: {screen_width}x{screen_height}")
-        print(f"配置位置: {x}, {y}")
     
     def setup_setting_callbacks(self):
         """設定変更時のコールバックを設定"""
         self.extract_option.trace_add('write', self.save_settings)
         self.overwrite_var.trace_add('write', self.save_settings)
         self.split_pdf_var.trace_add('write', self.save_settings)
+        self.compact_images_var.trace_add('write', self.save_settings)
+        self.incremental_var.trace_add('write', self.save_settings)
+        self.ocr_rename_var.trace_add('write', self.save_settings)
         self.folder_path.trace_add('write', self.save_folder_setting)
     
     def get_default_folder(self):
@@ -218,10 +227,22 @@ class ZipExtractorGUI:
         if PDF_AVAILABLE:
             ttk.Checkbutton(pdf_frame, text="PDFファイルを1ページずつ分割する", 
                            variable=self.split_pdf_var).grid(row=0, column=0, sticky=tk.W)
+            # 縮小する解像度・JPEG品質は .env（IMAGE_DPI / JPEG_QUALITY）の設定を使用
+            ttk.Checkbutton(pdf_frame, text="分割したページの画像を圧縮する", 
+                           variable=self.compact_images_var).grid(row=1, column=0, sticky=tk.W, padx=(20, 0))
         else:
             ttk.Label(pdf_frame, text="⚠️ PDF分割機能を使用するには 'pip install PyPDF2' が必要です", 
                      foreground="orange").grid(row=0, column=0, sticky=tk.W)
         
+        # 増分処理オプション
+        ttk.Checkbutton(options_frame, text="前回から変更のないZIPファイルはスキップする", 
+                       variable=self.incremental_var).grid(row=4, column=0, sticky=tk.W, pady=(5, 0))
+        
+        # OCR&AI自動リネームオプション（バックエンドの設定は .env）
+        if PDF_AVAILABLE:
+            ttk.Checkbutton(options_frame, text="分割したページをOCR&AIで自動リネームする", 
+                           variable=self.ocr_rename_var).grid(row=5, column=0, sticky=tk.W, pady=(5, 0))
+        
         # ZIPファイル一覧
         list_frame = ttk.LabelFrame(main_frame, text="見つかったZIPファイル", padding="10")
         list_frame.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
@@ -264,8 +285,12 @@ class ZipExtractorGUI:
                                         width=15, state="disabled")
         self.extract_button.grid(row=0, column=1, padx=(0, 10))
         
+        self.cancel_button = ttk.Button(button_frame, text="中止", command=self.cancel_extraction, 
+                                       width=10, state="disabled")
+        self.cancel_button.grid(row=0, column=2, padx=(0, 10))
+        
         ttk.Button(button_frame, text="終了", command=self.root.quit, 
-                  width=10).grid(row=0, column=2)
+                  width=10).grid(row=0, column=3)
         
         # グリッドの重み設定
         self.root.columnconfigure(0, weight=1)
@@ -285,60 +310,225 @@ class ZipExtractorGUI:
         )
         if folder:
             self.folder_path.set(folder)
-            self.zip_listbox.delete(0, tk.END)
-            self.progress_var.set("フォルダが選択されました。ZIPファイルを検索中...")
-            self.extract_button.config(state="disabled")
             # 自動的にZIPファイル検索を実行
             self.scan_zip_files()
     
     def scan_zip_files(self):
-        """選択されたフォルダ内のZIPファイルをスキャン"""
+        """選択されたフォルダ内のZIPファイルをバックグラウンドでスキャン"""
         if not self.folder_path.get():
             messagebox.showwarning("警告", "フォルダを選択してください。")
             return
         
-        folder = Path(self.folder_path.get())
-        if not folder.exists():
-            messagebox.showerror("エラー", "選択されたフォルダが存在しません。")
+        # 前回の検索・事前検査を中断
+        if self.scan_cancel is not None:
+            self.scan_cancel.set()
+        self.stop_preflight()
+        cancel = self.scan_cancel = threading.Event()
+        
+        self.zip_files = []
+        self.zip_rows = {}
+        self.preflight_results = {}
+        self.zip_listbox.delete(0, tk.END)
+        self.progress_var.set("ZIPファイルを検索中...")
+        self.extract_button.config(state="disabled")
+        
+        folder = self.scan_folder = Path(self.folder_path.get())
+        # サブフォルダの探索（RECURSIVE / MAX_DEPTH）は .env の設定を使用
+        config = JobConfig.from_env()
+        threading.Thread(target=self.scan_worker, args=(folder, config, cancel), daemon=True).start()
+    
+    def scan_worker(self, folder, config, cancel):
+        """ZIPファイルを検索し、見つかった分から順に一覧へ反映（別スレッドで実行）"""
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            if not folder.is_dir():
+                self.safe_update_ui(lambda: self.on_scan_error(cancel, "選択されたフォルダが存在しません。"))
+                return
+            
+            for zip_file in iter_zip_files(folder, config.recursive, config.max_depth):
+                if cancel.is_set():
+                    return
+                batch.append(zip_file)
+                if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_flush >= SCAN_BATCH_INTERVAL:
+                    found, batch = batch, []
+                    self.safe_update_ui(lambda found=found: self.on_scan_batch(cancel, found))
+                    last_flush = time.monotonic()
+        except OSError as e:
+            self.logger.error(f"フォルダ検索エラー: {folder}: {e}")
+            message = f"フォルダを検索できませんでした: {e}"
+            self.safe_update_ui(lambda message=message: self.on_scan_error(cancel, message))
             return
         
-        # ZIPファイルを検索
-        zip_files = list(folder.glob("*.zip"))
+        self.safe_update_ui(lambda: self.on_scan_batch(cancel, batch, finished=True))
+    
+    def display_name(self, zip_file):
+        """一覧に表示する名前（サブフォルダのZIPは選択したフォルダからの相対パス）"""
+        try:
+            return zip_file.relative_to(self.scan_folder).as_posix()
+        except ValueError:
+            return zip_file.name
+    
+    def on_scan_batch(self, cancel, found, finished=False):
+        """検索結果を一覧に追加（メインスレッドで実行）"""
+        if cancel is not self.scan_cancel or cancel.is_set():
+            # 中断された検索の結果は破棄
+            return
         
-        # リストボックスを更新
-        self.zip_listbox.delete(0, tk.END)
+        if found:
+            self.zip_rows.update((zip_file, len(self.zip_files) + i) for i, zip_file in enumerate(found))
+            self.zip_files.extend(found)
+            self.zip_listbox.insert(tk.END, *(self.display_name(zip_file) for zip_file in found))
         
-        if not zip_files:
+        if not finished:
+            self.progress_var.set(f"ZIPファイルを検索中... ({len(self.zip_files)}個)")
+            return
+        
+        self.scan_cancel = None
+        if not self.zip_files:
             self.progress_var.set("ZIPファイルが見つかりませんでした。")
             self.extract_button.config(state="disabled")
             return
         
-        for zip_file in zip_files:
-            self.zip_listbox.insert(tk.END, zip_file.name)
-        
-        self.progress_var.set(f"{len(zip_files)}個のZIPファイルが見つかりました。解凍準備完了。")
+        self.progress_var.set(f"{len(self.zip_files)}個のZIPファイルが見つかりました。解凍準備完了。")
         self.extract_button.config(state="normal")
+        self.start_preflight()
+    
+    def start_preflight(self):
+        """見つかったZIPを解凍せずに検査（別スレッドで実行し、終わったZIPから一覧に結果を表示）"""
+        try:
+            engine = SplitterEngine(self.build_job_config())
+        except ValueError:
+            # 設定の誤りは解凍開始時に表示する
+            return
+        self.preflight_engine = engine
+        self.progress_var.set(f"{len(self.zip_files)}個のZIPファイルが見つかりました。事前検査中...")
+        threading.Thread(target=self.preflight_worker, args=(engine, list(self.zip_files)), daemon=True).start()
+    
+    def preflight_worker(self, engine, zip_files):
+        """事前検査を実行（別スレッドで実行）"""
+        try:
+            engine.preflight(zip_files, callback=lambda check: self.safe_update_ui(
+                lambda: self.on_preflight_result(engine, check)))
+        except Exception as e:
+            self.logger.error(f"事前検査エラー: {e}")
+        self.safe_update_ui(lambda: self.on_preflight_finished(engine))
+    
+    def on_preflight_result(self, engine, check):
+        """事前検査の結果を一覧の行に反映（メインスレッドで実行）"""
+        if engine is not self.preflight_engine or check.zip_file not in self.zip_rows:
+            return
+        self.preflight_results[check.zip_file] = check
+        row = self.zip_rows[check.zip_file]
+        self.zip_listbox.delete(row)
+        self.zip_listbox.insert(row, f"{self.display_name(check.zip_file)}  [{check.describe()}]")
+        if not check.ok:
+            self.zip_listbox.itemconfig(row, foreground="red")
+        self.progress_var.set(f"事前検査中... ({len(self.preflight_results)}/{len(self.zip_files)})")
+    
+    def on_preflight_finished(self, engine):
+        """事前検査の完了を表示（メインスレッドで実行）"""
+        if engine is not self.preflight_engine:
+            return
+        self.preflight_engine = None
+        errors = sum(1 for check in self.preflight_results.values() if not check.ok)
+        error_text = f"（検査エラー: {errors}個は解凍しません）" if errors else ""
+        self.progress_var.set(f"{len(self.zip_files)}個のZIPファイルが見つかりました{error_text}。解凍準備完了。")
+    
+    def stop_preflight(self):
+        """実行中の事前検査を中止（結果は以降の表示に使わない）"""
+        if self.preflight_engine is not None:
+            self.preflight_engine.cancel()
+            self.preflight_engine = None
+    
+    def on_scan_error(self, cancel, message):
+        """検索エラーを表示（メインスレッドで実行）"""
+        if cancel is not self.scan_cancel or cancel.is_set():
+            return
+        self.scan_cancel = None
+        self.progress_var.set("ZIPファイルを検索できませんでした。")
+        messagebox.showerror("エラー", message)
     
     def start_extraction(self):
         """解凍処理を開始（別スレッドで実行）"""
-        if self.zip_listbox.size() == 0:
+        if not self.zip_files:
             messagebox.showwarning("警告", "解凍するZIPファイルがありません。")
             return
         
-        # ボタンを無効化
+        # 画面の設定はメインスレッドで読み取ってから処理スレッドに渡す
+        # 進捗は処理スレッドからチャネルに積み、画面側で一定間隔ごとにまとめて反映する
+        channel = ProgressChannel()
+        try:
+            self.engine = SplitterEngine(self.build_job_config(), progress=channel)
+        except ValueError as e:
+            messagebox.showerror("エラー", f"設定が正しくありません: {e}")
+            return
+        # 一覧の事前検査の結果を引き継ぎ、未検査のZIPだけを解凍前に検査する（エラーのあるZIPは解凍しない）
+        self.stop_preflight()
+        self.engine.preflight_results.update(self.preflight_results)
+        self.progress_channel = channel
+        self.root.after(PROGRESS_INTERVAL_MS, self.refresh_progress, channel)
+        
+        # ボタンを無効化（中止ボタンは解凍中のみ有効）
         self.extract_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
         
-        # 別スレッドで解凍処理を実行
-        threading.Thread(target=self.extract_files, daemon=True).start()
+        # 別スレッドで解凍処理を実行（検索済みの一覧を使い、フォルダを再検索しない）
+        threading.Thread(target=self.extract_files, args=(self.engine, list(self.zip_files)),
+                         daemon=True).start()
     
-    def extract_files(self):
-        """ZIPファイルを解凍（並列処理対応）"""
+    def cancel_extraction(self):
+        """解凍処理の中止を要求（処理中のページの書き込みが終わり次第止まる）"""
+        if self.engine is None:
+            return
+        self.engine.cancel()
+        self.cancel_button.config(state="disabled")
+        self.progress_var.set("中止しています...")
+    
+    def build_job_config(self):
+        """画面の設定からジョブ設定を生成"""
+        # 並列処理数・並列実行モードは .env（MAX_WORKERS / PARALLELISM）の設定を使用
+        return JobConfig.from_env(
+            extract_option=self.extract_option.get(),
+            overwrite=self.overwrite_var.get(),
+            split_pdf=self.split_pdf_var.get(),
+            compact_images=self.compact_images_var.get(),
+            incremental=self.incremental_var.get(),
+            ocr_rename=self.ocr_rename_var.get(),
+            preflight=True,
+        )
+    
+    def refresh_progress(self, channel):
+        """進捗チャネルに溜まった通知をまとめて画面に反映（解凍中は一定間隔で繰り返す）"""
+        if channel is not self.progress_channel:
+            return
+        snapshot = channel.snapshot()
+        if snapshot.changed or snapshot.pages:
+            parts = ["中止しています..." if self.engine is not None and self.engine.cancelled
+                     else snapshot.message or "処理中..."]
+            if snapshot.pages:
+                parts.append(f"{snapshot.pages}ページ {snapshot.pages_per_sec:.1f}ページ/秒")
+            if snapshot.eta is not None:
+                parts.append(f"残り約 {format_duration(snapshot.eta)}")
+            self.progress_var.set(" | ".join(parts))
+            # 増分処理ではスキップ分を除いた件数が total になる
+            if snapshot.total:
+                self.progress_bar.config(maximum=snapshot.total, value=snapshot.done)
+        self.root.after(PROGRESS_INTERVAL_MS, self.refresh_progress, channel)
+    
+    def stop_progress_refresh(self):
+        """進捗表示の定期更新を停止し、中止ボタンを無効化"""
+        self.progress_channel = None
+        self.engine = None
+        self.cancel_button.config(state="disabled")
+    
+    def extract_files(self, engine, zip_files):
+        """ZIPファイルを解凍（処理は SplitterEngine に委譲）"""
         try:
-            folder = Path(self.folder_path.get())
-            zip_files = list(folder.glob("*.zip"))
             total_files = len(zip_files)
             
             if total_files == 0:
+                self.safe_update_ui(self.stop_progress_refresh)
                 self.safe_update_ui(lambda: self.progress_var.set("ZIPファイルが見つかりませんでした。"))
                 self.safe_update_ui(lambda: self.extract_button.config(state="normal"))
                 return
@@ -346,84 +536,44 @@ class ZipExtractorGUI:
             # プログレスバーの設定
             self.safe_update_ui(lambda: self.progress_bar.config(maximum=total_files, value=0))
             
-            success_count = 0
-            error_files = []
-            
-            start_time = time.time()
-            
-            for i, zip_file in enumerate(zip_files):
-                try:
-                    # 進捗表示の更新
-                    self.safe_update_ui(lambda f=zip_file, idx=i, total=total_files: 
-                                      self.progress_var.set(f"解凍中: {f.name} ({idx+1}/{total})"))
-                    
-                    self.logger.info(f"ZIP解凍開始: {zip_file.name} ({i+1}/{total_files})")
-                    
-                    # 解凍先の決定
-                    if self.extract_option.get() == 1:
-                        # 各ZIPファイルごとに個別フォルダを作成
-                        extract_path = folder / zip_file.stem
-                        
-                        # 同名フォルダが存在する場合は削除
-                        if extract_path.exists():
-                            shutil.rmtree(extract_path)
-                        
-                        extract_path.mkdir(exist_ok=True)
-                    else:
-                        # 選択フォルダ内に直接解凍
-                        extract_path = folder
-                    
-                    # 前回の作業ファイルを削除（PDF分割機能が有効な場合）
-                    if self.split_pdf_var.get() and PDF_AVAILABLE:
-                        self.cleanup_previous_files(extract_path)
-                    
-                    # ZIPファイルを解凍
-                    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                        if self.overwrite_var.get():
-                            # 上書きする場合
-                            zip_ref.extractall(extract_path)
-                        else:
-                            # 上書きしない場合は既存ファイルをチェック
-                            for member in zip_ref.namelist():
-                                target_path = extract_path / member
-                                if not target_path.exists():
-                                    zip_ref.extract(member, extract_path)
-                    
-                    # PDF分割処理
-                    if self.split_pdf_var.get() and PDF_AVAILABLE:
-                        self.safe_update_ui(lambda f=zip_file, idx=i, total=total_files: 
-                                          self.progress_var.set(f"PDF分割中: {f.name} ({idx+1}/{total})"))
-                        self.split_pdfs_in_folder_optimized(extract_path)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_msg = f"{zip_file.name}: {str(e)}"
-                    error_files.append(error_msg)
-                    self.logger.error(f"ZIP処理エラー: {error_msg}")
-                    print(f"エラー詳細: {e}")  # コンソールにも出力
-                
-                # プログレスバーの更新
-                self.safe_update_ui(lambda idx=i: self.progress_bar.config(value=idx+1))
-            
-            # 処理時間ログ
-            elapsed_time = time.time() - start_time
-            self.logger.info(f"全ZIP処理完了: {elapsed_time:.1f}秒")
+            result = engine.run(zip_files)
+            elapsed_time = result.elapsed
+            self.safe_update_ui(self.stop_progress_refresh)
             
             # 完了メッセージ
-            if error_files:
-                error_msg = "\n".join(error_files)
+            if result.cancelled:
+                finished = sum(1 for zip_result in result.zip_results if zip_result.success)
+                resume_text = (f"\n続きは python -m receipt_splitter resume {result.job_id} で再開できます。"
+                               if result.job_id is not None else "")
+                self.safe_update_ui(lambda: messagebox.showinfo("中止", 
+                                  f"処理を中止しました（完了: {finished}/{total_files}個）。{resume_text}"))
+                self.safe_update_ui(lambda: self.progress_var.set("中止しました"))
+                self.safe_update_ui(lambda: self.extract_button.config(state="normal"))
+                self.safe_update_ui(lambda: self.progress_bar.config(value=0))
+                return
+            if result.errors:
+                error_msg = "\n".join(result.errors)
+                resume_text = (f"\n\nジョブID {result.job_id}: python -m receipt_splitter resume {result.job_id} で"
+                               f"エラーになったZIP・PDFのみ再実行できます。" if result.job_id is not None else "")
                 self.safe_update_ui(lambda: messagebox.showwarning("警告", 
-                                     f"解凍完了: {success_count}/{total_files}\n\n"
-                                     f"エラーが発生したファイル:\n{error_msg}"))
+                                     f"解凍完了: {result.success_count}/{total_files}\n\n"
+                                     f"エラーが発生したファイル:\n{error_msg}{resume_text}"))
             else:
                 features = []
-                if self.split_pdf_var.get() and PDF_AVAILABLE:
+                if engine.split_enabled:
                     features.append("PDF分割")
+                if engine.rename_enabled:
+                    features.append("自動リネーム")
                 
                 feature_text = "と" + "・".join(features) if features else ""
+                skipped_text = (f"（変更なしでスキップ: {result.skipped_count}個）\n"
+                                if result.skipped_count else "")
+                duplicate_text = (f"重複ページ: {result.duplicate_count}件\n"
+                                  if result.duplicate_count else "")
                 self.safe_update_ui(lambda: messagebox.showinfo("完了", 
                                   f"すべてのZIPファイル({total_files}個)の解凍{feature_text}が完了しました。\n"
+                                  f"{skipped_text}"
+                                  f"{duplicate_text}"
                                   f"処理時間: {elapsed_time:.1f}秒"))
             
             # UI状態をリセット
@@ -434,7 +584,7 @@ class ZipExtractorGUI:
         except Exception as e:
             error_msg = f"解凍処理で予期しないエラーが発生しました: {str(e)}"
             self.logger.error(error_msg)
-            print(f"致命的エラー: {e}")  # コンソールにも出力
+            self.safe_update_ui(self.stop_progress_refresh)
             self.safe_update_ui(lambda: messagebox.showerror("エラー", error_msg))
             self.safe_update_ui(lambda: self.extract_button.config(state="normal"))
             self.safe_update_ui(lambda: self.progress_var.set("エラーが発生しました"))
@@ -447,161 +597,50 @@ class ZipExtractorGUI:
             else:
                 self.root.after(0, update_func)
         except Exception as e:
-            print(f"UI更新エラー: {e}")
             self.logger.error(f"UI更新エラー: {e}")
     
-    def split_pdfs_in_folder_optimized(self, folder_path):
-        """最適化されたPDF分割処理"""
-        try:
-            pdf_files = list(folder_path.glob("*.pdf"))
-            split_files = []
-            
-            if not pdf_files:
-                self.logger.info("PDF分割: PDFファイルが見つかりませんでした")
-                return split_files
-            
-            self.logger.info(f"PDF分割開始: {len(pdf_files)}個のPDFファイル")
-            
-            # 並列処理でPDF分割を高速化
-            with ThreadPoolExecutor(max_workers=min(2, self.max_workers)) as executor:
-                future_to_pdf = {}
-                
-                for pdf_file in pdf_files:
-                    # 既に分割されたファイルはスキップ
-                    if "_page_" not in pdf_file.stem:
-                        future = executor.submit(self.split_single_pdf_optimized, pdf_file)
-                        future_to_pdf[future] = pdf_file
-                
-                for future in as_completed(future_to_pdf):
-                    try:
-                        result = future.result()
-                        if result:
-                            split_files.extend(result)
-                    except Exception as e:
-                        pdf_file = future_to_pdf[future]
-                        error_msg = f"PDF分割エラー ({pdf_file.name}): {e}"
-                        self.logger.error(error_msg)
-                        print(f"PDF分割エラー: {error_msg}")  # コンソールにも出力
-            
-            self.logger.info(f"PDF分割完了: {len(split_files)}個のファイルに分割")
-            return split_files
-            
-        except Exception as e:
-            error_msg = f"PDF分割処理で予期しないエラー: {e}"
-            self.logger.error(error_msg)
-            print(f"PDF分割エラー: {error_msg}")  # コンソールにも出力
-            return []
-    
-    def split_single_pdf_optimized(self, pdf_file):
-        """最適化された単一PDF分割"""
-        split_files = []
-        
-        try:
-            # メモリ効率を改善
-            with open(pdf_file, 'rb') as file:
-                reader = PdfReader(file)
-                total_pages = len(reader.pages)
-                
-                # バッチ処理で高速化
-                for page_num in range(total_pages):
-                    writer = PdfWriter()
-                    writer.add_page(reader.pages[page_num])
-                    
-                    # 出力ファイル名を生成
-                    page_filename = f"{pdf_file.stem}_page_{page_num + 1:03d}.pdf"
-                    output_path = pdf_file.parent / page_filename
-                    
-                    # メモリ効率的な書き込み
-                    with open(output_path, 'wb') as output_file:
-                        writer.write(output_file)
-                    
-                    split_files.append(output_path)
-            
-            # 元のPDFファイルを削除
-            pdf_file.unlink()
-            
-            return split_files
-            
-        except Exception as e:
-            raise Exception(f"PDF分割処理失敗: {str(e)}")
-    
-    def cleanup_previous_files(self, folder_path):
-        """高速化された前回ファイル削除"""
-        try:
-            # glob使用で高速化
-            pattern = "*_page_*.pdf"
-            deleted_files = list(folder_path.glob(pattern))
-            
-            for pdf_file in deleted_files:
-                pdf_file.unlink()
-            
-            if deleted_files:
-                self.logger.info(f"前回ファイル削除: {len(deleted_files)}個")
-            
-        except Exception as e:
-            self.logger.error(f"前回ファイル削除エラー: {e}")
-    
     def save_settings(self, *args):
-        """設定を.envファイルに保存"""
+        """設定の保存を予約（ファイルへの書き込みは SettingsStore がまとめて行う）"""
         try:
-            self.update_env_file({
-                'EXTRACT_OPTION': str(self.extract_option.get()),
-                'OVERWRITE_FILES': str(self.overwrite_var.get()),
-                'SPLIT_PDF': str(self.split_pdf_var.get())
+            self.settings.update({
+                'EXTRACT_OPTION': self.extract_option.get(),
+                'OVERWRITE_FILES': self.overwrite_var.get(),
+                'SPLIT_PDF': self.split_pdf_var.get(),
+                'COMPACT_IMAGES': self.compact_images_var.get(),
+                'INCREMENTAL': self.incremental_var.get(),
+                'OCR_RENAME': self.ocr_rename_var.get()
             })
         except Exception as e:
-            print(f"設定保存エラー: {e}")
+            self.logger.error(f"設定保存エラー: {e}")
     
     def save_folder_setting(self, *args):
-        """フォルダ設定を.envファイルに保存"""
+        """フォルダ設定の保存を予約"""
         try:
             if self.folder_path.get():
-                self.update_env_file({'LAST_FOLDER': self.folder_path.get()})
+                self.settings.set('LAST_FOLDER', self.folder_path.get())
         except Exception as e:
-            print(f"フォルダ設定保存エラー: {e}")
-    
-    def update_env_file(self, new_settings):
-        """環境変数ファイルを更新"""
-        env_file = Path('.env')
-        
-        # 既存の設定を読み込み
-        existing_settings = {}
-        if env_file.exists():
-            with open(env_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        existing_settings[key] = value
-        
-        # 新しい設定をマージ
-        existing_settings.update(new_settings)
-        
-        # .envファイルに書き込み
-        with open(env_file, 'w', encoding='utf-8') as f:
-            f.write("# Transfer Receipt Splitter 設定ファイル\n")
-            f.write("# 自動生成されたファイルです\n\n")
-            
-            # デフォルトフォルダ設定
-            if 'DEFAULT_FOLDER' in existing_settings:
-                f.write(f"DEFAULT_FOLDER={existing_settings['DEFAULT_FOLDER']}\n")
-            
-            # 最後に使用したフォルダ
-            if 'LAST_FOLDER' in existing_settings:
-                f.write(f"LAST_FOLDER={existing_settings['LAST_FOLDER']}\n")
-            
-            f.write("\n# UI設定\n")
-            
-            # UI設定
-            ui_settings = ['EXTRACT_OPTION', 'OVERWRITE_FILES', 'SPLIT_PDF']
-            for key in ui_settings:
-                if key in existing_settings:
-                    f.write(f"{key}={existing_settings[key]}\n")
+            self.logger.error(f"フォルダ設定保存エラー: {e}")
 
 def main():
+    # プロセスプール使用時の実行ファイル化（PyInstaller等）対応
+    multiprocessing.freeze_support()
+    
+    # 引数付きで起動された場合はコマンドラインモード（GUI不要）
+    if len(sys.argv) > 1:
+        from receipt_splitter.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    
+    if not TK_AVAILABLE:
+        print("GUIを使用するには tkinter が必要です。コマンドラインモードは --help を参照してください。")
+        sys.exit(1)
+    
     root = tk.Tk()
     app = ZipExtractorGUI(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        # 書き込み待ちの設定を保存してから終了
+        app.settings.close()
 
 if __name__ == "__main__":
     main()